@@ -1,13 +1,16 @@
+import asyncio
+import copy
 import os
 import sys
 import streamlit as st
+import time
 import traceback
 import json
 import tempfile
 import re
-import time
+from concurrent.futures import Future
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from pathlib import Path
 
 # إصلاحات النظام
@@ -64,13 +67,32 @@ except Exception as e:
     PROMPT_ENGINE_AVAILABLE = False
 
 try:
-    from tutor_ai.knowledge_base_manager import KnowledgeBaseManager, check_rag_requirements
+    from tutor_ai.knowledge_base_manager import KnowledgeBaseManager, check_rag_requirements, CHROMA_DB_PARENT_DIRECTORY
+    from tutor_ai.manager_pool import KnowledgeBaseManagerPool
     KB_MANAGER_AVAILABLE = True
 except Exception as e:
     KB_MANAGER_AVAILABLE = False
     def check_rag_requirements():
         return {"Status": False}
 
+from tutor_ai.async_runtime import run_coroutine, submit_blocking
+from tutor_ai.chroma_store import stored_collection_exists, vector_store_path_for
+from tutor_ai.single_flight import get_single_flight
+from tutor_ai.kb_status import check_collection_status, collection_name_for
+from tutor_ai.grade_subjects import GRADE_SUBJECTS, SUBJECT_FOLDERS
+from tutor_ai.question_classifier import (
+    classify_question_patterns, matches_category,
+    REFERENCE_PATTERNS, CLARIFICATION_PATTERNS, CORRECTION_PATTERNS
+)
+
+try:
+    from tutor_ai.response_cache import SemanticResponseCache, normalize_question
+    RESPONSE_CACHE_AVAILABLE = True
+except Exception as e:
+    RESPONSE_CACHE_AVAILABLE = False
+    def normalize_question(question: str) -> str:
+        return " ".join(question.split()).lower()
+
 try:
     from tutor_ai.code_executor import save_svg_content_to_file
     CODE_EXECUTOR_AVAILABLE = True
@@ -84,9 +106,16 @@ except Exception as e:
         except:
             return False
 
+try:
+    from tutor_ai.warmup import get_traffic_stats, start_warmup
+    WARMUP_AVAILABLE = True
+except Exception as e:
+    WARMUP_AVAILABLE = False
+
 # تحميل فهرس المواد التفاعلي
 try:
-    from tutor_ai.curriculum_index import CurriculumIndex
+    from tutor_ai.curriculum_index import CurriculumIndex, get_curriculum_index
+    from tutor_ai.curriculum_chunker import lesson_metadata_filter
     CURRICULUM_INDEX_AVAILABLE = True
     print("✅ تم تحميل فهرس المنهج بنجاح")
 except Exception as e:
@@ -104,77 +133,13 @@ st.set_page_config(
 # متغيرات التطبيق العامة
 APP_TITLE = "🤖 المعلم الذكي"
 
-# إعدادات الصفوف والمواد
-GRADE_SUBJECTS = {
-    'grade_1': {
-        'name': 'الصف الأول الابتدائي',
-        'subjects': {
-            'arabic': 'لغتي الجميلة',
-            'math': 'الرياضيات',
-            'science': 'العلوم',
-            'islamic': 'التربية الإسلامية',
-            'english': 'اللغة الإنجليزية'
-        }
-    },
-    'grade_2': {
-        'name': 'الصف الثاني الابتدائي',
-        'subjects': {
-            'arabic': 'لغتي الجميلة',
-            'math': 'الرياضيات',
-            'science': 'العلوم',
-            'islamic': 'التربية الإسلامية',
-            'english': 'اللغة الإنجليزية'
-        }
-    },
-    'grade_3': {
-        'name': 'الصف الثالث الابتدائي',
-        'subjects': {
-            'arabic': 'لغتي الجميلة',
-            'math': 'الرياضيات',
-            'science': 'العلوم',
-            'islamic': 'التربية الإسلامية',
-            'english': 'اللغة الإنجليزية'
-        }
-    },
-    'grade_4': {
-        'name': 'الصف الرابع الابتدائي',
-        'subjects': {
-            'arabic': 'لغتي الجميلة',
-            'math': 'الرياضيات',
-            'science': 'العلوم',
-            'islamic': 'التربية الإسلامية',
-            'english': 'اللغة الإنجليزية'
-        }
-    },
-    'grade_5': {
-        'name': 'الصف الخامس الابتدائي',
-        'subjects': {
-            'arabic': 'لغتي الجميلة',
-            'math': 'الرياضيات',
-            'science': 'العلوم',
-            'islamic': 'التربية الإسلامية',
-            'english': 'اللغة الإنجليزية'
-        }
-    },
-    'grade_6': {
-        'name': 'الصف السادس الابتدائي',
-        'subjects': {
-            'arabic': 'لغتي الجميلة',
-            'math': 'الرياضيات',
-            'science': 'العلوم',
-            'islamic': 'التربية الإسلامية',
-            'english': 'اللغة الإنجليزية'
-        }
-    }
-}
+# مهلة كل مرحلة (ثوانٍ): تجاوزها يكمل بدون نتيجتها بدلاً من تعليق الإجابة (التوليد: أقصى انتظار لإجابة مشتركة)
+PIPELINE_EMBEDDING_TIMEOUT = float(os.getenv("PIPELINE_EMBEDDING_TIMEOUT", "5"))
+PIPELINE_RETRIEVAL_TIMEOUT = float(os.getenv("PIPELINE_RETRIEVAL_TIMEOUT", "8"))
+PIPELINE_GENERATION_TIMEOUT = float(os.getenv("PIPELINE_GENERATION_TIMEOUT", "90"))
 
-SUBJECT_FOLDERS = {
-    'arabic': 'lughati',
-    'math': 'Math',
-    'science': 'Science',
-    'islamic': 'الدراسات الاسلامية',
-    'english': 'English'
-}
+# الأسئلة المتطابقة الجارية في الوقت نفسه (فصل كامل يرسل السؤال نفسه) تشترك في توليد واحد
+answer_flights = get_single_flight("answers")
 
 # === دوال تحليل السياق والذاكرة ===
 
@@ -182,43 +147,22 @@ class ChatHistoryAnalyzer:
     """محلل تاريخ المحادثة لفهم السياق والمراجع"""
     
     def __init__(self):
-        # الضمائر والمراجع العربية
-        self.reference_patterns = [
-            r'\bه\b', r'\bها\b', r'\bهذا\b', r'\bهذه\b', r'\bذلك\b', r'\bتلك\b',
-            r'\bالموضوع\b', r'\bالدرس\b', r'\bالشرح\b', r'\bالمثال\b',
-            r'\bنفس الشيء\b', r'\bنفس الموضوع\b', r'\bما قلته\b', r'\bما شرحته\b',
-            r'\bالسؤال السابق\b', r'\bما سألت عنه\b', r'\bاللي قلته\b'
-        ]
-        
-        # كلمات طلب التوضيح أو التفصيل
-        self.clarification_patterns = [
-            r'اشرح.*بالرسم', r'ارسم.*لي', r'وضح.*بالرسم', r'بالصور', r'بالرسم',
-            r'مع رسم', r'رسم توضيحي', r'صورة', r'مثال بالرسم',
-            r'وضح أكثر', r'فصل أكثر', r'بالتفصيل', r'أريد تفاصيل',
-            r'explain.*with.*drawing', r'draw.*for.*me', r'show.*picture'
-        ]
-        
-        # كلمات الرفض أو التصحيح
-        self.correction_patterns = [
-            r'\bلا\b', r'\bليس\b', r'\bغير صحيح\b', r'\bخطأ\b',
-            r'لا أريد', r'لا أفهم', r'غير واضح', r'صعب',
-            r'\bno\b', r'\bnot\b', r'\bwrong\b'
-        ]
+        # الأنماط مُعرّفة ومُجمّعة مرة واحدة في tutor_ai.question_classifier
+        self.reference_patterns = REFERENCE_PATTERNS
+        self.clarification_patterns = CLARIFICATION_PATTERNS
+        self.correction_patterns = CORRECTION_PATTERNS
 
     def has_references(self, question: str) -> bool:
         """فحص ما إذا كان السؤال يحتوي على مراجع لمحادثات سابقة"""
-        question_lower = question.lower().strip()
-        return any(re.search(pattern, question_lower) for pattern in self.reference_patterns)
+        return matches_category(question, 'has_references')
     
     def is_clarification_request(self, question: str) -> bool:
         """فحص ما إذا كان السؤال طلب توضيح أو تفصيل"""
-        question_lower = question.lower().strip()
-        return any(re.search(pattern, question_lower) for pattern in self.clarification_patterns)
+        return matches_category(question, 'is_clarification')
     
     def is_correction_request(self, question: str) -> bool:
         """فحص ما إذا كان السؤال تصحيح أو رفض"""
-        question_lower = question.lower().strip()
-        return any(re.search(pattern, question_lower) for pattern in self.correction_patterns)
+        return matches_category(question, 'is_correction')
     
     def extract_last_topic(self, messages: List[Dict]) -> Optional[str]:
         """استخراج آخر موضوع تم مناقشته"""
@@ -290,85 +234,23 @@ class ChatHistoryAnalyzer:
 def classify_question_type_enhanced(question: str, chat_history: List[Dict] = None, 
                                    grade_key: str = None, subject_key: str = None) -> Dict[str, any]:
     """تصنيف نوع السؤال مع كشف طلبات الدروس المحددة ومراعاة تاريخ المحادثة واتخاذ قرار ذكي للرسم المحسن"""
-    question_lower = question.lower().strip()
-    analyzer = ChatHistoryAnalyzer()
+    # جميع أعلام الأنماط (التحيات، المنهج، الرسم، الرياضيات، المراجع...) بمصنف مُجمّع مسبقاً
+    flags = classify_question_patterns(question)
     
     # التحقق من وجود مراجع للمحادثات السابقة
-    has_references = analyzer.has_references(question)
-    is_clarification = analyzer.is_clarification_request(question)
-    is_correction = analyzer.is_correction_request(question)
-    
-    # أنماط التحيات والأسئلة الاجتماعية
-    greetings_patterns = [
-        r'السلام عليكم', r'السلام عليك', r'مرحبا', r'مرحباً', r'أهلا', r'أهلاً',
-        r'صباح الخير', r'مساء الخير', r'كيف حالك', r'كيف الحال',
-        r'hello', r'hi', r'good morning', r'good evening', r'how are you'
-    ]
-    
-    # أنماط الأسئلة التي تحتاج بحث في المنهج
-    curriculum_patterns = [
-        r'علمني', r'اشرح.*لي', r'ما هو', r'ما هي', r'كيف.*أ(جمع|طرح|ضرب|قسم)',
-        r'ما.*معنى', r'أريد.*أتعلم', r'حرف.*ال[أ-ي]', r'رقم.*\d+', r'عملية.*',
-        r'درس.*', r'وحدة.*', r'teach me', r'explain.*', r'what is', r'how to', r'show me'
-    ]
-    
-    # أنماط الأسئلة التي تحتاج رسم بشكل صريح
-    explicit_drawing_patterns = [
-        r'ارسم.*لي', r'رسم.*', r'أريد.*رسم', r'وضح.*بالرسم', r'بالرسم',
-        r'اشرح.*بالصور', r'مع.*رسم', r'draw.*', r'show.*drawing', r'with.*picture'
-    ]
-    
-    # أنماط الأسئلة الرياضية
-    math_patterns = [
-        r'\d+\s*[+\-×÷]\s*\d+', r'جمع.*\d+', r'طرح.*\d+', r'ضرب.*\d+',
-        r'قسمة.*\d+', r'معادلة', r'حساب', r'عملية.*حسابية'
-    ]
-    
-    # مواضيع تحتاج رسم بشكل طبيعي (قرار ذكي محسن)
-    high_priority_visual_topics = [
-        # رياضيات - أولوية عالية
-        r'جمع', r'طرح', r'ضرب', r'قسمة', r'عملية.*حسابية',
-        r'مربع', r'مثلث', r'دائرة', r'مستطيل', r'شكل', r'أشكال', r'هندسة',
-        r'كسر', r'كسور', r'نصف', r'ربع', r'ثلث',
-        r'أرقام', r'أعداد', r'عد', r'ترقيم',
-        # علوم - أولوية عالية  
-        r'نبات', r'نباتات', r'شجرة', r'زهرة', r'ورقة', r'جذر', r'ساق',
-        r'حيوان', r'حيوانات', r'قطة', r'كلب', r'فيل', r'أسد', r'طائر', r'سمك',
-        r'جسم.*الإنسان', r'عين', r'أذن', r'يد', r'قدم', r'رأس',
-        r'دورة.*حياة', r'نمو', r'تكاثر',
-        # لغة عربية - حروف فقط
-        r'حرف', r'حروف', r'أبجدية',
-        r'خط', r'كتابة.*حرف'
-    ]
-    
-    medium_priority_visual_topics = [
-        # علوم أخرى
-        r'طقس', r'مطر', r'شمس', r'سحاب', r'ثلج', r'رياح',
-        r'مجموعة.*شمسية', r'كواكب', r'قمر', r'نجوم',
-        r'ماء', r'هواء', r'تربة',
-        # ألوان وأشياء بصرية
-        r'لون', r'ألوان', r'أحمر', r'أزرق', r'أخضر', r'أصفر', r'أسود', r'أبيض',
-        r'كبير', r'صغير', r'طويل', r'قصير', r'سميك', r'رفيع'
-    ]
+    has_references = flags['has_references']
+    is_clarification = flags['is_clarification']
+    is_correction = flags['is_correction']
     
-    # مواضيع لا تحتاج رسم عادة (نصوص، قواعد، تعريفات مجردة)
-    text_only_topics = [
-        r'قاعدة', r'قانون', r'تعريف', r'معنى', r'مفهوم',
-        r'تاريخ', r'قصة', r'حكاية', r'سيرة',
-        r'دعاء', r'آية', r'حديث', r'ذكر',
-        r'إملاء', r'نحو', r'صرف', r'بلاغة',
-        r'كلمة', r'كلمات', r'جملة', r'جمل'  # إلا إذا كان حروف
-    ]
-    
-    is_greeting = any(re.search(pattern, question_lower) for pattern in greetings_patterns)
-    needs_curriculum_search = any(re.search(pattern, question_lower) for pattern in curriculum_patterns)
-    explicit_drawing_requested = any(re.search(pattern, question_lower) for pattern in explicit_drawing_patterns)
-    is_math_question = any(re.search(pattern, question_lower) for pattern in math_patterns)
+    is_greeting = flags['is_greeting']
+    needs_curriculum_search = flags['needs_curriculum_search']
+    explicit_drawing_requested = flags['explicit_drawing_requested']
+    is_math_question = flags['is_math_question']
     
     # فحص المواضيع البصرية بأولويات
-    is_high_priority_visual = any(re.search(pattern, question_lower) for pattern in high_priority_visual_topics)
-    is_medium_priority_visual = any(re.search(pattern, question_lower) for pattern in medium_priority_visual_topics)
-    is_text_only_topic = any(re.search(pattern, question_lower) for pattern in text_only_topics)
+    is_high_priority_visual = flags['is_high_priority_visual']
+    is_medium_priority_visual = flags['is_medium_priority_visual']
+    is_text_only_topic = flags['is_text_only_topic']
     
     # تحديد ما إذا كان السؤال تعليمي
     is_educational = needs_curriculum_search or is_math_question or len(question.split()) > 3
@@ -401,7 +283,7 @@ def classify_question_type_enhanced(question: str, chat_history: List[Dict] = No
         # طلب توضيح للموضوع السابق
         smart_drawing_decision = True
         drawing_confidence = 80
-    elif is_educational and any(word in question_lower for word in ['كيف', 'أين', 'متى', 'لماذا', 'how', 'where', 'when', 'why']):
+    elif is_educational and flags['has_explanatory_word']:
         # الأسئلة التفسيرية التعليمية
         smart_drawing_decision = True
         drawing_confidence = 60
@@ -417,7 +299,7 @@ def classify_question_type_enhanced(question: str, chat_history: List[Dict] = No
     lesson_request = None
     if CURRICULUM_INDEX_AVAILABLE and grade_key and subject_key:
         try:
-            curriculum_index = CurriculumIndex()
+            curriculum_index = get_curriculum_index()
             lesson_request = curriculum_index.detect_lesson_request(question, grade_key, subject_key)
         except Exception as e:
             print(f"خطأ في كشف الدرس: {e}")
@@ -515,26 +397,13 @@ def should_search_curriculum(question: str, question_type: Dict[str, any]) -> bo
 
 def create_enhanced_prompt(question: str, question_type: Dict[str, any], app_subject_key: str, 
                           grade_key: str, retrieved_context_str: Optional[str], prompt_engine, 
-                          chat_history: List[Dict] = None) -> str:
-    """إنشاء برومبت محسن للدروس المحددة مع مراعاة نوع السؤال وتاريخ المحادثة مع قرار ذكي للرسم"""
+                          chat_history: List[Dict] = None, include_svg: bool = True) -> str:
+    """إنشاء برومبت محسن للدروس المحددة مع مراعاة نوع السؤال وتاريخ المحادثة مع قرار ذكي للرسم
     
-    # بناء سياق المحادثة إذا كان هناك مراجع
-    conversation_context = ""
-    if question_type['needs_context'] and chat_history:
-        analyzer = ChatHistoryAnalyzer()
-        context_summary = analyzer.build_context_summary(chat_history)
-        last_topic = analyzer.extract_last_topic(chat_history)
-        
-        if context_summary:
-            conversation_context = f"""
-**سياق المحادثة السابقة:**
-{context_summary}
-
-**آخر موضوع تم مناقشته:** {last_topic if last_topic else 'غير محدد'}
-
-**ملاحظة مهمة:** السؤال الحالي "{question}" يبدو أنه يشير إلى الموضوع السابق. 
-يرجى فهم السياق والإجابة بناءً على ما تم مناقشته مسبقاً.
-"""
+    include_svg=False: برومبت مسار الشرح فقط (الرسم يُطلب باستدعاء منفصل عبر create_svg_prompt)
+    """
+    
+    conversation_context = build_conversation_context(question, question_type, chat_history)
     
     # الحصول على البرومبت الأساسي
     base_prompt = prompt_engine.get_specialized_prompt(
@@ -542,7 +411,8 @@ def create_enhanced_prompt(question: str, question_type: Dict[str, any], app_sub
         app_subject_key=app_subject_key,
         grade_key=grade_key,
         retrieved_context_str=retrieved_context_str,
-        conversation_context=conversation_context
+        conversation_context=conversation_context,
+        include_svg=include_svg
     )
     
     # إضافة تعليمات خاصة بالدروس المحددة
@@ -569,8 +439,8 @@ def create_enhanced_prompt(question: str, question_type: Dict[str, any], app_sub
 """
         base_prompt += lesson_specific_instruction
     
-    # إضافة تعليمات خاصة بقرار الرسم الذكي المحسن
-    if question_type['needs_drawing']:
+    # إضافة تعليمات خاصة بقرار الرسم الذكي المحسن (فقط عند طلب الشرح والرسم في استدعاء واحد)
+    if include_svg and question_type['needs_drawing']:
         smart_drawing_instruction = f"""
 **تعليمة ذكية للرسم (ثقة {question_type['drawing_confidence']}%):**
 تم اتخاذ قرار ذكي بأن هذا السؤال يحتاج رسم توضيحي.
@@ -581,7 +451,7 @@ def create_enhanced_prompt(question: str, question_type: Dict[str, any], app_sub
 **تأكد من أن الرسم يساهم فعلاً في الفهم وليس مجرد زخرفة.**
 """
         base_prompt += "\n" + smart_drawing_instruction
-    else:
+    elif include_svg:
         no_drawing_instruction = f"""
 **تعليمة عدم الرسم (ثقة {question_type['drawing_confidence']}%):**
 تم اتخاذ قرار ذكي بأن هذا السؤال لا يحتاج رسم توضيحي.
@@ -610,6 +480,52 @@ def create_enhanced_prompt(question: str, question_type: Dict[str, any], app_sub
     
     return base_prompt
 
+def build_conversation_context(question: str, question_type: Dict[str, any], chat_history: List[Dict] = None) -> str:
+    """بناء سياق المحادثة إذا كان السؤال يشير إلى رسائل سابقة"""
+    conversation_context = ""
+    if question_type['needs_context'] and chat_history:
+        analyzer = ChatHistoryAnalyzer()
+        context_summary = analyzer.build_context_summary(chat_history)
+        last_topic = analyzer.extract_last_topic(chat_history)
+        
+        if context_summary:
+            conversation_context = f"""
+**سياق المحادثة السابقة:**
+{context_summary}
+
+**آخر موضوع تم مناقشته:** {last_topic if last_topic else 'غير محدد'}
+
+**ملاحظة مهمة:** السؤال الحالي "{question}" يبدو أنه يشير إلى الموضوع السابق. 
+يرجى فهم السياق والإجابة بناءً على ما تم مناقشته مسبقاً.
+"""
+    return conversation_context
+
+def create_svg_prompt(question: str, question_type: Dict[str, any], app_subject_key: str,
+                      grade_key: str, retrieved_context_str: Optional[str], prompt_engine,
+                      chat_history: List[Dict] = None) -> str:
+    """إنشاء برومبت مسار الرسم (SVG فقط) - يُستدعى فقط عندما يقرر التصنيف أن السؤال يحتاج رسماً"""
+    svg_prompt = prompt_engine.get_svg_prompt(
+        question=question,
+        app_subject_key=app_subject_key,
+        grade_key=grade_key,
+        retrieved_context_str=retrieved_context_str,
+        conversation_context=build_conversation_context(question, question_type, chat_history)
+    )
+    
+    if question_type.get('is_specific_lesson') and question_type.get('lesson_request'):
+        lesson_info = question_type['lesson_request']['lesson_info']
+        svg_prompt += f"""
+**الدرس المطلوب توضيحه بالرسم:**
+- الوحدة: {lesson_info.get('unit_name', 'غير محدد')}
+- الدرس: {lesson_info.get('lesson_name', 'غير محدد')}
+"""
+    
+    svg_prompt += f"""
+**سبب الرسم (ثقة {question_type['drawing_confidence']}%):** {question_type.get('smart_decision_reason', 'موضوع يستفيد من التوضيح البصري')}
+اجعل الرسم بسيط ومناسب لعمر الطفل وملون وجذاب، وتأكد من أنه يساهم فعلاً في الفهم وليس مجرد زخرفة.
+"""
+    return svg_prompt
+
 # === دوال المعالجة المحسنة ===
 
 def load_environment_variables_silently():
@@ -662,6 +578,7 @@ def check_knowledge_base_detailed_status(project_id: str, location: str) -> Dict
             "total_found_dbs": 0,
             "missing_docs": [],
             "missing_dbs": [],
+            "stale_dbs": [],
             "empty_docs": [],
             "build_errors": [],
             "grade_details": {}
@@ -671,7 +588,7 @@ def check_knowledge_base_detailed_status(project_id: str, location: str) -> Dict
         knowledge_docs_path = Path("knowledge_base_docs")
         docs_exist = knowledge_docs_path.exists()
         
-        chroma_dbs_path = Path("chroma_dbs")
+        chroma_dbs_path = Path(CHROMA_DB_PARENT_DIRECTORY)
         dbs_exist = chroma_dbs_path.exists()
         
         detailed_status = {
@@ -684,6 +601,7 @@ def check_knowledge_base_detailed_status(project_id: str, location: str) -> Dict
             "total_found_dbs": 0,
             "missing_docs": [],
             "missing_dbs": [],
+            "stale_dbs": [],
             "empty_docs": [],
             "build_errors": []
         }
@@ -696,57 +614,66 @@ def check_knowledge_base_detailed_status(project_id: str, location: str) -> Dict
                 subject_folder = SUBJECT_FOLDERS.get(subject_key, subject_key)
                 detailed_status["total_expected"] += 1
                 
-                # فحص مجلد المستندات
+                # حالة المجموعة من ملف حالتها (بدون مسح الملفات)؛ المجلدات تُقرأ فقط للمواد غير المبنية أو القديمة
                 docs_path = knowledge_docs_path / grade_key / subject_folder
+                collection_name = collection_name_for(grade_key, subject_folder)
+                collection_status = check_collection_status(CHROMA_DB_PARENT_DIRECTORY, str(docs_path), collection_name)
+                fresh = collection_status["built"] and not collection_status["stale"]
                 docs_status = {
                     "path": str(docs_path),
-                    "exists": docs_path.exists(),
+                    "exists": True,
                     "has_files": False,
                     "file_count": 0,
                     "file_types": []
                 }
                 
-                if docs_path.exists():
+                if fresh:
+                    docs_status["exists"] = docs_path.exists() if collection_status["file_count"] == 0 else True
+                    docs_status["file_count"] = collection_status["file_count"]
+                    docs_status["file_types"] = collection_status["file_types"]
+                elif docs_path.exists():
                     try:
-                        files = list(docs_path.glob("*"))
-                        docs_status["file_count"] = len([f for f in files if f.is_file()])
-                        docs_status["has_files"] = docs_status["file_count"] > 0
-                        docs_status["file_types"] = list(set([f.suffix for f in files if f.is_file()]))
-                        
-                        if docs_status["has_files"]:
-                            detailed_status["total_found_docs"] += 1
-                        else:
-                            detailed_status["empty_docs"].append(f"{grade_key}/{subject_folder}")
+                        files = [f for f in docs_path.glob("*") if f.is_file()]
+                        docs_status["file_count"] = len(files)
+                        docs_status["file_types"] = list(set([f.suffix for f in files]))
                     except Exception as e:
                         docs_status["error"] = str(e)
                         detailed_status["build_errors"].append(f"خطأ في قراءة {docs_path}: {e}")
                 else:
+                    docs_status["exists"] = False
+                
+                docs_status["has_files"] = docs_status["file_count"] > 0
+                if docs_status["has_files"]:
+                    detailed_status["total_found_docs"] += 1
+                elif docs_status["exists"] and "error" not in docs_status:
+                    detailed_status["empty_docs"].append(f"{grade_key}/{subject_folder}")
+                elif not docs_status["exists"]:
                     detailed_status["missing_docs"].append(f"{grade_key}/{subject_folder}")
                 
                 # فحص قاعدة البيانات
-                collection_name = f"{grade_key}_{subject_folder.replace(' ', '_').lower()}_coll"
-                db_path = chroma_dbs_path / collection_name
+                db_path = Path(vector_store_path_for(CHROMA_DB_PARENT_DIRECTORY, collection_name))
                 db_status = {
                     "collection_name": collection_name,
                     "path": str(db_path),
-                    "exists": db_path.exists(),
-                    "has_data": False
+                    "exists": collection_status["built"],
+                    "has_data": collection_status["built"] and collection_status.get("chunk_count", 0) > 0,
+                    "stale": collection_status["stale"],
+                    "reason": collection_status["reason"],
+                    "chunk_count": collection_status.get("chunk_count", 0),
+                    "embedding_model": collection_status.get("embedding_model"),
+                    "built_at": collection_status.get("built_at")
                 }
                 
-                if db_path.exists():
-                    try:
-                        data_files = list(db_path.glob("**/*"))
-                        db_status["has_data"] = len([f for f in data_files if f.is_file()]) > 0
-                        
-                        if db_status["has_data"]:
-                            detailed_status["total_found_dbs"] += 1
-                        else:
-                            detailed_status["missing_dbs"].append(collection_name)
-                    except Exception as e:
-                        db_status["error"] = str(e)
-                        detailed_status["build_errors"].append(f"خطأ في قراءة {db_path}: {e}")
-                else:
+                if not collection_status["built"]:
+                    # مجموعات بُنيت قبل ملفات الحالة: البناء التزايدي القادم يكتب حالتها دون إعادة تضمين
+                    db_status["exists"] = db_status["has_data"] = stored_collection_exists(CHROMA_DB_PARENT_DIRECTORY, collection_name)
+                
+                if db_status["has_data"]:
+                    detailed_status["total_found_dbs"] += 1
+                elif docs_status["has_files"]:
                     detailed_status["missing_dbs"].append(collection_name)
+                if db_status["exists"] and collection_status["stale"] and docs_status["has_files"]:
+                    detailed_status["stale_dbs"].append(collection_name)
                 
                 grade_details["subjects"][subject_key] = {
                     "name": subject_name,
@@ -772,148 +699,51 @@ def check_knowledge_base_detailed_status(project_id: str, location: str) -> Dict
             "total_found_dbs": 0,
             "missing_docs": [],
             "missing_dbs": [],
+            "stale_dbs": [],
             "empty_docs": [],
             "build_errors": [str(e)],
             "grade_details": {}
         }
 
-@st.cache_data
-def build_knowledge_bases_with_error_handling(project_id: str, location: str, force_rebuild: bool = False) -> Dict[str, Any]:
-    """بناء قواعد المعرفة مع معالجة تفصيلية للأخطاء (بصمت)"""
-    status = check_knowledge_base_detailed_status(project_id, location)
-    
-    if not status["available"]:
-        return {"success": False, "message": "مدير قواعد المعرفة غير متاح", "details": status.get("details", "")}
-    
-    if not status["docs_exist"] or status["total_found_docs"] == 0:
-        return {
-            "success": False,
-            "message": "لا توجد ملفات منهج دراسي لبناء قواعد المعرفة منها",
-            "suggestion": "تأكد من رفع مجلد knowledge_base_docs مع ملفات المنهج",
-            "missing_docs": status["missing_docs"],
-            "empty_docs": status["empty_docs"]
-        }
-    
-    if not force_rebuild and status["total_found_dbs"] > 0 and len(status["missing_dbs"]) == 0:
-        return {
-            "success": True, 
-            "message": "قواعد المعرفة موجودة ولا تحتاج إعادة بناء",
-            "found_dbs": status["total_found_dbs"]
-        }
-    
-    results = {
-        "success": True,
-        "built_databases": [],
-        "failed_databases": [],
-        "skipped_databases": [],
-        "detailed_errors": []
-    }
-    
-    # إنشاء قائمة المواد التي بها ملفات
-    subjects_to_build = [
-        (grade_key, subject_key, subject_folder)
-        for grade_key, grade_info in GRADE_SUBJECTS.items()
-        for subject_key, subject_folder in [(sk, SUBJECT_FOLDERS.get(sk, sk)) for sk in grade_info['subjects'].keys()]
-        if status["grade_details"][grade_key]["subjects"][subject_key]["docs"]["has_files"]
-    ]
-    
-    total_subjects = len(subjects_to_build)
-    
-    if total_subjects == 0:
-        return {
-            "success": False,
-            "message": "لا توجد مجلدات تحتوي على ملفات صالحة للبناء",
-            "empty_docs": status["empty_docs"]
-        }
-    
-    for i, (grade_key, subject_key, subject_folder) in enumerate(subjects_to_build):
-        grade_name = GRADE_SUBJECTS[grade_key]['name']
-        subject_name = GRADE_SUBJECTS[grade_key]['subjects'][subject_key]
-        collection_name = f"{grade_key}_{subject_folder.replace(' ', '_').lower()}_coll"
-        
-        db_path = Path("chroma_dbs") / collection_name
-        if db_path.exists() and not force_rebuild:
-            try:
-                data_files = list(db_path.glob("**/*"))
-                if len([f for f in data_files if f.is_file()]) > 0:
-                    results["skipped_databases"].append({
-                        "name": collection_name,
-                        "reason": "موجودة مسبقاً وتحتوي على بيانات"
-                    })
-                    continue
-            except Exception as e:
-                results["detailed_errors"].append(f"خطأ في فحص {collection_name}: {e}")
-        
-        try:
-            kb_manager = None
-            retry_count = 3
-            
-            for attempt in range(retry_count):
-                try:
-                    kb_manager = KnowledgeBaseManager(
-                        grade_folder_name=grade_key,
-                        subject_folder_name=subject_folder,
-                        project_id=project_id,
-                        location=location,
-                        force_recreate=force_rebuild
-                    )
-                    
-                    if kb_manager.embedding_function and kb_manager.db:
-                        break
-                    else:
-                        if attempt < retry_count - 1:
-                            time.sleep(2)
-                        else:
-                            kb_manager = None
-                except Exception as e:
-                    if attempt < retry_count - 1:
-                        time.sleep(2)
-                    else:
-                        results["detailed_errors"].append(f"فشل إنشاء مدير {collection_name}: {e}")
-                        kb_manager = None
-            
-            if not kb_manager:
-                results["failed_databases"].append({
-                    "name": collection_name,
-                    "reason": "فشل تهيئة مدير قاعدة المعرفة"
-                })
-                continue
-            
-            build_success = False
-            for attempt in range(2):
-                try:
-                    if kb_manager.build_knowledge_base():
-                        build_success = True
-                        break
-                    else:
-                        if attempt == 0:
-                            time.sleep(1)
-                except Exception as e:
-                    results["detailed_errors"].append(f"خطأ في بناء {collection_name} (المحاولة {attempt + 1}): {e}")
-                    if attempt == 0:
-                        time.sleep(1)
-            
-            if build_success:
-                results["built_databases"].append(collection_name)
-            else:
-                results["failed_databases"].append({
-                    "name": collection_name,
-                    "reason": "فشل عملية البناء"
-                })
-                    
-        except Exception as e:
-            error_msg = f"خطأ عام في بناء {collection_name}: {str(e)}"
-            results["failed_databases"].append({
-                "name": collection_name,
-                "reason": error_msg
-            })
-            results["detailed_errors"].append(error_msg)
-    
-    return results
+# أقصى انتظار (ثوانٍ) عند أول سؤال لعميل Gemini الذي يُهيأ في خيط التسخين قبل إنشاء عميل جديد
+WARMUP_GEMINI_WAIT_SECONDS = float(os.getenv("WARMUP_GEMINI_WAIT_SECONDS", "20"))
+
+@st.cache_resource
+def initialize_warmup(project_id: str, location: str):
+    """بدء تسخين عميل التضمين وGemini والمجموعات الأكثر استخداماً في خيط خلفي (مرة واحدة للعملية)"""
+    if not WARMUP_AVAILABLE:
+        return None
+    try:
+        return start_warmup(
+            project_id, location,
+            pool=initialize_knowledge_base_pool(),
+            gemini_factory=lambda: create_gemini_client(project_id, location)
+        )
+    except Exception as e:
+        print(f"⚠️ تعذر بدء التسخين: {e}")
+        return None
 
 @st.cache_resource
 def initialize_gemini_client(project_id: str, location: str):
-    """تهيئة عميل Gemini مع التخزين المؤقت"""
+    """تهيئة عميل Gemini مع التخزين المؤقت (يُستخدم العميل المهيأ في خيط التسخين إن وجد)"""
+    warmup = initialize_warmup(project_id, location)
+    if warmup is not None:
+        client = warmup.get_gemini_client(timeout=WARMUP_GEMINI_WAIT_SECONDS)
+        if client is not None:
+            return client
+    return create_gemini_client(project_id, location)
+
+def get_gemini_client_for_question(project_id: str, location: str, warmup=None):
+    """عميل Gemini عند أول سؤال يحتاج التوليد (ينتظر خطوة Gemini في التسخين إذا لم تنتهِ بعد)"""
+    if not GEMINI_CLIENT_AVAILABLE:
+        return None
+    if warmup is not None and not warmup.gemini_step_done():
+        with st.spinner("⏳ جاري تجهيز المعلم الذكي..."):
+            return initialize_gemini_client(project_id, location)
+    return initialize_gemini_client(project_id, location)
+
+def create_gemini_client(project_id: str, location: str):
+    """إنشاء عميل Gemini جديد (بدون تخزين مؤقت)"""
     if not GEMINI_CLIENT_AVAILABLE:
         return None
         
@@ -930,20 +760,21 @@ def initialize_gemini_client(project_id: str, location: str):
         return None
 
 @st.cache_resource
-def initialize_knowledge_base(project_id: str, location: str, grade_key: str, subject_key: str):
-    """تهيئة قاعدة المعرفة مع التخزين المؤقت"""
+def initialize_knowledge_base_pool():
+    """مجمع مديري قواعد المعرفة المشترك بين الجلسات (حد أقصى للمجموعات المفتوحة في الذاكرة)"""
     if not KB_MANAGER_AVAILABLE:
         return None
+    return KnowledgeBaseManagerPool()
+
+def initialize_knowledge_base(project_id: str, location: str, grade_key: str, subject_key: str):
+    """مدير قاعدة المعرفة من المجمع (المجموعة تُفتح عند أول استخدام وقد تُغلق عند تجاوز الحد)"""
+    kb_pool = initialize_knowledge_base_pool()
+    if kb_pool is None:
+        return None
         
     try:
         subject_folder = SUBJECT_FOLDERS.get(subject_key, subject_key)
-        kb_manager = KnowledgeBaseManager(
-            grade_folder_name=grade_key,
-            subject_folder_name=subject_folder,
-            project_id=project_id,
-            location=location
-        )
-        return kb_manager
+        return kb_pool.get(project_id, location, grade_key, subject_folder)
     except Exception as e:
         return None
 
@@ -954,34 +785,150 @@ def initialize_prompt_engine():
         return None
     return UnifiedPromptEngine()
 
-def retrieve_context(kb_manager: Optional[any], query: str, k_results: int = 3) -> str:
-    """استرجاع السياق من قاعدة المعرفة"""
+@st.cache_resource
+def initialize_response_cache():
+    """ذاكرة الإجابات الدلالية المشتركة بين جميع الجلسات"""
+    if not RESPONSE_CACHE_AVAILABLE:
+        return None
+    return SemanticResponseCache()
+
+def get_response_cache_bucket(question_type: Dict[str, Any], grade_key: str, subject_key: str):
+    """حاوية الإجابة المخزنة: الصف، المادة، نمط الرسم والدرس المحدد"""
+    lesson_key = None
+    if question_type.get('is_specific_lesson') and question_type.get('lesson_request'):
+        lesson_request = question_type['lesson_request']
+        lesson_info = lesson_request.get('lesson_info', {})
+        lesson_key = f"{lesson_info.get('unit_key', '')}/{lesson_info.get('lesson_key', lesson_request.get('lesson_number', ''))}"
+    return SemanticResponseCache.make_bucket(grade_key, subject_key, question_type['needs_drawing'], lesson_key)
+
+def embed_question_for_cache(kb_manager, question: str) -> Optional[List[float]]:
+    """تضمين السؤال للمطابقة الدلالية (None عند عدم توفر قاعدة المعرفة)"""
+    if not kb_manager or not hasattr(kb_manager, 'embed_query'):
+        return None
+    try:
+        return kb_manager.embed_query(question)
+    except Exception as e:
+        print(f"تعذر تضمين السؤال للذاكرة المؤقتة: {e}")
+        return None
+
+def store_cached_response(prepared: Dict[str, Any], response: Dict) -> None:
+    """تخزين إجابة Gemini الناجحة في ذاكرة الإجابات (بدون تضمين إذا فشل start_store_embedding: مطابقة تامة فقط)"""
+    response_cache = prepared.get('response_cache')
+    if not response_cache or prepared.get('cache_bucket') is None:
+        return
+    if response.get('quality_issues') or not response.get('text_explanation'):
+        return
+    response_cache.set(prepared['cache_bucket'], prepared['question'], response,
+                       embedding=prepared.get('question_embedding'))
+
+def start_store_embedding(prepared: Dict[str, Any]) -> Optional[Future]:
+    """بدء تضمين السؤال اللازم لتخزين إجابته بالتوازي مع توليد Gemini (None إذا لم يكن مطلوباً)
+
+    السؤال الذي لم تحتج ذاكرة الإجابات ولا البحث النصي لتضمينه قبل التوليد يُضمَّن هنا خارج المسار الحرج.
+    """
+    if prepared.get('cache_bucket') is None or prepared.get('question_embedding') is not None:
+        return None
+    if prepared.get('kb_manager') is None:
+        return None
+    return submit_blocking(embed_question_for_cache, prepared['kb_manager'], prepared['question'])
+
+def answer_uses_chat_history(question_type: Dict[str, Any], chat_history: List[Dict] = None) -> bool:
+    """هل يتضمن البرومبت محادثة الطالب السابقة؟ (نفس شرط build_conversation_context: مراجع، توضيح أو تصحيح)"""
+    return bool(question_type['needs_context'] and chat_history)
+
+def answer_flight_key(prepared: Dict[str, Any], grade_key: str, subject_key: str,
+                      chat_history: List[Dict] = None) -> Optional[tuple]:
+    """مفتاح دمج الأسئلة المتطابقة الجارية: السؤال المطبّع، الصف، المادة ونمط الرسم
+
+    None إذا كان البرومبت يتضمن محادثة الطالب السابقة (build_conversation_context) لأن الإجابة خاصة به.
+    """
+    question_type = prepared['question_type']
+    if answer_uses_chat_history(question_type, chat_history):
+        return None
+    return (normalize_question(prepared['question']), grade_key, subject_key, question_type['needs_drawing'])
+
+def retrieve_context(kb_manager: Optional[any], query: str, k_results: int = 3, where: Optional[Dict] = None) -> str:
+    """استرجاع السياق من قاعدة المعرفة (where: فلتر اختياري على الوحدة/الدرس)"""
     if not kb_manager or not hasattr(kb_manager, 'db') or not kb_manager.db:
         return ""
    
     try:
-        docs = kb_manager.search_documents(query, k_results)
-        if docs:
-            context_parts = []
-            for i, doc in enumerate(docs, 1):
-                context_parts.append(f"[مصدر {i}]: {doc.page_content}")
-            return "\n\n".join(context_parts)
+        return format_context_documents(kb_manager.search_documents(query, k_results, where=where))
+    except Exception as e:
         return ""
+
+def format_context_documents(docs: List[Any]) -> str:
+    """تنسيق الأجزاء المسترجعة كسياق مرقم للبرومبت"""
+    return "\n\n".join(f"[مصدر {i}]: {doc.page_content}" for i, doc in enumerate(docs or [], 1))
+
+def retrieve_lesson_context(kb_manager: Optional[any], lesson_info: Dict[str, Any]) -> str:
+    """سياق درس محدد من فهرس الدروس (قراءة مباشرة بدون تضمين)، أو "" إذا لم يكن الدرس مفهرساً"""
+    if not kb_manager or not getattr(kb_manager, 'db', None) or not hasattr(kb_manager, 'get_lesson_documents'):
+        return ""
+    try:
+        return format_context_documents(
+            kb_manager.get_lesson_documents(lesson_info.get('unit_key', ''), lesson_info.get('lesson_key', ''))
+        )
     except Exception as e:
+        print(f"خطأ في جلب الدرس من الفهرس: {e}")
         return ""
 
-def process_user_question_enhanced(question: str, gemini_client, kb_manager, prompt_engine, 
-                                  grade_key: str, subject_key: str, chat_history: List[Dict] = None):
-    """نسخة محسنة من معالج الأسئلة مع دعم الدروس المحددة وقرار ذكي للرسم ودعم تاريخ المحادثة"""
-    
-    # تصنيف السؤال مع كشف الدروس
-    question_type = classify_question_type_enhanced(question, chat_history, grade_key, subject_key)
-    
-    # التعامل مع التحيات
-    if question_type['is_greeting']:
-        return get_greeting_response(question, grade_key, subject_key)
-    
-    # معالجة خاصة للدروس المحددة
+def new_prepared_question(question: str, question_type: Dict[str, Any]) -> Dict[str, Any]:
+    """البنية التي تمر بين مراحل معالجة السؤال"""
+    return {
+        'question_type': question_type,
+        'context': "",
+        'search_status': "not_searched",
+        'prompt': None,
+        'svg_prompt': None,
+        'greeting_response': None,
+        'question': question,
+        'cached_response': None,
+        'response_cache': None,
+        'kb_manager': None,
+        'cache_bucket': None,
+        'question_embedding': None,
+        'stage_seconds': {}
+    }
+
+def uses_response_cache(question_type: Dict[str, Any], response_cache, chat_history: List[Dict] = None) -> bool:
+    """الأسئلة التي يتضمن برومبتها محادثة الطالب السابقة لا تُخزن ولا تُسترجع لأن إجابتها خاصة به"""
+    return (response_cache is not None and not question_type['is_greeting']
+            and not answer_uses_chat_history(question_type, chat_history))
+
+def attach_response_cache(prepared: Dict[str, Any], response_cache, kb_manager, grade_key: str, subject_key: str) -> bool:
+    """ربط السؤال بحاوية ذاكرة الإجابات وإرجاع هل تحتاج المطابقة تضمين السؤال
+
+    المطابقة التامة لا تحتاج تضميناً، ولا داعي له إذا لم يكن في الحاوية سؤال مشابه مخزن
+    (مثل أول طلب لدرس محدد يُقرأ من فهرس الدروس).
+    """
+    prepared['response_cache'] = response_cache
+    prepared['kb_manager'] = kb_manager
+    prepared['cache_bucket'] = get_response_cache_bucket(prepared['question_type'], grade_key, subject_key)
+    return kb_manager is not None and response_cache.needs_embedding(prepared['cache_bucket'], prepared['question'])
+
+def lookup_cached_response(prepared: Dict[str, Any], question_embedding: Optional[List[float]] = None) -> bool:
+    """البحث في ذاكرة الإجابات بعد attach_response_cache (True إذا وُجدت إجابة لسؤال مطابق أو مشابه)"""
+    prepared['question_embedding'] = question_embedding
+    prepared['cached_response'] = prepared['response_cache'].get(
+        prepared['cache_bucket'], prepared['question'], embedding=question_embedding
+    )
+    if prepared['cached_response'] is not None:
+        prepared['search_status'] = "cached"
+        return True
+    return False
+
+def get_search_query(question: str, question_type: Dict[str, Any], chat_history: List[Dict] = None) -> str:
+    """استعلام البحث: السؤال نفسه، أو مسبوقاً بآخر موضوع إذا أشار السؤال لمحادثة سابقة"""
+    if question_type['has_references'] and chat_history:
+        last_topic = ChatHistoryAnalyzer().extract_last_topic(chat_history)
+        if last_topic:
+            return f"{last_topic} {question}"
+    return question
+
+def retrieve_question_context(kb_manager, question: str, question_type: Dict[str, Any],
+                              search_query: str) -> Tuple[str, str]:
+    """البحث في المنهج حسب نوع السؤال وإرجاع (السياق، حالة البحث)"""
     context = ""
     search_status = "not_searched"
     
@@ -996,7 +943,13 @@ def process_user_question_enhanced(question: str, gemini_client, kb_manager, pro
         # بحث محسن باستخدام معلومات الدرس
         if kb_manager and hasattr(kb_manager, 'db') and kb_manager.db:
             try:
-                context = retrieve_context(kb_manager, enhanced_query, k_results=5)  # نتائج أكثر للدروس المحددة
+                # فهرس الدروس أولاً (أجزاء الدرس بترتيب الكتاب بدون تضمين)، ثم بحث متجهي داخل الدرس، ثم في المادة كاملة
+                context = retrieve_lesson_context(kb_manager, lesson_info)
+                if not context:
+                    lesson_filter = lesson_metadata_filter(lesson_info.get('unit_key', ''), lesson_info.get('lesson_key', ''))
+                    context = retrieve_context(kb_manager, enhanced_query, k_results=5, where=lesson_filter) if lesson_filter else ""
+                if not context:
+                    context = retrieve_context(kb_manager, enhanced_query, k_results=5)  # نتائج أكثر للدروس المحددة
                 if context:
                     search_status = "found_specific_lesson"
                     # إضافة سياق إضافي عن الدرس
@@ -1016,29 +969,29 @@ def process_user_question_enhanced(question: str, gemini_client, kb_manager, pro
             except Exception as e:
                 search_status = "error"
                 print(f"خطأ في البحث: {e}")
-    else:
+    elif should_search_curriculum(question, question_type):
         # البحث العادي للأسئلة غير المحددة
-        search_query = question
-        if question_type['has_references'] and chat_history:
-            analyzer = ChatHistoryAnalyzer()
-            last_topic = analyzer.extract_last_topic(chat_history)
-            if last_topic:
-                search_query = f"{last_topic} {question}"
-        
-        if should_search_curriculum(question, question_type):
-            if kb_manager and hasattr(kb_manager, 'db') and kb_manager.db:
-                try:
-                    context = retrieve_context(kb_manager, search_query)
-                    if context:
-                        search_status = "found"
-                    else:
-                        search_status = "not_found"
-                except Exception as e:
-                    search_status = "error"
-            else:
-                search_status = "no_kb"
+        if kb_manager and hasattr(kb_manager, 'db') and kb_manager.db:
+            try:
+                context = retrieve_context(kb_manager, search_query)
+                if context:
+                    search_status = "found"
+                else:
+                    search_status = "not_found"
+            except Exception as e:
+                search_status = "error"
+        else:
+            search_status = "no_kb"
 
-    # إنشاء البرومبت المحسن
+    return context, search_status
+
+def build_question_prompts(prepared: Dict[str, Any], prompt_engine, grade_key: str, subject_key: str,
+                           chat_history: List[Dict] = None) -> None:
+    """إنشاء البرومبت المحسن: مسار الشرح دائماً، ومسار الرسم فقط عند الحاجة للرسم"""
+    question = prepared['question']
+    question_type = prepared['question_type']
+    context = prepared['context']
+    svg_prompt = None
     if prompt_engine:
         specialized_prompt = create_enhanced_prompt(
             question=question,
@@ -1047,21 +1000,110 @@ def process_user_question_enhanced(question: str, gemini_client, kb_manager, pro
             grade_key=grade_key,
             retrieved_context_str=context if context else None,
             prompt_engine=prompt_engine,
-            chat_history=chat_history
+            chat_history=chat_history,
+            include_svg=False
         )
+        if question_type['needs_drawing']:
+            svg_prompt = create_svg_prompt(
+                question=question,
+                question_type=question_type,
+                app_subject_key=subject_key,
+                grade_key=grade_key,
+                retrieved_context_str=context if context else None,
+                prompt_engine=prompt_engine,
+                chat_history=chat_history
+            )
     else:
         specialized_prompt = f"أنت معلم للصف {grade_key} في مادة {subject_key}. اشرح للطفل: {question}"
 
-    # إرسال الطلب لـ Gemini
-    if gemini_client:
-        response = gemini_client.query_for_explanation_and_svg(specialized_prompt)
-    else:
-        response = {
-            "text_explanation": "عذرًا، المعلم الذكي غير جاهز حالياً. يرجى المحاولة لاحقاً.",
-            "svg_code": None,
-            "quality_scores": {},
-            "quality_issues": ["المعلم الذكي غير متاح"]
-        }
+    prepared['prompt'] = specialized_prompt
+    prepared['svg_prompt'] = svg_prompt
+
+# === تحضير السؤال على حلقة الأحداث المشتركة: مهلة لكل مرحلة (التوليد يبقى متزامناً لعرض الشرح متدفقاً) ===
+
+async def _await_stage(prepared: Dict[str, Any], stage: str, task: "asyncio.Future", timeout: float, default: Any) -> Any:
+    """انتظار مرحلة مع مهلة؛ عند تجاوزها تُعاد default وتبقى المهمة قيد التشغيل حتى تُلغى في النهاية
+
+    shield: مهلة الانتظار لا تلغي خيط المرحلة الجاري؛ الإلغاء يتم مرة واحدة في نهاية التحضير.
+    """
+    started_at = time.perf_counter()
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+    except asyncio.TimeoutError:
+        print(f"⏱️ تجاوزت مرحلة '{stage}' المهلة ({timeout} ث)")
+        return default
+    except Exception as e:
+        print(f"خطأ في مرحلة '{stage}': {e}")
+        return default
+    finally:
+        prepared['stage_seconds'][stage] = round(time.perf_counter() - started_at, 3)
+
+async def prepare_user_question_async(question: str, kb_manager, prompt_engine, grade_key: str, subject_key: str,
+                                      chat_history: List[Dict] = None, response_cache=None) -> Dict[str, Any]:
+    """تحضير السؤال: التصنيف، ذاكرة الإجابات، البحث في المنهج وبناء البرومبت (بدون استدعاء Gemini)
+
+    التصنيف (أنماط مُجمّعة مسبقاً، عشرات الميكروثواني) يتم أولاً في الحلقة نفسها، ثم يبدأ البحث الذي يحتاجه
+    نوع السؤال بالتوازي مع تضمين ذاكرة الإجابات (إن احتاجته) ويُلغى إذا وُجدت إجابة مخزنة؛ لكل مرحلة مهلة.
+    """
+    started_at = time.perf_counter()
+    question_type = classify_question_type_enhanced(question, chat_history, grade_key, subject_key)
+    prepared = new_prepared_question(question, question_type)
+    prepared['stage_seconds']['classify'] = round(time.perf_counter() - started_at, 3)
+
+    if question_type['is_greeting']:
+        prepared['greeting_response'] = get_greeting_response(question, grade_key, subject_key)
+        return prepared
+
+    pending: List[asyncio.Future] = []
+    try:
+        # المطابقة التامة (أو حاوية بلا أسئلة مشابهة) لا تحتاج تضميناً: تُحسم قبل بدء البحث
+        embedding_task = None
+        if response_cache is not None and answer_uses_chat_history(question_type, chat_history):
+            response_cache.record_bypass()
+        elif uses_response_cache(question_type, response_cache, chat_history):
+            if attach_response_cache(prepared, response_cache, kb_manager, grade_key, subject_key):
+                embedding_task = asyncio.ensure_future(asyncio.to_thread(embed_question_for_cache, kb_manager, question))
+                pending.append(embedding_task)
+            elif lookup_cached_response(prepared):
+                return prepared
+
+        search_query = get_search_query(question, question_type, chat_history)
+        retrieval_task = asyncio.ensure_future(asyncio.to_thread(
+            retrieve_question_context, kb_manager, question, question_type, search_query
+        ))
+        pending.append(retrieval_task)
+
+        if embedding_task is not None:
+            question_embedding = await _await_stage(prepared, 'embedding', embedding_task, PIPELINE_EMBEDDING_TIMEOUT, None)
+            if lookup_cached_response(prepared, question_embedding):
+                return prepared
+
+        prepared['context'], prepared['search_status'] = await _await_stage(
+            prepared, 'retrieval', retrieval_task, PIPELINE_RETRIEVAL_TIMEOUT, ("", "timeout")
+        )
+
+        build_question_prompts(prepared, prompt_engine, grade_key, subject_key, chat_history)
+        prepared['stage_seconds']['prepare_total'] = round(time.perf_counter() - started_at, 3)
+        return prepared
+    finally:
+        # بحث لم يعد مطلوباً (إجابة مخزنة) أو مرحلة تجاوزت مهلتها: الخيط الجاري يكمل وتبقى نتيجته في الذاكرة المؤقتة
+        for task in pending:
+            if not task.done():
+                task.cancel()
+
+def get_unavailable_tutor_response() -> Dict[str, Any]:
+    """الرد عند عدم توفر عميل Gemini"""
+    return {
+        "text_explanation": "عذرًا، المعلم الذكي غير جاهز حالياً. يرجى المحاولة لاحقاً.",
+        "svg_code": None,
+        "quality_scores": {},
+        "quality_issues": ["المعلم الذكي غير متاح"]
+    }
+
+def finalize_response_data(prepared: Dict[str, Any], response: Dict) -> Dict[str, Any]:
+    """المرحلة الأخيرة: دمج رد Gemini مع نتائج التصنيف والبحث في صيغة رسالة المحادثة"""
+    question_type = prepared['question_type']
+    lesson_info = question_type['lesson_request']['lesson_info'] if question_type['is_specific_lesson'] else {}
 
     # تطبيق قرار الرسم الذكي: إزالة الرسم إذا لم يقرر النظام أنه مطلوب
     if not question_type['needs_drawing']:
@@ -1072,8 +1114,8 @@ def process_user_question_enhanced(question: str, gemini_client, kb_manager, pro
         'svg_code': response.get("svg_code"),
         'quality_scores': response.get("quality_scores", {}),
         'quality_issues': response.get("quality_issues", []),
-        'search_status': search_status,
-        'lesson_info': question_type.get('lesson_request', {}).get('lesson_info') if question_type['is_specific_lesson'] else None,
+        'search_status': prepared['search_status'],
+        'lesson_info': lesson_info if question_type['is_specific_lesson'] else None,
         'drawing_decision': question_type.get('smart_decision_reason', 'غير محدد'),
         'drawing_confidence': question_type.get('drawing_confidence', 0),
         'question_analysis': {
@@ -1088,6 +1130,76 @@ def process_user_question_enhanced(question: str, gemini_client, kb_manager, pro
         }
     }
 
+def render_explanation_stream(text_stream, placeholder) -> str:
+    """عرض الشرح تدريجياً داخل placeholder (st.empty) أثناء وصوله وإرجاع النص الكامل المعروض"""
+    if hasattr(st, 'write_stream'):
+        with placeholder.container():
+            streamed = st.write_stream(text_stream)
+        return streamed if isinstance(streamed, str) else "".join(str(part) for part in streamed)
+    # نسخ Streamlit الأقدم لا تدعم write_stream
+    streamed = ""
+    for delta in text_stream:
+        streamed += delta
+        placeholder.markdown(streamed)
+    return streamed
+
+def stream_gemini_response(gemini_client, prepared: Dict[str, Any]) -> Tuple[Dict, str]:
+    """مسار الرسم يعمل في الخلفية بينما يُعرض الشرح تدريجياً فور وصوله: (الرد المدمج، النص المعروض)"""
+    svg_future = gemini_client.submit_svg_query(prepared['svg_prompt']) if prepared['svg_prompt'] else None
+    store_embedding = start_store_embedding(prepared)
+    stream = gemini_client.stream_query_explanation(prepared['prompt'])
+    placeholder = st.empty()
+    streamed_text = render_explanation_stream(stream, placeholder)
+    svg_result = None
+    if svg_future is not None:
+        with st.spinner("🎨 جاري تجهيز الرسم التوضيحي..."):
+            try:
+                svg_result = svg_future.result()
+            except Exception as e:
+                print(f"خطأ في مسار الرسم: {e}")
+    response = gemini_client.merge_track_results(stream.result, svg_result)
+    explanation = response.get("text_explanation")
+    if explanation != streamed_text:
+        # انقطع التدفق واستُخدم المسار الاحتياطي: الإجابة الكاملة تحل محل النص الجزئي بدلاً من ظهورها تحته
+        if explanation:
+            placeholder.markdown(explanation)
+        else:
+            placeholder.empty()
+        streamed_text = explanation
+    if store_embedding is not None:
+        try:
+            prepared['question_embedding'] = store_embedding.result(PIPELINE_EMBEDDING_TIMEOUT)
+        except Exception as e:
+            print(f"تعذر تضمين السؤال لتخزين الإجابة: {e!r}")
+    store_cached_response(prepared, response)
+    return response, streamed_text
+
+def generate_answer_coalesced(gemini_client, prepared: Dict[str, Any], grade_key: str, subject_key: str,
+                              chat_history: List[Dict] = None) -> Tuple[Dict, Optional[str]]:
+    """توليد الإجابة مع دمج الأسئلة المتطابقة الجارية: الطالب الأول يرى الشرح متدفقاً وينتظر الباقون نتيجته
+
+    يعيد (الرد، النص المعروض تدريجياً أو None إذا كانت الإجابة مشتركة). إذا فشل الطلب القائد أو تجاوز
+    المهلة يولّد التابع إجابته بنفسه.
+    """
+    key = answer_flight_key(prepared, grade_key, subject_key, chat_history)
+    flight = answer_flights.acquire(key) if key is not None else None
+    if flight is not None and not flight.is_leader:
+        try:
+            with st.spinner("⏳ سؤال مطابق قيد الإجابة الآن، ستصلك الإجابة نفسها..."):
+                return copy.deepcopy(flight.wait(PIPELINE_GENERATION_TIMEOUT)), None
+        except Exception as e:
+            print(f"تعذر انتظار الإجابة المشتركة، سيتم التوليد مباشرة: {e}")
+            flight = None
+    try:
+        response, streamed_text = stream_gemini_response(gemini_client, prepared)
+    except BaseException as e:
+        if flight is not None:
+            flight.fail(e)
+        raise
+    if flight is not None:
+        flight.resolve(copy.deepcopy(response))
+    return response, streamed_text
+
 def initialize_session_state():
     """تهيئة حالة الجلسة للمحادثة المستمرة"""
     if 'messages' not in st.session_state:
@@ -1277,39 +1389,36 @@ def main():
         st.info("💡 يرجى إضافة المتغيرات المطلوبة في إعدادات التطبيق")
         st.stop()
     
-    # فحص وبناء قواعد المعرفة إذا لزم الأمر (بصمت)
+    # التسخين يبدأ في الخلفية قبل أي عمل آخر حتى يجد أول سؤال كل شيء جاهزاً
+    warmup = initialize_warmup(project_id, location)
+    
+    # قواعد المعرفة تُبنى مسبقاً خارج التطبيق (python -m tutor_ai.build)؛ التطبيق يحمّل المبني فقط
     if not st.session_state.knowledge_bases_built:
         kb_status = check_knowledge_base_detailed_status(project_id, location)
-        
-        if not kb_status["docs_exist"] or kb_status["total_found_docs"] == 0:
-            st.session_state.knowledge_bases_built = True
-        elif len(kb_status["missing_dbs"]) > 0:
-            # بناء صامت لقواعد المعرفة
-            build_result = build_knowledge_bases_with_error_handling(project_id, location)
-            st.session_state.knowledge_bases_built = True
-        else:
-            st.session_state.knowledge_bases_built = True
+        pending_dbs = kb_status["missing_dbs"] + kb_status["stale_dbs"]
+        if pending_dbs:
+            print(f"⚠️ قواعد معرفة غير مبنية أو قديمة ({len(pending_dbs)}): شغّل python -m tutor_ai.build")
+        st.session_state.knowledge_bases_built = True
    
     # عرض الشريط الجانبي
     selected_grade, selected_subject = display_sidebar()
+    if warmup is not None and not warmup.is_ready():
+        st.caption("⏳ جاري تجهيز المعلم الذكي...")
    
-    # تهيئة المكونات بصمت
-    gemini_client = None
-    if GEMINI_CLIENT_AVAILABLE:
-        gemini_client = initialize_gemini_client(project_id, location)
-    
+    # تهيئة المكونات بصمت (عميل Gemini يُطلب عند أول سؤال يحتاجه حتى لا ينتظر عرض الصفحة التسخين)
     kb_manager = None
     if KB_MANAGER_AVAILABLE:
         kb_manager = initialize_knowledge_base(project_id, location, selected_grade, selected_subject)
     
     prompt_engine = initialize_prompt_engine()
+    response_cache = initialize_response_cache()
    
     # عرض رسالة الترحيب إذا لم تبدأ المحادثة
     if not st.session_state.conversation_started:
         with st.chat_message("assistant", avatar="🤖"):
             st.write("**المعلم الذكي:**")
             st.write(f"أهلاً وسهلاً! أنا معلمك الذكي للصف {GRADE_SUBJECTS[selected_grade]['name']} في مادة {GRADE_SUBJECTS[selected_grade]['subjects'][selected_subject]}.")
-            if GEMINI_CLIENT_AVAILABLE and gemini_client:
+            if GEMINI_CLIENT_AVAILABLE:
                 st.write("اسألني أي سؤال وسأجيبك بشرح مبسط ورسم توضيحي عند الحاجة! 😊")
                 st.write("💡 **النظام الذكي للرسم:** سأقرر بنفسي متى أحتاج لرسم توضيحي لمساعدتك في الفهم!")
                 if CURRICULUM_INDEX_AVAILABLE:
@@ -1325,6 +1434,10 @@ def main():
    
     # مربع إدخال السؤال الجديد
     if prompt := st.chat_input("اكتب سؤالك هنا... 💭"):
+        if WARMUP_AVAILABLE:
+            # إحصاءات الاستخدام تحدد المجموعات التي تُسخّن عند بدء العملية التالية
+            get_traffic_stats().record(selected_grade, SUBJECT_FOLDERS.get(selected_subject, selected_subject))
+        
         # إضافة سؤال المستخدم
         add_message("user", prompt)
         display_message(st.session_state.messages[-1])
@@ -1333,113 +1446,135 @@ def main():
         with st.chat_message("assistant", avatar="🤖"):
             st.write("**المعلم الذكي:**")
            
-            with st.spinner("🤖 المعلم الذكي يحلل السؤال ويبحث في المنهج..."):
-                try:
-                    # استخدام المعالج المحسن مع تمرير تاريخ المحادثة
-                    response_data = process_user_question_enhanced(
-                        prompt, gemini_client, kb_manager, prompt_engine,
-                        selected_grade, selected_subject, st.session_state.messages[:-1]  # تمرير كل الرسائل ما عدا السؤال الحالي
-                    )
-                   
+            try:
+                with st.spinner("🤖 المعلم الذكي يحلل السؤال ويبحث في المنهج..."):
+                    # المرحلة الأولى: التصنيف والبحث وبناء البرومبت مع تمرير تاريخ المحادثة
+                    prepared = run_coroutine(prepare_user_question_async(
+                        prompt, kb_manager, prompt_engine,
+                        selected_grade, selected_subject, st.session_state.messages[:-1],  # تمرير كل الرسائل ما عدا السؤال الحالي
+                        response_cache=response_cache
+                    ))
+
+                if prepared['greeting_response']:
+                    response_data = prepared['greeting_response']
+                    st.write(response_data['explanation'])
+                else:
                     # عرض معلومات الدرس إذا كان محدداً
-                    if response_data.get('lesson_info'):
-                        lesson_info = response_data['lesson_info']
+                    if prepared['question_type']['is_specific_lesson']:
+                        lesson_info = prepared['question_type']['lesson_request']['lesson_info']
                         st.info(f"""
 📚 **تم اكتشاف درس محدد:**
 - **الوحدة:** {lesson_info.get('unit_name', 'غير محدد')}
 - **الدرس:** {lesson_info.get('lesson_name', 'غير محدد')}
 - **المواضيع:** {', '.join(lesson_info.get('keywords', []))}
 """)
-                    
-                    # عرض الشرح
-                    st.write(response_data['explanation'])
+
+                    if prepared['cached_response'] is not None:
+                        # إجابة مخزنة لسؤال مطابق أو مشابه: لا حاجة لاستدعاء Gemini
+                        response_data = finalize_response_data(prepared, prepared['cached_response'])
+                        st.write(response_data['explanation'])
+                    else:
+                        gemini_client = get_gemini_client_for_question(project_id, location, warmup)
+                        if gemini_client:
+                            response, streamed_text = generate_answer_coalesced(
+                                gemini_client, prepared, selected_grade, selected_subject, st.session_state.messages[:-1]
+                            )
+                            response_data = finalize_response_data(prepared, response)
+                            if response_data['explanation'] != streamed_text:
+                                # إجابة مشتركة مع سؤال مطابق جارٍ (المسار الاحتياطي يستبدل النص المتدفق بنفسه)
+                                st.write(response_data['explanation'])
+                        else:
+                            response_data = finalize_response_data(prepared, get_unavailable_tutor_response())
+                            st.write(response_data['explanation'])
+               
+                # عرض الرسم إذا كان موجوداً مع التحسين الجديد
+                if response_data['svg_code']:
+                    st.subheader("🎨 الرسم التوضيحي:")
+                   
+                    col1, col2 = st.columns([4, 1])
                    
-                    # عرض الرسم إذا كان موجوداً مع التحسين الجديد
-                    if response_data['svg_code']:
-                        st.subheader("🎨 الرسم التوضيحي:")
-                       
-                        col1, col2 = st.columns([4, 1])
-                       
-                        with col1:
-                            try:
-                                # تحسين عرض SVG ليكون scalable ومناسب للحاوية
-                                st.components.v1.html(
-                                    f"""
+                    with col1:
+                        try:
+                            # تحسين عرض SVG ليكون scalable ومناسب للحاوية
+                            st.components.v1.html(
+                                f"""
+                                <div style="
+                                    display: flex; 
+                                    justify-content: center; 
+                                    align-items: center;
+                                    background-color: white; 
+                                    padding: 20px; 
+                                    border-radius: 10px;
+                                    border: 2px solid #e0e0e0;
+                                    width: 100%;
+                                    height: 400px;
+                                    overflow: hidden;
+                                ">
                                     <div style="
+                                        width: 100%; 
+                                        height: 100%; 
                                         display: flex; 
                                         justify-content: center; 
                                         align-items: center;
-                                        background-color: white; 
-                                        padding: 20px; 
-                                        border-radius: 10px;
-                                        border: 2px solid #e0e0e0;
-                                        width: 100%;
-                                        height: 400px;
-                                        overflow: hidden;
                                     ">
-                                        <div style="
-                                            width: 100%; 
-                                            height: 100%; 
-                                            display: flex; 
-                                            justify-content: center; 
-                                            align-items: center;
-                                        ">
-                                            <svg style="
-                                                max-width: 100%; 
-                                                max-height: 100%; 
-                                                width: auto; 
-                                                height: auto;
-                                            " viewBox="0 0 700 500" preserveAspectRatio="xMidYMid meet">
-                                                {response_data['svg_code'].replace('<svg', '').replace('</svg>', '').replace('width="700"', '').replace('height="500"', '')}
-                                            </svg>
-                                        </div>
+                                        <svg style="
+                                            max-width: 100%; 
+                                            max-height: 100%; 
+                                            width: auto; 
+                                            height: auto;
+                                        " viewBox="0 0 700 500" preserveAspectRatio="xMidYMid meet">
+                                            {response_data['svg_code'].replace('<svg', '').replace('</svg>', '').replace('width="700"', '').replace('height="500"', '')}
+                                        </svg>
                                     </div>
-                                    """,
-                                    height=450
-                                )
-                            except Exception as e:
-                                st.error(f"❌ خطأ في عرض الرسم: {e}")
-                       
-                        with col2:
-                            st.write("💾 **تحميل:**")
-                            st.download_button(
-                                label="⬇️ SVG",
-                                data=response_data['svg_code'],
-                                file_name=f"رسم_توضيحي_{datetime.now().strftime('%Y%m%d_%H%M%S')}.svg",
-                                mime="image/svg+xml",
-                                key=f"download_svg_new"
+                                </div>
+                                """,
+                                height=450
                             )
-                            
-                            # عرض معلومات قرار الرسم
-                            if response_data.get('drawing_decision'):
-                                st.caption(f"🧠 **قرار الرسم:** {response_data['drawing_decision']}")
-                            
-                            if response_data.get('drawing_confidence', 0) > 0:
-                                confidence = response_data['drawing_confidence']
-                                st.caption(f"📊 **ثقة القرار:** {confidence}%")
-                    else:
-                        # عرض سبب عدم الرسم إذا لم يكن هناك رسم
-                        if response_data.get('drawing_decision'):
-                            st.caption(f"💭 **لماذا لا يوجد رسم؟** {response_data['drawing_decision']}")
-                    
-                    # عرض حالة البحث
-                    search_status = response_data.get('search_status', 'unknown')
-                    if search_status == "found_specific_lesson":
-                        st.success("✅ تم العثور على محتوى الدرس في المنهج الدراسي")
-                    elif search_status == "lesson_not_found":
-                        st.warning("⚠️ لم يتم العثور على محتوى مفصل للدرس في المنهج")
-                    elif search_status == "found":
-                        st.success("✅ تم العثور على معلومات ذات صلة في المنهج")
-                    elif search_status == "not_found":
-                        st.info("ℹ️ لم يتم العثور على معلومات في المنهج، تم الاعتماد على المعرفة العامة")
-                   
-                    # إضافة إجابة المساعد للمحادثة
-                    add_message("assistant", "", **response_data)
+                        except Exception as e:
+                            st.error(f"❌ خطأ في عرض الرسم: {e}")
                    
-                except Exception as e:
-                    error_msg = f"❌ حدث خطأ: {e}"
-                    st.error(error_msg)
-                    add_message("assistant", error_msg)
+                    with col2:
+                        st.write("💾 **تحميل:**")
+                        st.download_button(
+                            label="⬇️ SVG",
+                            data=response_data['svg_code'],
+                            file_name=f"رسم_توضيحي_{datetime.now().strftime('%Y%m%d_%H%M%S')}.svg",
+                            mime="image/svg+xml",
+                            key=f"download_svg_new"
+                        )
+                        
+                        # عرض معلومات قرار الرسم
+                        if response_data.get('drawing_decision'):
+                            st.caption(f"🧠 **قرار الرسم:** {response_data['drawing_decision']}")
+                        
+                        if response_data.get('drawing_confidence', 0) > 0:
+                            confidence = response_data['drawing_confidence']
+                            st.caption(f"📊 **ثقة القرار:** {confidence}%")
+                else:
+                    # عرض سبب عدم الرسم إذا لم يكن هناك رسم
+                    if response_data.get('drawing_decision'):
+                        st.caption(f"💭 **لماذا لا يوجد رسم؟** {response_data['drawing_decision']}")
+                
+                # عرض حالة البحث
+                search_status = response_data.get('search_status', 'unknown')
+                if search_status == "found_specific_lesson":
+                    st.success("✅ تم العثور على محتوى الدرس في المنهج الدراسي")
+                elif search_status == "lesson_not_found":
+                    st.warning("⚠️ لم يتم العثور على محتوى مفصل للدرس في المنهج")
+                elif search_status == "found":
+                    st.success("✅ تم العثور على معلومات ذات صلة في المنهج")
+                elif search_status == "not_found":
+                    st.info("ℹ️ لم يتم العثور على معلومات في المنهج، تم الاعتماد على المعرفة العامة")
+                elif search_status == "cached":
+                    st.caption("⚡ إجابة محفوظة لسؤال مشابه")
+               
+                # إضافة إجابة المساعد للمحادثة
+                add_message("assistant", "", **response_data)
+               
+            except Exception as e:
+                error_msg = f"❌ حدث خطأ: {e}"
+                st.error(error_msg)
+                add_message("assistant", error_msg)
 
 if __name__ == "__main__":
     main()# app.py - التطبيق الرئيسي للمعلم الذكي (مع ميزة Chat History Memory والنظام الذكي للرسم وفهرس المواد التفاعلي)
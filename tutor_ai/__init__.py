@@ -4,23 +4,31 @@
 Smart Saudi Tutor - Enhanced AI Teaching Module
 """
 
+import importlib
+
 __version__ = "3.1.0"
 __author__ = "Smart Saudi Tutor Team"
 
-# استيراد المكونات الرئيسية
-try:
-    from .gemini_client import GeminiClientVertexAI
-    from .prompt_engineering import UnifiedPromptEngine
-    from .knowledge_base_manager import KnowledgeBaseManager
-    from .code_executor import save_svg_content_to_file
-    
-    __all__ = [
-        'GeminiClientVertexAI',
-        'UnifiedPromptEngine', 
-        'KnowledgeBaseManager',
-        'save_svg_content_to_file'
-    ]
-    
-except ImportError as e:
-    print(f"Warning: Could not import all tutor_ai components: {e}")
-    __all__ = []
+# المكونات الرئيسية تُستورد عند أول وصول فقط (PEP 562): استيراد tutor_ai.<وحدة> خفيفة
+# لا يحمّل Vertex AI و LangChain و Streamlit
+_LAZY_EXPORTS = {
+    'GeminiClientVertexAI': '.gemini_client',
+    'UnifiedPromptEngine': '.prompt_engineering',
+    'KnowledgeBaseManager': '.knowledge_base_manager',
+    'save_svg_content_to_file': '.code_executor',
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,52 @@
+# tutor_ai/arabic_normalizer.py
+# التشكيل (الحركات، التنوين، الشدة، السكون)، الألف الخنجرية وعلامات المصحف
+_DIACRITICS = (
+    [chr(code) for code in range(0x064B, 0x0660)] +
+    ["\u0670"] +
+    [chr(code) for code in range(0x06D6, 0x06EE)]
+)
+_TATWEEL = "\u0640"
+
+# توحيد الحروف: أشكال الألف -> ا، الألف المقصورة -> ي، التاء المربوطة -> ه
+_LETTER_MAP = {
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ٲ": "ا", "ٳ": "ا",
+    "ى": "ي", "ی": "ي",
+    "ة": "ه",
+}
+
+# الأرقام العربية المشرقية والفارسية -> أرقام غربية
+_DIGIT_MAP = {chr(0x0660 + i): str(i) for i in range(10)}
+_DIGIT_MAP.update({chr(0x06F0 + i): str(i) for i in range(10)})
+
+_TRANSLATION_TABLE = str.maketrans({
+    **{char: None for char in _DIACRITICS},
+    _TATWEEL: None,
+    **_LETTER_MAP,
+    **_DIGIT_MAP,
+})
+
+
+def normalize_arabic(text: str) -> str:
+    """تطبيع النص العربي: حذف التشكيل والتطويل، توحيد الألف/الياء/التاء المربوطة، وتحويل الأرقام
+
+    لا يغيّر المسافات أو الأسطر (بنية المستند تبقى كما هي للتقسيم).
+    """
+    if not text:
+        return text
+    return text.translate(_TRANSLATION_TABLE)
+
+
+if __name__ == "__main__":
+    samples = {
+        "أُسْرَتِي": "اسرتي",
+        "إِلَى الْمَدْرَسَةِ": "الي المدرسه",
+        "آيَةُ الكُرْسِيِّ": "ايه الكرسي",
+        "مـــدرســـة": "مدرسه",
+        "الدرس ٣ صفحة ۱۲": "الدرس 3 صفحه 12",
+        "ٱلْحَمْدُ لِلَّهِ": "الحمد لله",
+        "Lesson 1": "Lesson 1",
+    }
+    for source, expected in samples.items():
+        result = normalize_arabic(source)
+        assert result == expected, (source, result, expected)
+    print(f"تم التحقق من {len(samples)} أمثلة")
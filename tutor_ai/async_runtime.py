@@ -0,0 +1,49 @@
+# tutor_ai/async_runtime.py
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Optional
+
+
+# عدد الخيوط للخطوات المحجوبة (تضمين، بحث ChromaDB، تصنيف) التي تُشغّل عبر asyncio.to_thread
+ASYNC_PIPELINE_WORKERS = int(os.getenv("ASYNC_PIPELINE_WORKERS", "16"))
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """حلقة أحداث واحدة للعملية تعمل في خيط خلفي
+
+    حلقة دائمة (بدلاً من asyncio.run لكل سؤال) لأن asyncio.run ينتظر انتهاء كل خيوط to_thread حتى بعد
+    انتهاء مهلتها، فتضيع فائدة مهلة كل مرحلة.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=ASYNC_PIPELINE_WORKERS,
+                                                         thread_name_prefix="async_pipeline"))
+            threading.Thread(target=loop.run_forever, name="async_pipeline_loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def run_coroutine(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """تشغيل coroutine على الحلقة المشتركة من كود متزامن (مثل سكربت Streamlit) وانتظار نتيجتها
+
+    عند تجاوز timeout تُلغى الـ coroutine (مع مهامها الفرعية) ويُرفع TimeoutError.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise TimeoutError(f"تجاوزت المعالجة غير المتزامنة المهلة ({timeout} ث)")
+
+
+def submit_blocking(fn: Callable[..., Any], *args: Any) -> "Future[Any]":
+    """تشغيل دالة محجوبة (مثل تضمين) على خيوط الحلقة المشتركة بدون انتظارها، من أي خيط"""
+    return asyncio.run_coroutine_threadsafe(asyncio.to_thread(fn, *args), get_event_loop())
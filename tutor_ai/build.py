@@ -0,0 +1,189 @@
+# tutor_ai/build.py
+"""
+بناء قواعد المعرفة خارج التطبيق (قبل النشر أو بشكل دوري):
+
+    python -m tutor_ai.build --project <GCP_PROJECT_ID> [--workers 4] [--grades grade_1 grade_2] [--report build_report.json]
+
+كل مجموعة (صف، مادة) تُبنى في عملية مستقلة؛ المجموعات المحدثة حسب ملفات الحالة تُتخطى.
+مع CHROMA_STORE_LAYOUT=shared تشترك كل المجموعات في قاعدة ChromaDB واحدة لا تدعم الكتابة من عدة
+عمليات، لذلك يُبنى بعملية واحدة مهما كانت قيمة --workers.
+التقرير يُطبع على stdout بصيغة JSON (السجلات على stderr)، ورمز الخروج: 0 نجاح، 1 فشل بناء مجموعة، 2 خطأ في الإعداد.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from .chroma_store import DEFAULT_STORE_LAYOUT, SHARED_LAYOUT
+from .embedding_pipeline import DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_MINUTE
+from .embedding_provider import get_embedding_provider
+from .grade_subjects import GRADE_SUBJECTS, SUBJECT_FOLDERS
+from .kb_status import check_collection_status, collection_name_for
+from .knowledge_base_manager import (
+    CHROMA_DB_PARENT_DIRECTORY, EMBEDDING_CACHE_PATH, EMBEDDING_PROVIDER_STATE_PATH,
+    KNOWLEDGE_BASE_PARENT_DOCS_DIR, RAG_REQUIREMENTS_MET, KnowledgeBaseManager
+)
+
+
+EXIT_OK = 0
+EXIT_BUILD_FAILED = 1
+EXIT_SETUP_ERROR = 2
+
+
+def plan_builds(grades: Optional[List[str]] = None, subjects: Optional[List[str]] = None,
+                force: bool = False, refresh_all: bool = False) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """المجموعات المطلوب بناؤها والمتخطاة (بدون مستندات أو محدثة حسب ملف الحالة)"""
+    tasks: List[Dict[str, Any]] = []
+    skipped: List[Dict[str, Any]] = []
+    for grade_key, grade_info in GRADE_SUBJECTS.items():
+        if grades and grade_key not in grades:
+            continue
+        for subject_key in grade_info['subjects']:
+            if subjects and subject_key not in subjects:
+                continue
+            subject_folder = SUBJECT_FOLDERS.get(subject_key, subject_key)
+            collection_name = collection_name_for(grade_key, subject_folder)
+            entry = {"grade": grade_key, "subject": subject_key, "collection": collection_name}
+            docs_path = os.path.join(KNOWLEDGE_BASE_PARENT_DOCS_DIR, grade_key, subject_folder)
+            if not os.path.isdir(docs_path):
+                skipped.append({**entry, "status": "no_docs"})
+                continue
+            status = check_collection_status(CHROMA_DB_PARENT_DIRECTORY, docs_path, collection_name)
+            if not force and not refresh_all and status["built"] and not status["stale"]:
+                skipped.append({**entry, "status": "up_to_date", "chunk_count": status.get("chunk_count", 0)})
+                continue
+            tasks.append({**entry, "subject_folder": subject_folder})
+    return tasks, skipped
+
+
+def build_collection(task: Dict[str, Any]) -> Dict[str, Any]:
+    """بناء مجموعة واحدة (دالة على مستوى الوحدة لتمريرها إلى ProcessPoolExecutor)"""
+    started_at = time.perf_counter()
+    result = {key: task[key] for key in ("grade", "subject", "collection")}
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            manager = KnowledgeBaseManager(
+                grade_folder_name=task["grade"],
+                subject_folder_name=task["subject_folder"],
+                project_id=task["project_id"],
+                location=task["location"],
+                force_recreate=task["force"],
+                embedding_concurrency=task["embedding_concurrency"],
+                embedding_requests_per_minute=task["requests_per_minute"],
+                loader_workers=task["loader_workers"]
+            )
+            built = manager.embedding_function is not None and manager.build_knowledge_base()
+            status = check_collection_status(CHROMA_DB_PARENT_DIRECTORY, manager.docs_path, manager.collection_name)
+            result.update(
+                status="built" if built else "failed",
+                chunk_count=status.get("chunk_count", 0),
+                embedding_model=manager.current_model
+            )
+            if not built:
+                result["error"] = "فشل تهيئة التضمين أو ChromaDB أو عملية البناء (راجع السجل)"
+        except Exception as e:
+            result.update(status="failed", error=f"{type(e).__name__}: {e}")
+    result["seconds"] = round(time.perf_counter() - started_at, 2)
+    return result
+
+
+def run_builds(tasks: List[Dict[str, Any]], workers: int) -> List[Dict[str, Any]]:
+    """تشغيل البناء بالتوازي (عملية لكل مجموعة، بحد أقصى workers عملية في الوقت نفسه)"""
+    if workers <= 1 or len(tasks) <= 1:
+        return [build_collection(task) for task in tasks]
+    results = []
+    # spawn: عمليات نظيفة بدون حالة gRPC/Vertex الموروثة من العملية الرئيسية
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {executor.submit(build_collection, task): task for task in tasks}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {key: task[key] for key in ("grade", "subject", "collection")}
+                result.update(status="failed", error=f"{type(e).__name__}: {e}")
+            print(f"BUILD INFO: {result['collection']}: {result['status']} ({result.get('seconds', 0)} ث)", file=sys.stderr)
+            results.append(result)
+    return sorted(results, key=lambda item: item["collection"])
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m tutor_ai.build", description="بناء أو تحديث قواعد المعرفة لجميع الصفوف والمواد")
+    parser.add_argument("--project", default=os.getenv("GCP_PROJECT_ID"), help="معرف مشروع Google Cloud (GCP_PROJECT_ID)")
+    parser.add_argument("--location", default=os.getenv("GCP_LOCATION", "us-central1"), help="منطقة Vertex AI (GCP_LOCATION)")
+    parser.add_argument("--grades", nargs="*", help="الصفوف المطلوبة فقط (مثل grade_1)")
+    parser.add_argument("--subjects", nargs="*", help="المواد المطلوبة فقط (مثل math science)")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="عدد المجموعات المبنية بالتوازي (عملية واحدة دائماً مع CHROMA_STORE_LAYOUT=shared)")
+    parser.add_argument("--embedding-concurrency", type=int, default=DEFAULT_MAX_WORKERS,
+                        help="الحد الإجمالي لطلبات التضمين المتزامنة (يُقسم على العمليات)")
+    parser.add_argument("--requests-per-minute", type=float, default=DEFAULT_REQUESTS_PER_MINUTE,
+                        help="الحد الإجمالي لمعدل طلبات التضمين (يُقسم على العمليات)")
+    parser.add_argument("--force", action="store_true", help="حذف المجموعات وإعادة بنائها بالكامل")
+    parser.add_argument("--refresh-all", action="store_true", help="بناء تزايدي لكل المجموعات حتى المحدثة حسب ملف الحالة")
+    parser.add_argument("--report", help="مسار ملف JSON لحفظ التقرير")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    started_at = time.perf_counter()
+    report: Dict[str, Any] = {"success": False, "project_id": args.project, "collections": []}
+
+    if not RAG_REQUIREMENTS_MET:
+        report["error"] = "متطلبات RAG غير متوفرة (LangChain / ChromaDB / Vertex AI)"
+    elif not args.project:
+        report["error"] = "لم يُحدد مشروع Google Cloud (--project أو GCP_PROJECT_ID)"
+
+    tasks, skipped = plan_builds(args.grades, args.subjects, args.force, args.refresh_all)
+    workers = max(1, min(args.workers, len(tasks) or 1))
+    if workers > 1 and DEFAULT_STORE_LAYOUT == SHARED_LAYOUT:
+        # PersistentClient واحد لكل المجموعات: الكتابة المتزامنة من عدة عمليات قد تفسد قاعدة SQLite
+        print(f"BUILD WARNING: CHROMA_STORE_LAYOUT={SHARED_LAYOUT} لا يدعم البناء المتوازي، سيتم البناء بعملية واحدة",
+              file=sys.stderr)
+        workers = 1
+
+    if "error" not in report and tasks:
+        # فحص نموذج التضمين مرة واحدة هنا؛ العمليات العاملة تقرأ النموذج المحفوظ بدون فحص
+        with contextlib.redirect_stdout(sys.stderr):
+            provider = get_embedding_provider(args.project, args.location,
+                                              state_path=EMBEDDING_PROVIDER_STATE_PATH, cache_path=EMBEDDING_CACHE_PATH)
+            if provider.get_client() is None:
+                report["error"] = "لا يتوفر نموذج تضمين يعمل"
+
+    if "error" not in report:
+        for task in tasks:
+            task.update(
+                project_id=args.project,
+                location=args.location,
+                force=args.force,
+                embedding_concurrency=max(1, args.embedding_concurrency // workers),
+                requests_per_minute=args.requests_per_minute / workers,
+                loader_workers=max(1, (os.cpu_count() or 1) // workers)
+            )
+        print(f"BUILD INFO: {len(tasks)} مجموعة للبناء، {len(skipped)} متخطاة، {workers} عملية", file=sys.stderr)
+        results = run_builds(tasks, workers)
+        report["collections"] = results + skipped
+        report["built"] = sum(1 for item in results if item["status"] == "built")
+        report["failed"] = sum(1 for item in results if item["status"] == "failed")
+        report["skipped"] = len(skipped)
+        report["success"] = report["failed"] == 0
+    report["workers"] = workers
+    report["seconds"] = round(time.perf_counter() - started_at, 2)
+
+    output = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    if "error" in report:
+        return EXIT_SETUP_ERROR
+    return EXIT_OK if report["success"] else EXIT_BUILD_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
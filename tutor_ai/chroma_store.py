@@ -0,0 +1,158 @@
+# tutor_ai/chroma_store.py
+import importlib.util
+import os
+import threading
+from typing import Any, Dict
+
+from .kb_manifest import manifest_path_for
+
+# chromadb تُستورد عند فتح أول عميل فقط
+CHROMADB_AVAILABLE = importlib.util.find_spec("chromadb") is not None
+
+
+# "per_collection": مجلد ChromaDB مستقل لكل مجموعة (التخطيط الأصلي)
+# "shared": مخزن واحد (اتصال SQLite واحد) تستضيف فيه جميع مجموعات الصفوف والمواد
+PER_COLLECTION_LAYOUT = "per_collection"
+SHARED_LAYOUT = "shared"
+DEFAULT_STORE_LAYOUT = os.getenv("CHROMA_STORE_LAYOUT", PER_COLLECTION_LAYOUT)
+SHARED_STORE_DIRNAME = "shared_store"
+
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+open_stats = {"clients_opened": 0, "client_reuses": 0}
+
+
+def vector_store_path_for(chroma_parent_dir: str, collection_name: str, layout: str = DEFAULT_STORE_LAYOUT) -> str:
+    """مجلد ChromaDB الذي تُخزن فيه المجموعة حسب التخطيط"""
+    if layout == SHARED_LAYOUT:
+        return os.path.join(chroma_parent_dir, SHARED_STORE_DIRNAME)
+    return os.path.join(chroma_parent_dir, collection_name)
+
+
+def get_chroma_client(path: str) -> Any:
+    """عميل ChromaDB واحد لكل مجلد في العملية (اتصال SQLite واحد مهما كان عدد المجموعات المفتوحة)"""
+    key = os.path.abspath(path)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            open_stats["client_reuses"] += 1
+            return client
+        import chromadb
+
+        os.makedirs(key, exist_ok=True)
+        client = chromadb.PersistentClient(path=key)
+        _clients[key] = client
+        open_stats["clients_opened"] += 1
+        return client
+
+
+def release_chroma_client(path: str) -> None:
+    """نسيان العميل المخزن لمجلد (قبل حذف المجلد من القرص)"""
+    with _clients_lock:
+        _clients.pop(os.path.abspath(path), None)
+
+
+def close_chroma_client(path: str) -> None:
+    """إغلاق عميل مجلد وتحرير فهارس HNSW المحملة في الذاكرة (يُعاد فتحه عند الطلب التالي)"""
+    with _clients_lock:
+        client = _clients.pop(os.path.abspath(path), None)
+    if client is None:
+        return
+    try:
+        # chromadb يحتفظ بنظام مشترك لكل مسار في SharedSystemClient: إيقافه يغلق SQLite ويحرر الفهارس
+        system = getattr(client, "_system", None)
+        if system is not None:
+            system.stop()
+        registry = getattr(type(client), "_identifier_to_system", None)
+        if isinstance(registry, dict):
+            registry.pop(getattr(client, "_identifier", None), None)
+    except Exception as e:
+        print(f"KB_MANAGER WARNING: تعذر إغلاق عميل ChromaDB في {path}: {e}")
+
+
+def delete_stored_collection(path: str, collection_name: str) -> bool:
+    """حذف مجموعة واحدة من مخزن مشترك دون المساس بالمجموعات الأخرى"""
+    if not os.path.isdir(path):
+        return False
+    try:
+        get_chroma_client(path).delete_collection(collection_name)
+        return True
+    except Exception as e:
+        print(f"KB_MANAGER WARNING: تعذر حذف المجموعة '{collection_name}' من {path}: {e}")
+        return False
+
+
+def stored_collection_exists(chroma_parent_dir: str, collection_name: str,
+                             layout: str = DEFAULT_STORE_LAYOUT) -> bool:
+    """هل بُنيت المجموعة سابقاً؟ - بدون فتح ChromaDB
+
+    في التخطيط المشترك يدل سجل البناء (<collection>.manifest.json) على المجموعة لأن المجلد مشترك.
+    """
+    if layout == SHARED_LAYOUT:
+        return os.path.exists(manifest_path_for(chroma_parent_dir, collection_name))
+    store_path = vector_store_path_for(chroma_parent_dir, collection_name, layout)
+    if not os.path.isdir(store_path):
+        return False
+    for _, _, files in os.walk(store_path):
+        if files:
+            return True
+    return False
+
+
+def _open_all(layout: str, parent_dir: str, collection_count: int) -> None:
+    """(عملية فرعية للقياس) فتح جميع المجموعات وطباعة الزمن والذاكرة كـ JSON"""
+    import json
+    import resource
+    import time
+
+    started = time.perf_counter()
+    total = 0
+    for index in range(collection_count):
+        name = f"bench_{index}_coll"
+        client = get_chroma_client(vector_store_path_for(parent_dir, name, layout))
+        total += client.get_or_create_collection(name).count()
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "layout": layout,
+        "open_seconds": round(elapsed, 3),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "documents": total,
+        **open_stats
+    }))
+
+
+if __name__ == "__main__":
+    # مقارنة التخطيطين: python -m tutor_ai.chroma_store [عدد_المجموعات] [أجزاء_لكل_مجموعة]
+    import json
+    import random
+    import subprocess
+    import sys
+    import tempfile
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--open":
+        _open_all(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        sys.exit(0)
+
+    collections = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    chunks_per_collection = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for layout in (PER_COLLECTION_LAYOUT, SHARED_LAYOUT):
+            parent_dir = os.path.join(tmp_dir, layout)
+            for index in range(collections):
+                name = f"bench_{index}_coll"
+                collection = get_chroma_client(vector_store_path_for(parent_dir, name, layout)).get_or_create_collection(name)
+                ids = [f"{name}-{i}" for i in range(chunks_per_collection)]
+                collection.add(
+                    ids=ids,
+                    documents=[f"جزء تجريبي رقم {i}" for i in range(chunks_per_collection)],
+                    embeddings=[[rng.random() for _ in range(768)] for _ in ids]
+                )
+        print(f"{collections} مجموعة × {chunks_per_collection} جزء (أبعاد 768)، كل تخطيط في عملية جديدة:")
+        for layout in (PER_COLLECTION_LAYOUT, SHARED_LAYOUT):
+            output = subprocess.run(
+                [sys.executable, "-m", "tutor_ai.chroma_store", "--open", layout,
+                 os.path.join(tmp_dir, layout), str(collections)],
+                capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+            print(json.loads(output))
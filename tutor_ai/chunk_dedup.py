@@ -0,0 +1,200 @@
+# tutor_ai/chunk_dedup.py
+import json
+import os
+import random
+import re
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+# حد التشابه (تقدير Jaccard) الذي يُعتبر عنده الجزءان متكررين (0 = تعطيل إزالة التكرار)
+DEFAULT_DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD", "0.85"))
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16                       # 16 شريط × 4 صفوف: أي زوج بتشابه ≥ 0.5 تقريباً يصبح مرشحاً
+SHINGLE_SIZE = 3                     # مقاطع من 3 كلمات متتالية
+SIGNATURES_SUFFIX = ".minhash.json"
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_SEED = 1_000_003
+_rng = random.Random(_SEED)
+# معاملات التبديلات ثابتة حتى تبقى التواقيع المحفوظة صالحة بين العمليات والتشغيلات
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+_ROWS_PER_BAND = NUM_PERMUTATIONS // LSH_BANDS
+_WORD_RE = re.compile(r"\w+")
+
+if NUMPY_AVAILABLE:
+    _PERM_A = np.array([a for a, _ in _PERMUTATIONS], dtype=np.uint64)[:, None]
+    _PERM_B = np.array([b for _, b in _PERMUTATIONS], dtype=np.uint64)[:, None]
+
+
+Signature = Tuple[int, ...]
+
+
+def signatures_path_for(chroma_parent_dir: str, collection_name: str) -> str:
+    """مسار ملف تواقيع MinHash المجاور لسجل البناء"""
+    return os.path.join(chroma_parent_dir, f"{collection_name}{SIGNATURES_SUFFIX}")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    """مقاطع الكلمات المتتالية للنص (النص القصير جداً يصبح مقطعاً واحداً)"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash_signature(text: str) -> Optional[Signature]:
+    """توقيع MinHash للنص (None إذا لم يحتوِ على كلمات)"""
+    hashes = [zlib.crc32(shingle.encode("utf-8")) & _MERSENNE_PRIME for shingle in shingles(text)]
+    if not hashes:
+        return None
+    if NUMPY_AVAILABLE:
+        values = np.array(hashes, dtype=np.uint64)[None, :]
+        return tuple(int(v) for v in ((_PERM_A * values + _PERM_B) % _MERSENNE_PRIME).min(axis=1))
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def estimate_similarity(first: Signature, second: Signature) -> float:
+    """تقدير تشابه Jaccard من نسبة المواضع المتطابقة في التوقيعين"""
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_PERMUTATIONS
+
+
+def _band_keys(signature: Signature) -> List[Tuple[int, Signature]]:
+    return [(band, signature[band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND]) for band in range(LSH_BANDS)]
+
+
+class SignatureStore:
+    """تواقيع MinHash للأجزاء المخزنة في مجموعة واحدة (ملف JSON بجانب سجل البناء)"""
+
+    def __init__(self, path: str, signatures: Optional[Dict[str, Signature]] = None):
+        self.path = path
+        self.signatures: Dict[str, Signature] = signatures or {}
+
+    @classmethod
+    def load(cls, path: str) -> "SignatureStore":
+        if not os.path.exists(path):
+            return cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("num_permutations") != NUM_PERMUTATIONS or data.get("shingle_size") != SHINGLE_SIZE:
+                print(f"DEDUP INFO: إعدادات التواقيع تغيرت في {path}. سيتم حسابها من جديد.")
+                return cls(path)
+            signatures = {chunk_id: tuple(values) for chunk_id, values in data.get("signatures", {}).items()}
+            return cls(path, signatures)
+        except Exception as e:
+            print(f"DEDUP WARNING: تعذر قراءة التواقيع {path}: {e}. سيتم حسابها من جديد.")
+            return cls(path)
+
+    def save(self, keep_ids: Iterable[str]) -> None:
+        """حفظ تواقيع الأجزاء الموجودة فقط (حذف تواقيع الأجزاء المحذوفة) بشكل ذري"""
+        keep = set(keep_ids)
+        data = {
+            "num_permutations": NUM_PERMUTATIONS,
+            "shingle_size": SHINGLE_SIZE,
+            "signatures": {chunk_id: list(sig) for chunk_id, sig in self.signatures.items() if chunk_id in keep}
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def delete(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.signatures = {}
+
+
+class ChunkDeduplicator:
+    """فهرس LSH في الذاكرة: يعيد لكل جزء معرف الجزء المحتفظ به (نفسه أو نسخة سابقة شبه مطابقة)"""
+
+    def __init__(self, threshold: float = DEFAULT_DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self.signatures: Dict[str, Signature] = {}
+        self._buckets: Dict[Tuple[int, Signature], List[str]] = {}
+        self.report = {
+            "threshold": threshold,
+            "chunks_examined": 0,
+            "exact_duplicates": 0,
+            "near_duplicates": 0,
+            "chunks_removed": 0,
+            "bytes_removed": 0,
+            "seconds": 0.0
+        }
+
+    def add(self, chunk_id: str, signature: Optional[Signature]) -> None:
+        """إضافة جزء محتفظ به إلى الفهرس"""
+        if signature is None or chunk_id in self.signatures:
+            return
+        self.signatures[chunk_id] = signature
+        for key in _band_keys(signature):
+            self._buckets.setdefault(key, []).append(chunk_id)
+
+    def find_duplicate(self, signature: Signature) -> Tuple[Optional[str], float]:
+        """أقرب جزء في الفهرس بتشابه ≥ الحد (أو None)"""
+        candidates = {chunk_id for key in _band_keys(signature) for chunk_id in self._buckets.get(key, ())}
+        best_id, best_score = None, 0.0
+        for chunk_id in sorted(candidates):
+            score = estimate_similarity(signature, self.signatures[chunk_id])
+            if score > best_score:
+                best_id, best_score = chunk_id, score
+        if best_score >= self.threshold:
+            return best_id, best_score
+        return None, best_score
+
+    def resolve(self, chunk_id: str, text: str) -> str:
+        """معرف الجزء الذي سيُخزن بدلاً من هذا الجزء (نفسه إذا لم يكن مكرراً)، مع تحديث التقرير"""
+        started_at = time.perf_counter()
+        self.report["chunks_examined"] += 1
+        if chunk_id in self.signatures:
+            self._record_removed("exact_duplicates", text, started_at)
+            return chunk_id
+
+        signature = minhash_signature(text)
+        duplicate_id = self.find_duplicate(signature)[0] if signature is not None else None
+        if duplicate_id is None:
+            self.add(chunk_id, signature)
+            self.report["seconds"] += time.perf_counter() - started_at
+            return chunk_id
+        self._record_removed("near_duplicates", text, started_at)
+        return duplicate_id
+
+    def _record_removed(self, kind: str, text: str, started_at: float) -> None:
+        self.report[kind] += 1
+        self.report["chunks_removed"] += 1
+        self.report["bytes_removed"] += len(text.encode("utf-8"))
+        self.report["seconds"] += time.perf_counter() - started_at
+
+
+if __name__ == "__main__":
+    # عرض مصغّر: جزء أصلي، نسخة بتعديل بسيط، وجزء مختلف
+    base = " ".join(f"الكلمة{i} في الدرس الأول عن الجمع والطرح" for i in range(40))
+    edited = base.replace("الكلمة7 ", "الكلمه7 ").replace("الكلمة30 ", "")
+    other = " ".join(f"موضوع{i} النباتات وأجزاؤها الجذر والساق" for i in range(40))
+    print(f"التشابه المقدّر (أصلي/معدّل): {estimate_similarity(minhash_signature(base), minhash_signature(edited)):.2f}")
+    print(f"التشابه المقدّر (أصلي/مختلف): {estimate_similarity(minhash_signature(base), minhash_signature(other)):.2f}")
+
+    deduplicator = ChunkDeduplicator(threshold=0.85)
+    assert deduplicator.resolve("a", base) == "a"
+    assert deduplicator.resolve("b", edited) == "a"
+    assert deduplicator.resolve("c", other) == "c"
+    assert deduplicator.resolve("a", base) == "a"
+
+    # قياس السرعة على 2000 جزء بطول ~1000 حرف
+    samples = [" ".join(f"نص{(i * 7 + j) % 5000} كلمة{j}" for j in range(90)) for i in range(2000)]
+    started = time.perf_counter()
+    bench = ChunkDeduplicator(threshold=0.85)
+    for index, sample in enumerate(samples):
+        bench.resolve(str(index), sample)
+    elapsed = time.perf_counter() - started
+    print(f"{len(samples)} جزء خلال {elapsed:.2f} ثانية (numpy: {NUMPY_AVAILABLE})")
+    print({**deduplicator.report, "seconds": round(deduplicator.report["seconds"], 4)})
@@ -0,0 +1,167 @@
+# tutor_ai/curriculum_chunker.py
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .arabic_normalizer import normalize_arabic
+
+
+# الأنماط مكتوبة بالصيغة المطبّعة (normalize_arabic): تُطابق على نسخة مطبّعة من كل سطر
+# بينما يبقى نص الأجزاء كما هو في الكتاب (بالتشكيل)
+_ORDINALS = {
+    'الاول': '1', 'الاولي': '1', 'الثاني': '2', 'الثانيه': '2', 'الثالث': '3', 'الثالثه': '3',
+    'الرابع': '4', 'الرابعه': '4', 'الخامس': '5', 'الخامسه': '5', 'السادس': '6', 'السادسه': '6',
+    'السابع': '7', 'السابعه': '7', 'الثامن': '8', 'الثامنه': '8', 'التاسع': '9', 'التاسعه': '9',
+    'العاشر': '10', 'العاشره': '10',
+}
+_NUMBER = r'(\d+|' + '|'.join(sorted(_ORDINALS, key=len, reverse=True)) + r')(?!\w)'
+
+# "الوحدة الأولى" / "الفصل 4" / "Unit 2" في بداية سطر عنوان ("الفصل الدراسي" لا يطابق)
+_UNIT_RE = re.compile(r'^(?:ال)?(?:وحده|فصل|unit|chapter)\s*(?:رقم\s*)?' + _NUMBER, re.IGNORECASE)
+# "الدرس 3" / "الدرس 1-3" (الوحدة 1، الدرس 3) / "Lesson 2"
+_LESSON_RE = re.compile(r'^(?:ال)?(?:درس|lesson)\s*(?:رقم\s*)?(?:(\d+)\s*[-–]\s*)?' + _NUMBER, re.IGNORECASE)
+_MARKDOWN_HEADING_RE = re.compile(r'^#{1,6}\s+')
+
+# أسطر العناوين قصيرة؛ الإشارات داخل الفقرات ("راجع الدرس 1-1") لا تغيّر الموضع
+MAX_HEADING_LENGTH = 80
+
+
+def section_number(text: str) -> str:
+    """رقم الوحدة أو الدرس من نص مثل "الوحدة 1" أو "الدرس الثالث" ("" إذا لم يوجد)"""
+    line = _clean_heading(normalize_arabic(text or ""))
+    match = _UNIT_RE.match(line) or _LESSON_RE.match(line)
+    return _to_number(match.group(match.lastindex)) if match else ""
+
+
+def lesson_metadata_filter(unit_key: str = "", lesson_key: str = "") -> Optional[Dict[str, Any]]:
+    """فلتر ChromaDB (where) لأجزاء وحدة/درس محدد حسب مفاتيح فهرس المنهج"""
+    conditions = []
+    unit = section_number(unit_key)
+    lesson = section_number(lesson_key)
+    if unit:
+        conditions.append({"unit": unit})
+    if lesson:
+        conditions.append({"lesson": lesson})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def _to_number(value: str) -> str:
+    return _ORDINALS.get(value, str(int(value)) if value.isdigit() else value)
+
+
+def _clean_heading(line: str) -> str:
+    """إزالة علامات Markdown حول سطر العنوان (# و **)"""
+    line = _MARKDOWN_HEADING_RE.sub("", line.strip())
+    return line.strip("*_ ").strip()
+
+
+class _Block:
+    __slots__ = ("unit", "lesson", "heading", "lines")
+
+    def __init__(self, unit: str, lesson: str, heading: str):
+        self.unit = unit
+        self.lesson = lesson
+        self.heading = heading
+        self.lines: List[str] = []
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines).strip()
+
+
+class CurriculumChunker:
+    """تقسيم كتب المنهج حسب بنيتها: عناوين Markdown، الوحدة والدرس
+
+    الجزء لا يتجاوز حدود الدرس أبداً؛ الأقسام الصغيرة المتتالية في الدرس نفسه تُدمج حتى chunk_size،
+    والقسم الأكبر من chunk_size يُقسم بالمقسّم العادي (split_text) مع التداخل المعتاد.
+    """
+
+    def __init__(self, split_text: Callable[[str], List[str]], chunk_size: int = 1000):
+        self.split_text = split_text
+        self.chunk_size = chunk_size
+
+    def _blocks(self, text: str) -> List[_Block]:
+        """تقسيم النص إلى كتل تبدأ عند كل عنوان، مع تتبع الوحدة والدرس الحاليين"""
+        unit, lesson = "", ""
+        blocks = [_Block(unit, lesson, "")]
+        for line in text.splitlines():
+            is_markdown_heading = _MARKDOWN_HEADING_RE.match(line) is not None
+            heading = _clean_heading(line)
+            unit_match = lesson_match = None
+            if heading and len(heading) <= MAX_HEADING_LENGTH:
+                normalized_heading = normalize_arabic(heading)
+                unit_match = _UNIT_RE.match(normalized_heading)
+                lesson_match = None if unit_match else _LESSON_RE.match(normalized_heading)
+
+            if unit_match:
+                # ترويسات الصفحات تكرر اسم الوحدة داخل الدرس: تغيير الوحدة فقط يبدأ درساً جديداً
+                new_unit = _to_number(unit_match.group(1))
+                if new_unit != unit:
+                    unit, lesson = new_unit, ""
+            elif lesson_match:
+                lesson = _to_number(lesson_match.group(2))
+                if lesson_match.group(1):
+                    lesson_unit = str(int(lesson_match.group(1)))
+                    # "الدرس 6-1" داخل الوحدة 1 رقم معكوس بسبب اتجاه النص
+                    if unit and lesson_unit != unit and lesson == unit:
+                        lesson_unit, lesson = unit, lesson_unit
+                    unit = lesson_unit
+
+            if unit_match or lesson_match or is_markdown_heading:
+                blocks.append(_Block(unit, lesson, heading[:MAX_HEADING_LENGTH]))
+            blocks[-1].lines.append(line)
+        return [block for block in blocks if block.text]
+
+    def split(self, text: str, metadata: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        """تقسيم مستند واحد إلى (نص، بيانات وصفية) مع unit / lesson / section لكل جزء"""
+        chunks: List[Tuple[str, Dict[str, Any]]] = []
+        pending: List[_Block] = []
+
+        def flush() -> None:
+            if pending:
+                chunks.append(("\n\n".join(block.text for block in pending), self._metadata(metadata, pending[0])))
+                pending.clear()
+
+        for block in self._blocks(text):
+            block_text = block.text
+            if len(block_text) > self.chunk_size:
+                flush()
+                for piece in self.split_text(block_text):
+                    chunks.append((piece, self._metadata(metadata, block)))
+                continue
+            same_section = pending and (pending[0].unit, pending[0].lesson) == (block.unit, block.lesson)
+            pending_size = sum(len(item.text) + 2 for item in pending)
+            if not same_section or pending_size + len(block_text) > self.chunk_size:
+                flush()
+            pending.append(block)
+        flush()
+        return chunks
+
+    @staticmethod
+    def _metadata(metadata: Dict[str, Any], block: _Block) -> Dict[str, Any]:
+        # قيم ChromaDB يجب أن تكون نصوصاً أو أرقاماً - "" تعني غير محدد
+        return {**metadata, "unit": block.unit, "lesson": block.lesson, "section": block.heading}
+
+
+if __name__ == "__main__":
+    import sys
+
+    # عرض التقسيم لملف: python -m tutor_ai.curriculum_chunker <ملف>
+    def naive_split(text: str, size: int = 1000, overlap: int = 200) -> List[str]:
+        return [text[start:start + size] for start in range(0, len(text), size - overlap)]
+
+    chunker = CurriculumChunker(naive_split)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            source_text = f.read()
+    else:
+        source_text = (
+            "# الْوَحْدَةُ الأولى: أسرتي\n\nمقدمة الوحدة\n\n## الدرس الأول\n\nنص الدرس الأول\n\n"
+            "**الدرس 1-2: المقارنة بين الأعداد**\n\nنص الدرس الثاني، راجع الدرس 1-1\n\n# Unit 2\n\n## Lesson 3\n\nEnglish text"
+        )
+    for chunk_text, chunk_metadata in chunker.split(source_text, {"file": "demo.md"}):
+        print(f"[unit={chunk_metadata['unit'] or '-'} lesson={chunk_metadata['lesson'] or '-'}] "
+              f"{chunk_metadata['section'][:40]!r}: {len(chunk_text)} حرف")
+    assert lesson_metadata_filter("الوحدة 1", "الدرس 3") == {"$and": [{"unit": "1"}, {"lesson": "3"}]}
+    assert section_number("الوحدة الأولى") == "1" and section_number("الفصل الدراسي الأول") == ""
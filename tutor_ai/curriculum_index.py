@@ -5,50 +5,78 @@
 # =============================================================================
 
 import json
+import os
 import re
+import threading
+import time
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
+
+# أنماط التعرف على طلبات الدروس (تُجمّع مرة واحدة عند تحميل الوحدة)
+LESSON_PATTERNS = [
+    r'الدرس\s*(الأول|الثاني|الثالث|الرابع|الخامس|السادس|السابع|الثامن|التاسع|العاشر)',
+    r'الدرس\s*(\d+|[١-٩])',
+    r'درس\s*(\d+|[١-٩])',
+    r'وحدة\s*(\d+|[١-٩])',
+    r'الوحدة\s*(الأولى|الثانية|الثالثة|الرابعة|الخامسة|السادسة)',
+    r'فصل\s*(\d+|[١-٩])',
+    r'الفصل\s*(الأول|الثاني|الثالث|الرابع|الخامس|السادس)'
+]
+_COMPILED_LESSON_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in LESSON_PATTERNS]
+
+# تحويل الأرقام العربية والكلمات إلى أرقام
+NUMBER_MAPPING = {
+    'الأول': '1', 'الثاني': '2', 'الثالث': '3', 'الرابع': '4', 'الخامس': '5',
+    'السادس': '6', 'السابع': '7', 'الثامن': '8', 'التاسع': '9', 'العاشر': '10',
+    'الأولى': '1', 'الثانية': '2', 'الثالثة': '3', 'الرابعة': '4', 'الخامسة': '5', 'السادسة': '6',
+    '١': '1', '٢': '2', '٣': '3', '٤': '4', '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9'
+}
+
+# مفاتيح الدروس في الفهرس: "الدرس 3" / "الدرس الثالث" / "Lesson 3"
+_LESSON_KEY_RE = re.compile(r'(?:الدرس|Lesson)\s*(\S+)', re.IGNORECASE)
+
+CURRICULUM_INDEX_PATHS = [
+    Path("curriculum_index.json"),
+    Path("data/curriculum_index.json"),
+    Path("tutor_ai/curriculum_index.json")
+]
+
+# أقل فاصل زمني بين فحوصات تعديل ملف الفهرس (ثوانٍ)
+RELOAD_CHECK_INTERVAL = float(os.getenv("CURRICULUM_INDEX_RELOAD_INTERVAL", "5"))
+
+
 class CurriculumIndex:
     """فهرس المنهج التفاعلي - لربط طلبات الطلاب بمحتوى المنهج المحدد"""
     
     def __init__(self):
-        # تحميل فهرس المنهج من ملف JSON
-        self.curriculum_data = self._load_curriculum_index()
-        
-        # أنماط التعرف على طلبات الدروس
-        self.lesson_patterns = [
-            r'الدرس\s*(الأول|الثاني|الثالث|الرابع|الخامس|السادس|السابع|الثامن|التاسع|العاشر)',
-            r'الدرس\s*(\d+|[١-٩])',
-            r'درس\s*(\d+|[١-٩])',
-            r'وحدة\s*(\d+|[١-٩])',
-            r'الوحدة\s*(الأولى|الثانية|الثالثة|الرابعة|الخامسة|السادسة)',
-            r'فصل\s*(\d+|[١-٩])',
-            r'الفصل\s*(الأول|الثاني|الثالث|الرابع|الخامس|السادس)'
-        ]
+        self.lesson_patterns = LESSON_PATTERNS
+        self.number_mapping = NUMBER_MAPPING
+        self.index_path: Optional[Path] = None
+        self._index_mtime: Optional[float] = None
+        self._last_reload_check = time.monotonic()
+        self._reload_lock = threading.Lock()
         
-        # تحويل الأرقام العربية والكلمات إلى أرقام
-        self.number_mapping = {
-            'الأول': '1', 'الثاني': '2', 'الثالث': '3', 'الرابع': '4', 'الخامس': '5',
-            'السادس': '6', 'السابع': '7', 'الثامن': '8', 'التاسع': '9', 'العاشر': '10',
-            'الأولى': '1', 'الثانية': '2', 'الثالثة': '3', 'الرابعة': '4', 'الخامسة': '5', 'السادسة': '6',
-            '١': '1', '٢': '2', '٣': '3', '٤': '4', '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9'
-        }
+        # تحميل فهرس المنهج من ملف JSON وبناء جدول البحث
+        self.curriculum_data = self._load_curriculum_index()
+        self.lesson_table = self._build_lesson_table(self.curriculum_data)
+
+    def _find_index_path(self) -> Optional[Path]:
+        for path in CURRICULUM_INDEX_PATHS:
+            if path.exists():
+                return path
+        return None
 
     def _load_curriculum_index(self) -> Dict:
         """تحميل فهرس المنهج من ملف JSON"""
         try:
             # البحث عن ملف الفهرس في عدة مواقع محتملة
-            possible_paths = [
-                Path("curriculum_index.json"),
-                Path("data/curriculum_index.json"),
-                Path("tutor_ai/curriculum_index.json")
-            ]
-            
-            for path in possible_paths:
-                if path.exists():
-                    with open(path, 'r', encoding='utf-8') as f:
-                        return json.load(f)
+            path = self._find_index_path()
+            if path is not None:
+                self.index_path = path
+                self._index_mtime = path.stat().st_mtime
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
             
             # إذا لم يوجد الملف، نحاول إنشاؤه من البيانات المرفقة
             return self._create_default_index()
@@ -57,6 +85,50 @@ class CurriculumIndex:
             print(f"خطأ في تحميل فهرس المنهج: {e}")
             return {}
 
+    def _build_lesson_table(self, curriculum_data: Dict) -> Dict[Tuple[str, str, str], Dict]:
+        """جدول (الصف، مفتاح المادة في الفهرس، رقم الدرس) -> معلومات الدرس - أول وحدة تحتوي الدرس هي المعتمدة"""
+        table: Dict[Tuple[str, str, str], Dict] = {}
+        for grade_key, grade_data in curriculum_data.items():
+            if not isinstance(grade_data, dict):
+                continue
+            for index_subject_key, subject_data in grade_data.items():
+                if not isinstance(subject_data, dict):
+                    continue
+                for unit_key, unit_data in subject_data.get('units', {}).items():
+                    for lesson_key, lesson_data in unit_data.get('lessons', {}).items():
+                        match = _LESSON_KEY_RE.search(lesson_key)
+                        lesson_number = self._convert_to_number(match.group(1)) if match else None
+                        if not lesson_number:
+                            continue
+                        table.setdefault((grade_key, index_subject_key, lesson_number), {
+                            'unit_name': unit_data.get('name', unit_key),
+                            'lesson_name': lesson_data.get('name', lesson_key),
+                            'keywords': lesson_data.get('keywords', []),
+                            'unit_key': unit_key,
+                            'lesson_key': lesson_key
+                        })
+        return table
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """إعادة تحميل الفهرس إذا تغير وقت تعديل الملف (يُفحص مرة كل RELOAD_CHECK_INTERVAL ثانية على الأكثر)"""
+        now = time.monotonic()
+        if not force and now - self._last_reload_check < RELOAD_CHECK_INTERVAL:
+            return False
+        with self._reload_lock:
+            self._last_reload_check = now
+            path = self._find_index_path()
+            try:
+                mtime = path.stat().st_mtime if path is not None else None
+            except OSError:
+                mtime = None
+            if not force and path == self.index_path and mtime == self._index_mtime:
+                return False
+            curriculum_data = self._load_curriculum_index()
+            # استبدال ذري للمرجعين: الطلبات الجارية تكمل على النسخة القديمة
+            self.curriculum_data, self.lesson_table = curriculum_data, self._build_lesson_table(curriculum_data)
+            print(f"INFO: تمت إعادة تحميل فهرس المنهج ({len(self.lesson_table)} درس)")
+            return True
+
     def _create_default_index(self) -> Dict:
         """إنشاء فهرس افتراضي إذا لم يوجد الملف"""
         # هذا مثال مبسط - يجب استبداله بالبيانات الكاملة المرفقة
@@ -79,11 +151,11 @@ class CurriculumIndex:
 
     def detect_lesson_request(self, question: str, grade_key: str, subject_key: str) -> Optional[Dict]:
         """اكتشاف طلب درس محدد من السؤال"""
-        question_clean = question.strip().lower()
+        self.reload_if_changed()
         
         # البحث عن أنماط الدروس
-        for pattern in self.lesson_patterns:
-            match = re.search(pattern, question, re.IGNORECASE)
+        for pattern in _COMPILED_LESSON_PATTERNS:
+            match = pattern.search(question)
             if match:
                 lesson_identifier = match.group(1)
                 lesson_number = self._convert_to_number(lesson_identifier)
@@ -105,38 +177,20 @@ class CurriculumIndex:
         if identifier in self.number_mapping:
             return self.number_mapping[identifier]
         elif identifier.isdigit():
-            return identifier
+            # int() يقبل الأرقام العربية الهندية أيضاً ("١٢" -> "12")
+            return str(int(identifier))
         return None
 
     def _get_lesson_info(self, grade_key: str, subject_key: str, lesson_number: str) -> Optional[Dict]:
         """الحصول على معلومات الدرس المحدد"""
         try:
-            # تحويل مفتاح المادة إلى مفتاح الفهرس
-            index_subject_key = self._map_subject_key(subject_key)
-            
-            if grade_key not in self.curriculum_data:
-                return None
-                
-            grade_data = self.curriculum_data[grade_key]
-            if index_subject_key not in grade_data:
+            # تحويل مفتاح المادة إلى مفتاح الفهرس ثم بحث مباشر في الجدول
+            lesson_number = self._convert_to_number(lesson_number) or lesson_number
+            lesson_info = self.lesson_table.get((grade_key, self._map_subject_key(subject_key), lesson_number))
+            if lesson_info is None:
                 return None
-                
-            subject_data = grade_data[index_subject_key]
-            
-            # البحث في جميع الوحدات عن الدرس
-            for unit_key, unit_data in subject_data.get('units', {}).items():
-                lessons = unit_data.get('lessons', {})
-                for lesson_key, lesson_data in lessons.items():
-                    if f"الدرس {lesson_number}" in lesson_key or f"الدرس ال{lesson_number}" in lesson_key:
-                        return {
-                            'unit_name': unit_data.get('name', unit_key),
-                            'lesson_name': lesson_data.get('name', lesson_key),
-                            'keywords': lesson_data.get('keywords', []),
-                            'unit_key': unit_key,
-                            'lesson_key': lesson_key
-                        }
-            
-            return None
+            # نسخة مستقلة حتى لا يُعدّل المستدعي الجدول المشترك
+            return {**lesson_info, 'keywords': list(lesson_info['keywords'])}
             
         except Exception as e:
             print(f"خطأ في الحصول على معلومات الدرس: {e}")
@@ -204,3 +258,18 @@ class CurriculumIndex:
         ]
         
         return " | ".join(context_parts)
+
+
+# نسخة واحدة على مستوى العملية تتشاركها جميع الجلسات
+_shared_index: Optional[CurriculumIndex] = None
+_shared_index_lock = threading.Lock()
+
+
+def get_curriculum_index() -> CurriculumIndex:
+    """الحصول على فهرس المنهج المشترك (يُحمّل مرة واحدة ويُعاد تحميله عند تعديل ملف JSON فقط)"""
+    global _shared_index
+    if _shared_index is None:
+        with _shared_index_lock:
+            if _shared_index is None:
+                _shared_index = CurriculumIndex()
+    return _shared_index
@@ -0,0 +1,126 @@
+# tutor_ai/document_loading.py
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+DOCUMENT_EXTENSIONS = (".md", ".txt", ".docx")
+
+# عدد العمليات لتحليل الملفات (0 أو 1 = تحميل تسلسلي في نفس العملية)
+DEFAULT_LOADER_WORKERS = int(os.getenv("DOCUMENT_LOADER_WORKERS", str(os.cpu_count() or 1)))
+
+
+class LoadedFile(NamedTuple):
+    """نتيجة تحميل ملف واحد: المحتوى والبيانات الوصفية لكل مستند، زمن التحليل، والخطأ إن وجد"""
+    path: str
+    documents: List[Tuple[str, Dict[str, Any]]]
+    seconds: float
+    error: Optional[str]
+
+
+def scan_document_files(root: str, extensions: Tuple[str, ...] = DOCUMENT_EXTENSIONS) -> List[str]:
+    """مسح شجرة المجلدات مرة واحدة وإرجاع الملفات المدعومة مرتبة"""
+    found: List[str] = []
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            if os.path.splitext(file_name)[1].lower() in extensions:
+                found.append(os.path.join(dir_path, file_name))
+    return sorted(found)
+
+
+def _create_loader(file_path: str) -> Any:
+    """اختيار محمّل LangChain حسب الامتداد (يُستورد داخل العملية العاملة)"""
+    from langchain_community.document_loaders import UnstructuredMarkdownLoader, TextLoader, Docx2txtLoader
+
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".md":
+        return UnstructuredMarkdownLoader(file_path)
+    if extension == ".txt":
+        return TextLoader(file_path, encoding="utf-8")
+    if extension == ".docx":
+        return Docx2txtLoader(file_path)
+    raise ValueError(f"امتداد غير مدعوم: {extension}")
+
+
+def load_file(file_path: str) -> LoadedFile:
+    """تحميل وتحليل ملف واحد - دالة على مستوى الوحدة حتى يمكن تمريرها إلى ProcessPoolExecutor"""
+    started_at = time.perf_counter()
+    try:
+        loaded_docs = _create_loader(file_path).load()
+        documents = [(doc.page_content, dict(doc.metadata)) for doc in loaded_docs]
+        return LoadedFile(file_path, documents, time.perf_counter() - started_at, None)
+    except Exception as e:
+        return LoadedFile(file_path, [], time.perf_counter() - started_at, f"{type(e).__name__}: {e}")
+
+
+def _file_size(file_path: str) -> int:
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def iter_loaded_files(file_paths: List[str], max_workers: int = DEFAULT_LOADER_WORKERS,
+                      label: str = "") -> Iterator[LoadedFile]:
+    """تحليل الملفات بالتوازي على عدة عمليات وإرجاع كل ملف فور انتهائه
+
+    تُرسل الملفات الأكبر أولاً لتوزيع الحمل، ويُعاد التحميل تسلسلياً إذا تعذر تشغيل العمليات.
+    """
+    if not file_paths:
+        return
+    ordered = sorted(file_paths, key=_file_size, reverse=True)
+    workers = min(max_workers, len(ordered))
+    started_at = time.perf_counter()
+    total_parse_seconds = 0.0
+    remaining = list(ordered)
+
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(load_file, file_path): file_path for file_path in ordered}
+                for future in as_completed(futures):
+                    result = future.result()
+                    remaining.remove(result.path)
+                    total_parse_seconds += result.seconds
+                    _report(result, label)
+                    yield result
+        except Exception as e:
+            # مثلاً BrokenProcessPool أو بيئة لا تسمح بإنشاء عمليات فرعية
+            print(f"DOC_LOADER WARNING: [{label}] تعذر التحميل المتوازي ({e}). متابعة {len(remaining)} ملف بشكل تسلسلي.")
+
+    for file_path in list(remaining):
+        result = load_file(file_path)
+        remaining.remove(file_path)
+        total_parse_seconds += result.seconds
+        _report(result, label)
+        yield result
+
+    wall_seconds = time.perf_counter() - started_at
+    print(f"DOC_LOADER INFO: [{label}] {len(ordered)} ملف خلال {wall_seconds:.2f} ثانية "
+          f"(زمن التحليل الإجمالي {total_parse_seconds:.2f} ثانية، {workers if workers > 1 else 1} عملية)")
+
+
+def _report(result: LoadedFile, label: str) -> None:
+    file_name = os.path.basename(result.path)
+    if result.error:
+        print(f"DOC_LOADER ERROR: [{label}] فشل تحميل '{result.path}': {result.error}")
+    elif not result.documents:
+        print(f"DOC_LOADER INFO: [{label}] لم يتم استخراج محتوى من '{file_name}' ({result.seconds:.2f} ثانية)")
+    else:
+        characters = sum(len(content) for content, _ in result.documents)
+        print(f"DOC_LOADER INFO: [{label}] {file_name}: {characters} حرف خلال {result.seconds:.2f} ثانية")
+
+
+if __name__ == "__main__":
+    import sys
+
+    # قياس التحميل: python -m tutor_ai.document_loading <مجلد> [عدد العمليات]
+    root = sys.argv[1] if len(sys.argv) > 1 else "knowledge_base_docs"
+    worker_counts = [int(sys.argv[2])] if len(sys.argv) > 2 else [1, DEFAULT_LOADER_WORKERS]
+    paths = scan_document_files(root)
+    print(f"{len(paths)} ملف في {root}")
+    for count in worker_counts:
+        started = time.perf_counter()
+        loaded = list(iter_loaded_files(paths, max_workers=count, label=f"workers={count}"))
+        print(f"workers={count}: {time.perf_counter() - started:.2f} ثانية، {sum(len(item.documents) for item in loaded)} مستند")
@@ -0,0 +1,179 @@
+# tutor_ai/embedding_cache.py
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Any, Dict, List, Optional
+
+
+DEFAULT_CACHE_MAX_BYTES = int(float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024)
+# عمليات البناء المتوازية تكتب في الملف نفسه: مهلة انتظار القفل أطول بكثير من 5 ثوانٍ الافتراضية في sqlite3
+DEFAULT_BUSY_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_CACHE_BUSY_TIMEOUT_SECONDS", "60"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_cache_text(text: str) -> str:
+    """تطبيع النص قبل حساب مفتاح التخزين المؤقت"""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    """المفتاح = بصمة (اسم النموذج + النص المطبّع)"""
+    return hashlib.sha256(f"{model_name}\x00{normalize_cache_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """ذاكرة تخزين مؤقت دائمة للتضمينات على القرص (SQLite + مصفوفات float32) مع إخلاء LRU وحد للحجم"""
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+                 busy_timeout_seconds: float = DEFAULT_BUSY_TIMEOUT_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=busy_timeout_seconds, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """قراءة التضمينات المخزنة (None للنصوص غير الموجودة)"""
+        keys = [cache_key(model_name, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for offset in range(0, len(unique_keys), 500):
+                chunk = unique_keys[offset:offset + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(keys) - hits
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model_name: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """تخزين تضمينات جديدة ثم الإخلاء إذا تجاوز الحجم الحد المسموح"""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = array("f", vector).tobytes()
+            rows.append((cache_key(model_name, text), model_name, len(vector), blob, len(blob), now))
+        if not rows:
+            return
+        with self._lock, self._conn:
+            # قفل الكتابة من بداية المعاملة: الحجم المقروء بعدها يشمل كتابات العمليات الأخرى ولا يتغير حتى الإخلاء
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self.stats["writes"] += len(rows)
+            self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        """حذف الأقدم استخداماً حتى ينزل الحجم إلى 90% من الحد (داخل معاملة الكتابة)"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        while self.total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_access ASC LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for key, size in rows:
+                if self.total_bytes <= target:
+                    break
+                self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """عدادات الإصابة/الإخفاق والحجم الحالي"""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "size_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+class CachedEmbeddings:
+    """غلاف لدالة التضمين يمر عبر EmbeddingCache قبل استدعاء الـ API"""
+
+    def __init__(self, embeddings: Any, model_name: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        results = self.cache.get_many(self.model_name, texts)
+        # النصوص المكررة داخل الدفعة نفسها تُرسل مرة واحدة فقط
+        missing: Dict[str, List[int]] = {}
+        for index, (text, vector) in enumerate(zip(texts, results)):
+            if vector is None:
+                missing.setdefault(normalize_cache_text(text), []).append(index)
+        if missing:
+            representative_texts = [texts[indices[0]] for indices in missing.values()]
+            new_vectors = self.embeddings.embed_documents(representative_texts)
+            self.cache.put_many(self.model_name, representative_texts, new_vectors)
+            for indices, vector in zip(missing.values(), new_vectors):
+                for index in indices:
+                    results[index] = list(vector)
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        # تضمين الاستعلام يستخدم نوع مهمة مختلف في Vertex AI لذا يُخزن بمفتاح منفصل
+        query_model_key = f"{self.model_name}#query"
+        cached = self.cache.get_many(query_model_key, [text])[0]
+        if cached is not None:
+            return cached
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(query_model_key, [text], [vector])
+        return list(vector)
+
+
+# ذاكرة مشتركة واحدة لكل ملف على مستوى العملية (تتشاركها جميع المجموعات)
+_shared_caches: Dict[str, EmbeddingCache] = {}
+_shared_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(path: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES) -> EmbeddingCache:
+    """الحصول على ذاكرة التضمين المشتركة للمسار المحدد"""
+    absolute_path = os.path.abspath(path)
+    with _shared_caches_lock:
+        cache = _shared_caches.get(absolute_path)
+        if cache is None:
+            cache = EmbeddingCache(absolute_path, max_bytes=max_bytes)
+            _shared_caches[absolute_path] = cache
+        return cache
@@ -0,0 +1,182 @@
+# tutor_ai/embedding_pipeline.py
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+
+# الإعدادات الافتراضية (يمكن تعديلها بمتغيرات البيئة)
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+DEFAULT_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "4"))
+DEFAULT_REQUESTS_PER_MINUTE = float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "120"))
+DEFAULT_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """هل الخطأ ناتج عن تجاوز حصة Vertex AI (429 / ResourceExhausted)؟"""
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "rate limit" in message or "resource exhausted" in message
+
+
+class TokenBucket:
+    """محدد معدل بخوارزمية دلو الرموز - آمن للاستخدام من عدة خيوط"""
+
+    def __init__(self, rate_per_second: float, capacity: Optional[float] = None):
+        self.rate = max(rate_per_second, 1e-6)
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """الانتظار حتى يتوفر عدد الرموز المطلوب"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_for = max(self.paused_until - now, (tokens - self.tokens) / self.rate)
+            time.sleep(min(max(wait_for, 0.01), 5.0))
+
+    def pause(self, seconds: float) -> None:
+        """إيقاف جميع الطلبات مؤقتاً (ضغط عكسي عند تجاوز الحصة)"""
+        with self._lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+            self.updated_at = now
+
+
+class EmbeddingPipeline:
+    """مرحلة تضمين على دفعات مع طلبات متوازية محدودة، تحديد للمعدل وإعادة محاولة مع تأخير عشوائي"""
+
+    def __init__(self, embedding_function: Any,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 label: str = "",
+                 progress_callback: Optional[Callable[[str, int, int], None]] = None):
+        """
+        embedding_function: أي كائن يوفر embed_documents(texts) (VertexAIEmbeddings أو دالة وهمية للاختبار).
+        progress_callback(label, done_texts, total_texts): يُستدعى بعد اكتمال كل دفعة.
+        """
+        self.embedding_function = embedding_function
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.label = label
+        self.progress_callback = progress_callback
+        self.rate_limiter = TokenBucket(requests_per_minute / 60.0, capacity=self.max_workers)
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "texts": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """تأخير أسي مع تشويش كامل (full jitter)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """تضمين دفعة واحدة مع إعادة المحاولة"""
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            self._count("requests")
+            try:
+                embeddings = self.embedding_function.embed_documents(batch)
+                if len(embeddings) != len(batch):
+                    raise ValueError(f"عدد التضمينات ({len(embeddings)}) لا يطابق عدد النصوص ({len(batch)})")
+                return embeddings
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                self._count("retries")
+                if is_rate_limit_error(e):
+                    # إيقاف جميع العمال وليس هذا الطلب فقط
+                    self._count("rate_limited")
+                    self.rate_limiter.pause(delay)
+                print(f"EMBED_PIPELINE WARNING: [{self.label}] فشل طلب التضمين (المحاولة {attempt + 1}): {e}. إعادة المحاولة بعد {delay:.1f} ثانية.")
+                time.sleep(delay)
+        return []
+
+    def embed_batches(self, texts: List[str]) -> Iterator[Tuple[int, List[List[float]]]]:
+        """تضمين النصوص وإرجاع (موضع بداية الدفعة، التضمينات) فور اكتمال كل دفعة"""
+        total = len(texts)
+        if total == 0:
+            return
+        batches = [(start, texts[start:start + self.batch_size]) for start in range(0, total, self.batch_size)]
+        done = 0
+        last_reported_percent = -1
+        started_at = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed") as executor:
+            futures = {executor.submit(self._embed_batch, batch): (start, len(batch)) for start, batch in batches}
+            try:
+                for future in as_completed(futures):
+                    start, size = futures[future]
+                    embeddings = future.result()
+                    done += size
+                    self._count("texts", size)
+                    if self.progress_callback:
+                        self.progress_callback(self.label, done, total)
+                    percent = int(done * 100 / total)
+                    if percent // 10 != last_reported_percent // 10 or done == total:
+                        last_reported_percent = percent
+                        elapsed = time.monotonic() - started_at
+                        print(f"EMBED_PIPELINE INFO: [{self.label}] {done}/{total} نص ({percent}%) خلال {elapsed:.1f} ثانية")
+                    yield start, embeddings
+            except BaseException:
+                for pending in futures:
+                    pending.cancel()
+                raise
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """تضمين جميع النصوص مع الحفاظ على الترتيب الأصلي"""
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        for start, embeddings in self.embed_batches(texts):
+            results[start:start + len(embeddings)] = embeddings
+        return results
+
+
+if __name__ == "__main__":
+    # اختبار محلي بدالة تضمين وهمية تحاكي أخطاء الحصة
+    class FakeEmbeddings:
+        def __init__(self):
+            self.calls = 0
+            self._lock = threading.Lock()
+
+        def embed_documents(self, texts):
+            with self._lock:
+                self.calls += 1
+                call_number = self.calls
+            time.sleep(0.05)
+            if call_number % 7 == 0:
+                raise RuntimeError("429 Resource exhausted: quota exceeded")
+            return [[float(len(text)), float(call_number)] for text in texts]
+
+    fake = FakeEmbeddings()
+    pipeline = EmbeddingPipeline(fake, batch_size=8, max_workers=4, requests_per_minute=6000,
+                                 base_delay=0.05, max_delay=0.2, label="fake_coll")
+    sample_texts = [f"نص تجريبي رقم {i}" for i in range(200)]
+    vectors = pipeline.embed_texts(sample_texts)
+    assert len(vectors) == len(sample_texts)
+    assert all(vector[0] == float(len(text)) for vector, text in zip(vectors, sample_texts))
+    print(f"تم تضمين {len(vectors)} نص. الإحصائيات: {pipeline.stats}")
@@ -0,0 +1,297 @@
+# tutor_ai/embedding_provider.py
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+from typing import Any, Dict, Optional, Tuple
+
+from .embedding_cache import CachedEmbeddings, get_embedding_cache
+from .embedding_pipeline import is_rate_limit_error
+
+# vertexai و langchain_google_vertexai ثقيلتان: تُستوردان عند أول تهيئة للعميل
+VERTEX_AI_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ("langchain_google_vertexai", "vertexai"))
+
+
+# النماذج المدعومة فعلاً (مرتبة حسب الأولوية)
+EMBEDDING_MODELS = [
+    "gemini-embedding-001",         # الأحدث والأفضل - 3072 dimensions
+    "text-embedding-005",           # نموذج حديث - 768 dimensions
+    "text-embedding-004",           # نموذج مستقر - 768 dimensions
+    "textembedding-gecko@latest",   # محاولة أخيرة للنماذج القديمة
+]
+
+DEFAULT_PROVIDER_STATE_PATH = os.path.join("chroma_dbs", "embedding_provider.json")
+DEFAULT_EMBEDDING_CACHE_PATH = os.path.join("chroma_dbs", "embedding_cache.sqlite3")
+
+# بعد فشل جميع النماذج لا يُعاد الفحص قبل انقضاء هذه المدة (ثوانٍ) - في هذه العملية وفي العمليات الأخرى
+PROBE_RETRY_SECONDS = float(os.getenv("EMBEDDING_PROBE_RETRY_SECONDS", "300"))
+
+# أخطاء مؤقتة (شبكة، مهلة، خدمة غير متاحة): لا تعني أن النموذج المختار لم يعد يعمل
+_TRANSIENT_ERROR_TYPES = ("DeadlineExceeded", "ServiceUnavailable", "InternalServerError", "GatewayTimeout",
+                          "Aborted", "RetryError", "TimeoutError", "ConnectionError", "ReadTimeout", "ConnectTimeout")
+_TRANSIENT_ERROR_MARKERS = ("timed out", "timeout", "deadline", "unavailable", "503", "502", "504",
+                            "connection reset", "connection aborted", "temporarily")
+
+
+def is_transient_error(error: Exception) -> bool:
+    """هل الخطأ مؤقتاً (حصة 429، مهلة، انقطاع شبكة) بحيث لا يستدعي إعادة فحص النماذج؟"""
+    if is_rate_limit_error(error) or isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in _TRANSIENT_ERROR_TYPES:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in _TRANSIENT_ERROR_MARKERS)
+
+
+_credentials_lock = threading.Lock()
+_credentials_path: Optional[str] = None
+
+
+def resolve_credentials_path() -> Optional[str]:
+    """مسار ملف الاعتماد: GOOGLE_APPLICATION_CREDENTIALS أو ملف مؤقت من Streamlit Secrets (يُنشأ مرة واحدة لكل عملية)"""
+    global _credentials_path
+    with _credentials_lock:
+        if _credentials_path and os.path.exists(_credentials_path):
+            return _credentials_path
+
+        cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        if not cred_path or not os.path.exists(cred_path):
+            try:
+                import streamlit as st
+                if hasattr(st, 'secrets'):
+                    credentials_json = st.secrets.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
+                    if credentials_json:
+                        if isinstance(credentials_json, str):
+                            credentials_dict = json.loads(credentials_json)
+                        else:
+                            credentials_dict = dict(credentials_json)
+
+                        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+                            json.dump(credentials_dict, f)
+                            cred_path = f.name
+                            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = cred_path
+                            print(f"EMBED_PROVIDER INFO: تم إنشاء ملف مؤقت للاعتماد: {cred_path}")
+            except Exception:
+                pass
+
+        if cred_path and os.path.exists(cred_path):
+            _credentials_path = cred_path
+            return cred_path
+        return None
+
+
+class EmbeddingProvider:
+    """عميل تضمين واحد لكل (مشروع، منطقة) في العملية: تهيئة Vertex وفحص النماذج مرة واحدة
+
+    النموذج المختار وأبعاده يُحفظان على القرص فتبدأ العمليات اللاحقة بدون أي استدعاء فحص.
+    الفحص يُعاد فقط بعد فشل: فوراً إذا أُبلغ عن فشل النموذج المحفوظ، وبعد PROBE_RETRY_SECONDS إذا فشلت كل النماذج.
+    """
+
+    def __init__(self, project_id: str, location: str,
+                 state_path: str = DEFAULT_PROVIDER_STATE_PATH,
+                 cache_path: Optional[str] = DEFAULT_EMBEDDING_CACHE_PATH):
+        self.project_id = project_id
+        self.location = location
+        self.state_path = state_path
+        self.cache_path = cache_path
+        self.client: Optional[Any] = None
+        self.model_name: Optional[str] = None
+        self.dimension: Optional[int] = None
+        self.last_failure_at: Optional[float] = None
+        self._pinned_clients: Dict[str, Any] = {}
+        self.stats = {"probes": 0, "probe_calls": 0, "reused_from_state": 0, "failures_reported": 0,
+                      "transient_failures": 0}
+        self._vertex_initialized = False
+        self._lock = threading.Lock()
+
+    @property
+    def state_key(self) -> str:
+        return f"{self.project_id}|{self.location}"
+
+    def _read_state(self) -> Dict[str, Dict]:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, record: Optional[Dict]) -> None:
+        state = self._read_state()
+        if record is None:
+            state.pop(self.state_key, None)
+        else:
+            state[self.state_key] = record
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"EMBED_PROVIDER WARNING: تعذر حفظ حالة نموذج التضمين {self.state_path}: {e}")
+
+    def _bootstrap(self) -> bool:
+        """بيانات الاعتماد و vertexai.init - مرة واحدة فقط"""
+        if self._vertex_initialized:
+            return True
+        if not resolve_credentials_path():
+            print(f"EMBED_PROVIDER ERROR: GOOGLE_APPLICATION_CREDENTIALS غير مضبوط بشكل صحيح.")
+            return False
+        import vertexai
+
+        vertexai.init(project=self.project_id, location=self.location)
+        self._vertex_initialized = True
+        print(f"EMBED_PROVIDER INFO: تم تهيئة Vertex AI للمشروع '{self.project_id}' في المنطقة '{self.location}'")
+        return True
+
+    def _create_client(self, model_name: str, client: Optional[Any] = None) -> Any:
+        """عميل النموذج مغلفاً بذاكرة التضمين المشتركة على القرص"""
+        if client is None:
+            from langchain_google_vertexai import VertexAIEmbeddings
+
+            client = VertexAIEmbeddings(model_name=model_name, project=self.project_id, location=self.location)
+        if self.cache_path:
+            try:
+                cache = get_embedding_cache(self.cache_path)
+                client = CachedEmbeddings(client, model_name, cache)
+                print(f"EMBED_PROVIDER INFO: ذاكرة التضمين مفعلة ({self.cache_path}): {cache.get_stats()}")
+            except Exception as e_cache:
+                print(f"EMBED_PROVIDER WARNING: تعذر تفعيل ذاكرة التضمين، سيتم الاستدعاء المباشر: {e_cache}")
+        return client
+
+    def _probe(self) -> Optional[Tuple[Any, str, int]]:
+        """تجربة النماذج بالترتيب باستدعاء تضمين حقيقي وإرجاع أول نموذج يعمل"""
+        from langchain_google_vertexai import VertexAIEmbeddings
+
+        self.stats["probes"] += 1
+        for model_name in EMBEDDING_MODELS:
+            try:
+                print(f"EMBED_PROVIDER INFO: محاولة نموذج التضمين '{model_name}'...")
+                client = VertexAIEmbeddings(model_name=model_name, project=self.project_id, location=self.location)
+                self.stats["probe_calls"] += 1
+                test_embedding = client.embed_query("اختبار النموذج")
+                if test_embedding and len(test_embedding) > 0:
+                    return client, model_name, len(test_embedding)
+            except Exception as model_error:
+                print(f"EMBED_PROVIDER WARNING: فشل اختبار النموذج '{model_name}': {model_error}")
+        return None
+
+    def get_client(self) -> Optional[Any]:
+        """عميل التضمين المشترك (أو None إذا لم يتوفر نموذج يعمل)"""
+        if self.client is not None:
+            return self.client
+        if not VERTEX_AI_AVAILABLE:
+            return None
+        with self._lock:
+            if self.client is not None:
+                return self.client
+            record = self._read_state().get(self.state_key, {})
+            failed_at = max(self.last_failure_at or 0.0, record.get("failed_at") or 0.0)
+            if failed_at and time.time() - failed_at < PROBE_RETRY_SECONDS:
+                return None
+
+            try:
+                if not self._bootstrap():
+                    return None
+                if record.get("model") in EMBEDDING_MODELS and not record.get("failed_at"):
+                    # نموذج مختار سابقاً: لا حاجة لاستدعاء فحص
+                    self.stats["reused_from_state"] += 1
+                    self.model_name, self.dimension = record["model"], record.get("dimension")
+                    self.client = self._create_client(self.model_name)
+                    print(f"EMBED_PROVIDER INFO: استخدام النموذج المحفوظ '{self.model_name}' ({self.dimension} بُعد) بدون فحص")
+                    return self.client
+
+                probed = self._probe()
+                if probed is None:
+                    self.last_failure_at = time.time()
+                    self._write_state({"model": None, "dimension": None, "failed_at": self.last_failure_at})
+                    print(f"EMBED_PROVIDER ERROR: فشلت جميع نماذج التضمين المتاحة. إعادة المحاولة بعد {PROBE_RETRY_SECONDS:.0f} ثانية.")
+                    print(f"تأكد من:")
+                    print(f"1. تفعيل Vertex AI API في مشروع '{self.project_id}'")
+                    print(f"2. أن حساب الخدمة لديه صلاحية 'Vertex AI User'")
+                    print(f"3. أن المشروع يدعم نماذج التضمين في المنطقة '{self.location}'")
+                    return None
+
+                probe_client, self.model_name, self.dimension = probed
+                self.last_failure_at = None
+                self._write_state({"model": self.model_name, "dimension": self.dimension,
+                                   "probed_at": time.time(), "failed_at": None})
+                self.client = self._create_client(self.model_name, probe_client)
+                print(f"EMBED_PROVIDER SUCCESS: ✅ نموذج التضمين '{self.model_name}' ({self.dimension} بُعد)")
+                return self.client
+            except Exception as e:
+                print(f"EMBED_PROVIDER ERROR: فشل عام في تهيئة VertexAIEmbeddings: {e}")
+                traceback.print_exc()
+                self.last_failure_at = time.time()
+                return None
+
+    def get_client_for_model(self, model_name: str) -> Optional[Any]:
+        """عميل لنموذج محدد بدون فحص - لمجموعة مبنية بهذا النموذج (متجهاتها لا تطابق نموذجاً آخر)"""
+        if self.client is not None and model_name == self.model_name:
+            return self.client
+        if not VERTEX_AI_AVAILABLE:
+            return None
+        with self._lock:
+            client = self._pinned_clients.get(model_name)
+            if client is None:
+                try:
+                    if not self._bootstrap():
+                        return None
+                    client = self._create_client(model_name)
+                except Exception as e:
+                    print(f"EMBED_PROVIDER ERROR: تعذر تهيئة نموذج التضمين '{model_name}': {e}")
+                    return None
+                self._pinned_clients[model_name] = client
+            return client
+
+    def report_failure(self, error: Exception, model_name: Optional[str] = None) -> None:
+        """إبلاغ عن فشل النموذج المختار: يُحذف من الحالة المحفوظة ويُعاد الفحص عند الطلب التالي
+
+        الأخطاء المؤقتة (429، مهلة، انقطاع) وفشل نموذج غير النموذج المختار حالياً لا تغيّر الاختيار.
+        """
+        with self._lock:
+            if is_transient_error(error):
+                self.stats["transient_failures"] += 1
+                print(f"EMBED_PROVIDER WARNING: خطأ مؤقت في نموذج التضمين '{model_name or self.model_name}': {error}")
+                return
+            if model_name is not None and model_name != self.model_name:
+                self._pinned_clients.pop(model_name, None)
+                print(f"EMBED_PROVIDER WARNING: فشل نموذج التضمين المثبت '{model_name}': {error}")
+                return
+            self.stats["failures_reported"] += 1
+            print(f"EMBED_PROVIDER WARNING: فشل نموذج التضمين '{self.model_name}': {error}. سيُعاد الفحص.")
+            self.client = None
+            self.model_name = None
+            self.dimension = None
+            self._write_state(None)
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "project_id": self.project_id,
+            "location": self.location,
+            "model": self.model_name,
+            "dimension": self.dimension,
+            "last_failure_at": self.last_failure_at,
+            **self.stats
+        }
+
+
+_providers: Dict[Tuple[str, str, str], EmbeddingProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_embedding_provider(project_id: str, location: str = "us-central1",
+                           state_path: str = DEFAULT_PROVIDER_STATE_PATH,
+                           cache_path: Optional[str] = DEFAULT_EMBEDDING_CACHE_PATH) -> EmbeddingProvider:
+    """مزود التضمين المشترك لكل (مشروع، منطقة، ملف حالة) في العملية"""
+    key = (project_id, location, os.path.abspath(state_path))
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = EmbeddingProvider(project_id, location, state_path=state_path, cache_path=cache_path)
+            _providers[key] = provider
+        return provider
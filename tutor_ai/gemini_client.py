@@ -6,7 +6,19 @@ import os
 import traceback
 import tempfile
 import re
-from typing import Dict, Optional, List, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, List, Tuple, Union
+
+from .kb_manifest import hash_text
+from .query_cache import TTLLRUCache
+
+
+# ميزانية رموز الإخراج لكل نمط توليد: الشرح النصي وحده أقصر بكثير من JSON يحتوي على SVG
+OUTPUT_TOKEN_BUDGETS = {
+    "full": int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "8192")),
+    "text_only": int(os.getenv("GEMINI_TEXT_ONLY_MAX_OUTPUT_TOKENS", "2048")),
+    "svg": int(os.getenv("GEMINI_SVG_MAX_OUTPUT_TOKENS", "6144")),
+}
 
 # استيراد Streamlit فقط عند الحاجة
 try:
@@ -84,6 +96,126 @@ class ResponseQualityChecker:
         }
 
 
+# --- محلل JSON تدريجي للاستجابات المتدفقة ---
+class StreamingJsonFieldParser:
+    """يستخرج قيمة حقل نصي من كائن JSON أثناء وصوله على دفعات (مثل text_explanation)"""
+
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self, field_name: str = "text_explanation"):
+        self.field_pattern = re.compile(r'"' + re.escape(field_name) + r'"\s*:\s*"')
+        self.raw_text = ""
+        self.value_start: Optional[int] = None
+        self.position = 0
+        self.value_closed = False
+        self.value = ""
+
+    def feed(self, chunk: str) -> str:
+        """إضافة دفعة نصية جديدة وإرجاع الجزء الجديد المفكوك من قيمة الحقل"""
+        self.raw_text += chunk
+        if self.value_closed:
+            return ""
+        if self.value_start is None:
+            match = self.field_pattern.search(self.raw_text)
+            if not match:
+                return ""
+            self.value_start = self.position = match.end()
+
+        decoded = []
+        text = self.raw_text
+        while self.position < len(text):
+            char = text[self.position]
+            if char == '"':
+                self.value_closed = True
+                self.position += 1
+                break
+            if char != '\\':
+                decoded.append(char)
+                self.position += 1
+                continue
+            # تسلسل هروب: ننتظر وصوله كاملاً قبل فكه
+            if self.position + 1 >= len(text):
+                break
+            escape_char = text[self.position + 1]
+            if escape_char == 'u':
+                hex_digits = text[self.position + 2:self.position + 6]
+                if len(hex_digits) < 4:
+                    break
+                try:
+                    code_point = int(hex_digits, 16)
+                except ValueError:
+                    code_point = None
+                consumed = 6
+                if code_point is not None and 0xD800 <= code_point < 0xDC00:
+                    # زوج بديل (مثل الإيموجي): نحتاج النصف الثاني \uDCxx
+                    low_part = text[self.position + 6:self.position + 12]
+                    if len(low_part) < 6:
+                        break
+                    try:
+                        low_point = int(low_part[2:], 16) if low_part.startswith('\\u') else None
+                    except ValueError:
+                        low_point = None
+                    if low_point is not None and 0xDC00 <= low_point < 0xE000:
+                        code_point = 0x10000 + ((code_point - 0xD800) << 10) + (low_point - 0xDC00)
+                        consumed = 12
+                decoded.append(chr(code_point) if code_point is not None else hex_digits)
+                self.position += consumed
+            else:
+                decoded.append(self._ESCAPES.get(escape_char, escape_char))
+                self.position += 2
+
+        delta = "".join(decoded)
+        self.value += delta
+        return delta
+
+
+class StreamingExplanation:
+    """استجابة متدفقة: التكرار عليها يعطي نص الشرح تدريجياً، وبعد انتهائها تتوفر النتيجة الكاملة في result"""
+
+    def __init__(self, client: "GeminiClientVertexAI", prompt_text: str, include_svg: bool = True):
+        self.client = client
+        self.prompt_text = prompt_text
+        self.include_svg = include_svg
+        self.result: Optional[Dict] = None
+        self.used_fallback = False
+
+    def __iter__(self):
+        if not self.include_svg:
+            cached = self.client._get_cached_track("explanation", self.prompt_text)
+            if cached is not None:
+                self.result = cached
+                yield cached["text_explanation"]
+                return
+
+        parser = StreamingJsonFieldParser("text_explanation")
+        try:
+            print("INFO: Sending streaming request to Gemini")
+            response_stream = self.client.model.generate_content(
+                self.prompt_text,
+                generation_config=self.client._generation_config(0, "full" if self.include_svg else "text_only"),
+                safety_settings=self.client._safety_settings(),
+                stream=True
+            )
+            for response_chunk in response_stream:
+                delta = parser.feed(self.client._response_text(response_chunk))
+                if delta:
+                    yield delta
+        except Exception as e:
+            print(f"ERROR: Streaming request failed: {e}")
+
+        self.result = self.client._build_result_from_text(parser.raw_text, include_svg=self.include_svg)
+        if self.result is None:
+            # فشل التحليل أو كانت الجودة منخفضة: نعود للمسار غير المتدفق مع إعادة المحاولة
+            print("INFO: Streamed response unusable, falling back to non-streaming request")
+            self.used_fallback = True
+            if self.include_svg:
+                self.result = self.client.query_for_explanation_and_svg(self.prompt_text)
+            else:
+                self.result = self.client.query_explanation(self.prompt_text)
+        elif not self.include_svg:
+            self.client._set_cached_track("explanation", self.prompt_text, self.result)
+
+
 # --- عميل Gemini الآمن ---
 class GeminiClientVertexAI:
     """عميل Gemini آمن - يقرأ من Streamlit Secrets فقط"""
@@ -95,6 +227,10 @@ class GeminiClientVertexAI:
         self.model_name = model_name
         self.quality_checker = ResponseQualityChecker()
         self.max_retries = 2
+        # منفذ مشترك لتشغيل مسار الشرح ومسار الرسم بالتوازي
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="gemini_track")
+        # ذاكرة مؤقتة مستقلة لكل مسار: الرسم الجيد لا يُعاد توليده إذا تغير الشرح والعكس
+        self.track_cache = TTLLRUCache(max_entries=512, ttl_seconds=3600)
 
         if not project_id or not location:
             print("ERROR: GeminiClientVertexAI - PROJECT_ID or LOCATION not provided.")
@@ -115,6 +251,17 @@ class GeminiClientVertexAI:
             traceback.print_exc()
             self._troubleshoot_vertex_init()
 
+    def warm_up(self) -> bool:
+        """طلب توليد قصير جداً لتهيئة الاتصال والمصادقة قبل أول سؤال"""
+        if not self.model:
+            return False
+        try:
+            self.model.generate_content("مرحبا", generation_config={"max_output_tokens": 1}, stream=False)
+            return True
+        except Exception as e:
+            print(f"WARNING: GeminiClientVertexAI - Warm-up request failed: {e}")
+            return False
+
     def _setup_credentials(self):
         """إعداد بيانات الاعتماد من Streamlit Secrets فقط (آمن)"""
         try:
@@ -204,16 +351,18 @@ class GeminiClientVertexAI:
         print("6. Check service account has 'Vertex AI User' role")
         print("---------------------------------------------")
 
-    def _create_retry_prompt(self, original_prompt: str, quality_issues: List[str], previous_explanation: Optional[str], previous_svg: Optional[str]) -> str:
+    def _create_retry_prompt(self, original_prompt: str, quality_issues: List[str],
+                             focus_points: Optional[List[str]] = None) -> str:
         """إنشاء برومبت محسن لإعادة المحاولة"""
         issues_text = " و ".join(quality_issues) if quality_issues else "مشاكل في الجودة"
+        if focus_points is None:
+            focus_points = ["إنتاج JSON صالح بالبنية المطلوبة", "شرح واضح باللغة العربية المبسطة", "رسم SVG كامل وصالح"]
         retry_prompt_parts = [original_prompt]
         retry_prompt_parts.append("\n\n--- ملاحظات للتحسين ---")
         retry_prompt_parts.append(f"⚠️ المحاولة السابقة كان بها: {issues_text}")
         retry_prompt_parts.append("يرجى التركيز على:")
-        retry_prompt_parts.append("1. إنتاج JSON صالح بالبنية المطلوبة")
-        retry_prompt_parts.append("2. شرح واضح باللغة العربية المبسطة")
-        retry_prompt_parts.append("3. رسم SVG كامل وصالح")
+        for index, point in enumerate(focus_points, 1):
+            retry_prompt_parts.append(f"{index}. {point}")
         retry_prompt_parts.append("--- نهاية الملاحظات ---\n")
         return "\n".join(retry_prompt_parts)
 
@@ -244,8 +393,246 @@ class GeminiClientVertexAI:
             except json.JSONDecodeError:
                 return None
 
-    def query_for_explanation_and_svg(self, prompt_text: str) -> Dict:
-        """الاستعلام الرئيسي مع إعادة المحاولة"""
+    def _generation_config(self, attempt: int, mode: str = "full") -> Dict:
+        """إعدادات التوليد حسب رقم المحاولة ونمط التوليد (full / text_only / svg)"""
+        return {
+            "max_output_tokens": OUTPUT_TOKEN_BUDGETS.get(mode, OUTPUT_TOKEN_BUDGETS["full"]),
+            "temperature": 0.65 if attempt == 0 else 0.5,
+            "top_p": 0.95,
+            "top_k": 40
+        }
+
+    def _safety_settings(self) -> Dict:
+        return {
+            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+        }
+
+    def _response_text(self, response) -> str:
+        """استخراج النص من استجابة (أو دفعة متدفقة) Gemini"""
+        raw_response_text = ""
+        if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
+            for part in response.candidates[0].content.parts:
+                if hasattr(part, 'text'):
+                    raw_response_text += part.text
+        elif hasattr(response, 'text'):
+            raw_response_text = response.text
+        return raw_response_text
+
+    def _build_result_from_text(self, raw_response_text: str, include_svg: bool = True) -> Optional[Dict]:
+        """تحليل نص استجابة كاملة وإرجاع النتيجة إذا كانت مقبولة الجودة (وإلا None)"""
+        if not raw_response_text.strip():
+            return None
+        data = self._parse_json_response(self._extract_and_clean_json_str(raw_response_text))
+        if not data or not isinstance(data, dict):
+            return None
+
+        explanation = data.get("text_explanation")
+        explanation_quality = self.quality_checker.check_explanation_quality(explanation)
+        if not explanation_quality['is_valid']:
+            return None
+        if not include_svg:
+            return {
+                "text_explanation": explanation,
+                "svg_code": None,
+                "quality_scores": {"explanation": explanation_quality['score']},
+                "quality_issues": []
+            }
+        svg_code = data.get("svg_code")
+        svg_quality = self.quality_checker.check_svg_quality(svg_code)
+        return {
+            "text_explanation": explanation,
+            "svg_code": svg_code,
+            "quality_scores": {"explanation": explanation_quality['score'], "svg": svg_quality['score']},
+            "quality_issues": [] if svg_quality['is_valid'] else [f"رسم: {issue}" for issue in svg_quality['issues']]
+        }
+
+    def stream_query_for_explanation_and_svg(self, prompt_text: str) -> StreamingExplanation:
+        """نسخة متدفقة من query_for_explanation_and_svg: يُعرض الشرح فور وصوله"""
+        return StreamingExplanation(self, prompt_text)
+
+    def stream_query_explanation(self, prompt_text: str) -> StreamingExplanation:
+        """نسخة متدفقة من query_explanation (مسار الشرح فقط)"""
+        return StreamingExplanation(self, prompt_text, include_svg=False)
+
+    # --- المسارات المنفصلة: الشرح والرسم ---
+
+    def _run_track(self, track_name: str, prompt_text: str,
+                   extract: Callable[[str], Optional[str]],
+                   check_quality: Callable[[Optional[str]], Dict],
+                   focus_points: List[str],
+                   generation_mode: str = "full") -> Tuple[Optional[str], Dict]:
+        """تشغيل مسار توليد واحد مع فحص الجودة وإعادة المحاولة الخاصة به فقط"""
+        current_prompt = prompt_text
+        best_value: Optional[str] = None
+        best_quality: Dict = {'score': 0, 'issues': ["فشل التوليد"], 'is_valid': False}
+
+        for attempt in range(self.max_retries + 1):
+            print(f"INFO: Sending {track_name} request to Gemini (Attempt {attempt + 1})")
+            try:
+                response = self.model.generate_content(
+                    current_prompt,
+                    generation_config=self._generation_config(attempt, generation_mode),
+                    safety_settings=self._safety_settings(),
+                    stream=False
+                )
+                value, quality = self._evaluate_track_response(response, extract, check_quality)
+                if value and quality['score'] >= best_quality['score']:
+                    best_value, best_quality = value, quality
+                if quality['is_valid']:
+                    return value, quality
+                issues = quality['issues']
+            except Exception as e:
+                print(f"ERROR: {track_name} attempt {attempt + 1} failed: {e}")
+                issues = [str(e)]
+                if best_value is None:
+                    best_quality = {'score': 0, 'issues': [f"حدث خطأ: {e}"], 'is_valid': False}
+
+            if attempt < self.max_retries:
+                current_prompt = self._create_retry_prompt(prompt_text, issues, focus_points=focus_points)
+
+        return best_value, best_quality
+
+    def _evaluate_track_response(self, response, extract: Callable[[str], Optional[str]],
+                                 check_quality: Callable[[Optional[str]], Dict]) -> Tuple[Optional[str], Dict]:
+        raw_response_text = self._response_text(response)
+        if not raw_response_text.strip():
+            raise ValueError("رد فارغ من Gemini")
+        value = extract(raw_response_text)
+        return value, check_quality(value)
+
+    def _get_cached_track(self, track_name: str, prompt_text: str) -> Optional[Dict]:
+        cached = self.track_cache.get((track_name, hash_text(prompt_text)))
+        if cached is not None:
+            print(f"INFO: {track_name} track served from cache")
+        return cached
+
+    def _set_cached_track(self, track_name: str, prompt_text: str, result: Dict) -> None:
+        # لا نخزن إلا النتائج المقبولة الجودة
+        if not result.get("quality_issues"):
+            self.track_cache.set((track_name, hash_text(prompt_text)), result)
+
+    def _extract_explanation(self, raw_response_text: str) -> Optional[str]:
+        data = self._parse_json_response(self._extract_and_clean_json_str(raw_response_text))
+        if isinstance(data, dict):
+            return data.get("text_explanation")
+        return None
+
+    def _extract_svg(self, raw_response_text: str) -> Optional[str]:
+        match = re.search(r"<svg[\s\S]*?</svg>", raw_response_text, re.IGNORECASE)
+        if match:
+            return match.group(0).strip()
+        # احتياط: قد يعيد النموذج JSON رغم التعليمات
+        data = self._parse_json_response(self._extract_and_clean_json_str(raw_response_text))
+        if isinstance(data, dict):
+            return data.get("svg_code")
+        return None
+
+    def query_explanation(self, prompt_text: str) -> Dict:
+        """مسار الشرح: توليد الشرح النصي فقط مع فحص جودة الشرح وإعادة المحاولة عليه"""
+        if not self.model:
+            print("ERROR: Gemini model not initialized")
+            return {
+                "text_explanation": "عذرًا، المعلم الذكي غير جاهز حالياً.",
+                "svg_code": None,
+                "quality_scores": {"explanation": 0},
+                "quality_issues": ["فشل تهيئة النموذج"]
+            }
+        cached = self._get_cached_track("explanation", prompt_text)
+        if cached is not None:
+            return cached
+        explanation, quality = self._run_track("explanation", prompt_text, *self._explanation_track_args())
+        result = self._explanation_track_result(explanation, quality)
+        self._set_cached_track("explanation", prompt_text, result)
+        return result
+
+    def _explanation_track_args(self) -> Tuple:
+        return (
+            self._extract_explanation,
+            self.quality_checker.check_explanation_quality,
+            ["إنتاج JSON صالح يحتوي على text_explanation فقط", "شرح واضح باللغة العربية المبسطة"],
+            "text_only"
+        )
+
+    @staticmethod
+    def _explanation_track_result(explanation: Optional[str], quality: Dict) -> Dict:
+        return {
+            "text_explanation": explanation if explanation else "لم يتمكن من إنشاء شرح مناسب.",
+            "svg_code": None,
+            "quality_scores": {"explanation": quality['score']},
+            "quality_issues": [] if quality['is_valid'] else [f"شرح: {issue}" for issue in quality['issues']]
+        }
+
+    def query_svg(self, prompt_text: str) -> Dict:
+        """مسار الرسم: توليد كود SVG فقط مع فحص جودة الرسم وإعادة المحاولة عليه"""
+        if not self.model:
+            return {"svg_code": None, "quality_scores": {"svg": 0}, "quality_issues": ["فشل تهيئة النموذج"]}
+        cached = self._get_cached_track("svg", prompt_text)
+        if cached is not None:
+            return cached
+        svg_code, quality = self._run_track("svg", prompt_text, *self._svg_track_args())
+        result = self._svg_track_result(svg_code, quality)
+        self._set_cached_track("svg", prompt_text, result)
+        return result
+
+    def _svg_track_args(self) -> Tuple:
+        return (
+            self._extract_svg,
+            self.quality_checker.check_svg_quality,
+            ["إعادة كود SVG فقط يبدأ بـ <svg وينتهي بـ </svg>", "رسم SVG كامل وصالح بالأبعاد المطلوبة"],
+            "svg"
+        )
+
+    @staticmethod
+    def _svg_track_result(svg_code: Optional[str], quality: Dict) -> Dict:
+        return {
+            "svg_code": svg_code if quality['is_valid'] else None,
+            "quality_scores": {"svg": quality['score']},
+            "quality_issues": [] if quality['is_valid'] else [f"رسم: {issue}" for issue in quality['issues']]
+        }
+
+    def submit_svg_query(self, prompt_text: str) -> "Future[Dict]":
+        """تشغيل مسار الرسم في الخلفية (لاستخدامه أثناء تدفق الشرح)"""
+        return self._executor.submit(self.query_svg, prompt_text)
+
+    @staticmethod
+    def merge_track_results(explanation_result: Dict, svg_result: Optional[Dict]) -> Dict:
+        """دمج نتيجتي المسارين في بنية query_for_explanation_and_svg المعتادة"""
+        merged = {
+            "text_explanation": explanation_result.get("text_explanation"),
+            "svg_code": None,
+            "quality_scores": dict(explanation_result.get("quality_scores", {})),
+            "quality_issues": list(explanation_result.get("quality_issues", []))
+        }
+        if svg_result:
+            merged["svg_code"] = svg_result.get("svg_code")
+            merged["quality_scores"].update(svg_result.get("quality_scores", {}))
+            merged["quality_issues"].extend(svg_result.get("quality_issues", []))
+        return merged
+
+    def query_explanation_and_svg_parallel(self, explanation_prompt: str, svg_prompt: Optional[str] = None) -> Dict:
+        """تشغيل مسار الشرح ومسار الرسم بالتوازي؛ لا يُطلب الرسم إلا إذا مُرر svg_prompt"""
+        svg_future = self.submit_svg_query(svg_prompt) if svg_prompt else None
+        explanation_result = self.query_explanation(explanation_prompt)
+        svg_result = None
+        if svg_future is not None:
+            try:
+                svg_result = svg_future.result()
+            except Exception as e:
+                print(f"ERROR: SVG track failed: {e}")
+                svg_result = {"svg_code": None, "quality_scores": {"svg": 0}, "quality_issues": [f"رسم: {e}"]}
+        return self.merge_track_results(explanation_result, svg_result)
+
+    def query_for_explanation_and_svg(self, prompt_text: str, text_only: bool = False) -> Dict:
+        """الاستعلام الرئيسي مع إعادة المحاولة
+        
+        text_only=True: نمط الشرح فقط (ميزانية إخراج أصغر، بدون فحص جودة الرسم وبدون إعادة محاولة بسبب الرسم).
+        يجب أن يكون البرومبت مبنياً بـ get_specialized_prompt(include_svg=False).
+        """
+        if text_only:
+            return self.query_explanation(prompt_text)
         if not self.model:
             print("ERROR: Gemini model not initialized")
             return {
@@ -256,42 +643,20 @@ class GeminiClientVertexAI:
             }
 
         current_prompt = prompt_text
-        last_explanation = None
-        last_svg = None
        
         for attempt in range(self.max_retries + 1):
             print(f"INFO: Sending request to Gemini (Attempt {attempt + 1})")
            
             try:
-                generation_config = {
-                    "max_output_tokens": 8192,
-                    "temperature": 0.65 if attempt == 0 else 0.5,
-                    "top_p": 0.95,
-                    "top_k": 40
-                }
-               
-                safety_settings = {
-                    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                }
-               
                 response = self.model.generate_content(
                     current_prompt,
-                    generation_config=generation_config,
-                    safety_settings=safety_settings,
+                    generation_config=self._generation_config(attempt),
+                    safety_settings=self._safety_settings(),
                     stream=False
                 )
                
                 # استخراج النص
-                raw_response_text = ""
-                if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
-                    for part in response.candidates[0].content.parts:
-                        if hasattr(part, 'text'):
-                            raw_response_text += part.text
-                elif hasattr(response, 'text'):
-                    raw_response_text = response.text
+                raw_response_text = self._response_text(response)
                
                 if not raw_response_text.strip():
                     raise ValueError("رد فارغ من Gemini")
@@ -309,8 +674,6 @@ class GeminiClientVertexAI:
                
                 explanation = data.get("text_explanation")
                 svg_code = data.get("svg_code")
-                last_explanation = explanation
-                last_svg = svg_code
 
                 # فحص الجودة
                 explanation_quality = self.quality_checker.check_explanation_quality(explanation)
@@ -340,7 +703,7 @@ class GeminiClientVertexAI:
                 # إعادة المحاولة إذا كانت الجودة منخفضة
                 if attempt < self.max_retries:
                     print(f"INFO: Low-quality response, retrying...")
-                    current_prompt = self._create_retry_prompt(prompt_text, current_issues, last_explanation, last_svg)
+                    current_prompt = self._create_retry_prompt(prompt_text, current_issues)
                     continue
                 else:
                     # إرجاع أفضل ما لدينا
@@ -354,7 +717,7 @@ class GeminiClientVertexAI:
             except Exception as e:
                 print(f"ERROR: Exception during attempt {attempt + 1}: {e}")
                 if attempt < self.max_retries:
-                    current_prompt = self._create_retry_prompt(prompt_text, [str(e)], last_explanation, last_svg)
+                    current_prompt = self._create_retry_prompt(prompt_text, [str(e)])
                     continue
                 else:
                     error_message = f"حدث خطأ: {e}"
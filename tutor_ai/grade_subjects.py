@@ -0,0 +1,73 @@
+# tutor_ai/grade_subjects.py
+
+# إعدادات الصفوف والمواد (مشتركة بين التطبيق وأداة البناء python -m tutor_ai.build)
+GRADE_SUBJECTS = {
+    'grade_1': {
+        'name': 'الصف الأول الابتدائي',
+        'subjects': {
+            'arabic': 'لغتي الجميلة',
+            'math': 'الرياضيات',
+            'science': 'العلوم',
+            'islamic': 'التربية الإسلامية',
+            'english': 'اللغة الإنجليزية'
+        }
+    },
+    'grade_2': {
+        'name': 'الصف الثاني الابتدائي',
+        'subjects': {
+            'arabic': 'لغتي الجميلة',
+            'math': 'الرياضيات',
+            'science': 'العلوم',
+            'islamic': 'التربية الإسلامية',
+            'english': 'اللغة الإنجليزية'
+        }
+    },
+    'grade_3': {
+        'name': 'الصف الثالث الابتدائي',
+        'subjects': {
+            'arabic': 'لغتي الجميلة',
+            'math': 'الرياضيات',
+            'science': 'العلوم',
+            'islamic': 'التربية الإسلامية',
+            'english': 'اللغة الإنجليزية'
+        }
+    },
+    'grade_4': {
+        'name': 'الصف الرابع الابتدائي',
+        'subjects': {
+            'arabic': 'لغتي الجميلة',
+            'math': 'الرياضيات',
+            'science': 'العلوم',
+            'islamic': 'التربية الإسلامية',
+            'english': 'اللغة الإنجليزية'
+        }
+    },
+    'grade_5': {
+        'name': 'الصف الخامس الابتدائي',
+        'subjects': {
+            'arabic': 'لغتي الجميلة',
+            'math': 'الرياضيات',
+            'science': 'العلوم',
+            'islamic': 'التربية الإسلامية',
+            'english': 'اللغة الإنجليزية'
+        }
+    },
+    'grade_6': {
+        'name': 'الصف السادس الابتدائي',
+        'subjects': {
+            'arabic': 'لغتي الجميلة',
+            'math': 'الرياضيات',
+            'science': 'العلوم',
+            'islamic': 'التربية الإسلامية',
+            'english': 'اللغة الإنجليزية'
+        }
+    }
+}
+
+SUBJECT_FOLDERS = {
+    'arabic': 'lughati',
+    'math': 'Math',
+    'science': 'Science',
+    'islamic': 'الدراسات الاسلامية',
+    'english': 'English'
+}
@@ -0,0 +1,127 @@
+# tutor_ai/kb_manifest.py
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Set
+
+
+# إصدار بنية السجل - أي تغيير في طريقة حساب معرفات الأجزاء يتطلب رفعه
+# 2: تطبيع النص العربي قبل التقسيم ومعرفات مبنية على المحتوى فقط
+# 3: تقسيم حسب بنية المنهج (الوحدة/الدرس) مع بيانات وصفية لكل جزء
+MANIFEST_VERSION = 3
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def manifest_path_for(chroma_parent_dir: str, collection_name: str) -> str:
+    """مسار ملف السجل المجاور لمجلد المجموعة chroma_dbs/<collection>"""
+    return os.path.join(chroma_parent_dir, f"{collection_name}{MANIFEST_SUFFIX}")
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """بصمة SHA-256 لمحتوى الملف"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """بصمة SHA-256 لنص"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class BuildManifest:
+    """سجل بصمات الملفات والأجزاء لمجموعة ChromaDB واحدة - يسمح بإعادة البناء التزايدية"""
+
+    def __init__(self, path: str, collection_name: str, data: Optional[Dict] = None):
+        self.path = path
+        self.collection_name = collection_name
+        self.exists = data is not None
+        self.data = data if data is not None else self._empty(None)
+
+    def _empty(self, embedding_model: Optional[str]) -> Dict:
+        return {
+            "version": MANIFEST_VERSION,
+            "collection": self.collection_name,
+            "embedding_model": embedding_model,
+            "updated_at": None,
+            "files": {}
+        }
+
+    @classmethod
+    def load(cls, path: str, collection_name: str) -> "BuildManifest":
+        """تحميل السجل من القرص (أو سجل فارغ إذا لم يوجد أو كان تالفاً)"""
+        if not os.path.exists(path):
+            return cls(path, collection_name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict) or not isinstance(data.get("files"), dict):
+                raise ValueError("بنية السجل غير صالحة")
+            return cls(path, collection_name, data)
+        except Exception as e:
+            print(f"KB_MANIFEST WARNING: تعذر قراءة السجل {path}: {e}. سيتم اعتباره غير موجود.")
+            return cls(path, collection_name)
+
+    def save(self) -> None:
+        """حفظ السجل بشكل ذري (كتابة ملف مؤقت ثم استبداله)"""
+        self.data["updated_at"] = time.time()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        self.exists = True
+
+    def delete(self) -> None:
+        """حذف ملف السجل من القرص"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.exists = False
+        self.data = self._empty(None)
+
+    def is_compatible(self, embedding_model: Optional[str]) -> bool:
+        """هل يمكن البناء فوق هذا السجل؟ (نفس الإصدار ونفس نموذج التضمين)"""
+        return (
+            self.exists and
+            self.data.get("version") == MANIFEST_VERSION and
+            self.data.get("embedding_model") == embedding_model
+        )
+
+    def reset(self, embedding_model: Optional[str]) -> None:
+        """تفريغ السجل استعداداً لإعادة بناء كاملة"""
+        self.data = self._empty(embedding_model)
+
+    @property
+    def files(self) -> Dict[str, Dict]:
+        return self.data["files"]
+
+    def file_entry(self, rel_path: str) -> Optional[Dict]:
+        return self.files.get(rel_path)
+
+    def set_file(self, rel_path: str, file_hash: str, size: int, chunk_ids: List[str]) -> None:
+        self.files[rel_path] = {
+            "hash": file_hash,
+            "size": size,
+            "chunk_ids": list(chunk_ids)
+        }
+
+    def remove_file(self, rel_path: str) -> None:
+        self.files.pop(rel_path, None)
+
+    def all_chunk_ids(self) -> Set[str]:
+        """جميع معرفات الأجزاء المسجلة في المجموعة"""
+        ids: Set[str] = set()
+        for entry in self.files.values():
+            ids.update(entry.get("chunk_ids", []))
+        return ids
+
+    def chunk_sources(self) -> Dict[str, List[str]]:
+        """الملفات التي تشير إلى كل جزء (يتكرر الملف بعدد مرات ظهور الجزء فيه)"""
+        sources: Dict[str, List[str]] = {}
+        for rel_path in sorted(self.files):
+            for chunk_id in self.files[rel_path].get("chunk_ids", []):
+                sources.setdefault(chunk_id, []).append(rel_path)
+        return sources
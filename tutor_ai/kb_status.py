@@ -0,0 +1,129 @@
+# tutor_ai/kb_status.py
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+
+STATUS_VERSION = 1
+STATUS_SUFFIX = ".status.json"
+
+# أسماء مجلدات المواد العربية -> أسماء المجموعات في ChromaDB
+_SUBJECT_COLLECTION_NAMES = {
+    "الدراسات_الاسلامية": "islamic_studies",
+    "المهارات_الأسرية": "family_skills",
+}
+
+
+def collection_name_for(grade_folder: str, subject_folder: str) -> str:
+    """اسم مجموعة ChromaDB لصف ومادة - نفس الاسم في المدير وفي فحص الحالة"""
+    clean_grade_folder = grade_folder.replace(" ", "_").lower()
+    subject_folder_cleaned = subject_folder.replace(" ", "_").lower()
+    for arabic_name, english_name in _SUBJECT_COLLECTION_NAMES.items():
+        subject_folder_cleaned = subject_folder_cleaned.replace(arabic_name, english_name)
+    return f"{clean_grade_folder}_{subject_folder_cleaned}_coll"
+
+
+def status_path_for(chroma_parent_dir: str, collection_name: str) -> str:
+    """مسار ملف الحالة المختصر المجاور لسجل البناء"""
+    return os.path.join(chroma_parent_dir, f"{collection_name}{STATUS_SUFFIX}")
+
+
+def directory_mtimes(docs_path: str) -> Dict[str, int]:
+    """أزمنة تعديل مجلد المستندات ومجلداته الفرعية (المفتاح مسار نسبي، "." للجذر)"""
+    mtimes: Dict[str, int] = {}
+    for dir_path, _, _ in os.walk(docs_path):
+        rel_dir = os.path.relpath(dir_path, docs_path).replace(os.sep, "/")
+        mtimes[rel_dir] = os.stat(dir_path).st_mtime_ns
+    return mtimes
+
+
+def file_stats(docs_path: str, rel_paths) -> Dict[str, List[int]]:
+    """[الحجم، زمن التعديل ns] لكل ملف - تعديل ملف في مكانه لا يغيّر زمن تعديل مجلده"""
+    stats: Dict[str, List[int]] = {}
+    for rel_path in rel_paths:
+        try:
+            file_stat = os.stat(os.path.join(docs_path, rel_path))
+        except OSError:
+            continue
+        stats[rel_path] = [file_stat.st_size, file_stat.st_mtime_ns]
+    return stats
+
+
+def write_status(path: str, collection_name: str, docs_path: str, files: Dict[str, str],
+                 chunk_count: int, embedding_model: Optional[str]) -> Dict[str, Any]:
+    """كتابة حالة المجموعة بعد البناء (ذرياً): بصمات الملفات وأحجامها وأزمنتها، عدد الأجزاء، النموذج، زمن البناء وأزمنة المجلدات"""
+    data = {
+        "version": STATUS_VERSION,
+        "collection": collection_name,
+        "embedding_model": embedding_model,
+        "built_at": time.time(),
+        "chunk_count": chunk_count,
+        "file_count": len(files),
+        "file_types": sorted({os.path.splitext(rel_path)[1] for rel_path in files}),
+        "files": dict(sorted(files.items())),
+        "file_stats": file_stats(docs_path, sorted(files)),
+        "dir_mtimes": directory_mtimes(docs_path) if os.path.isdir(docs_path) else {}
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+    return data
+
+
+def read_status(path: str) -> Optional[Dict[str, Any]]:
+    """قراءة ملف الحالة (None إذا لم يوجد أو كان من إصدار آخر)"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) and data.get("version") == STATUS_VERSION else None
+
+
+def check_collection_status(chroma_parent_dir: str, docs_path: str, collection_name: str) -> Dict[str, Any]:
+    """حالة مجموعة من ملف حالتها فقط: قراءة ملف واحد و stat لكل مجلد وملف مسجل - بدون قراءة الملفات
+
+    إضافة ملف أو حذفه أو إعادة تسميته تغيّر زمن تعديل مجلده، وتعديل ملف في مكانه يغيّر حجمه أو زمن
+    تعديله؛ في الحالتين تصبح الحالة "قديمة" ويُعاد البناء التزايدي الذي يقارن المحتوى بالبصمات.
+    """
+    status = read_status(status_path_for(chroma_parent_dir, collection_name))
+    if status is None:
+        return {"built": False, "stale": True, "reason": "لا يوجد ملف حالة"}
+
+    result = {
+        "built": True,
+        "stale": False,
+        "reason": "",
+        "chunk_count": status.get("chunk_count", 0),
+        "file_count": status.get("file_count", 0),
+        "file_types": status.get("file_types", []),
+        "embedding_model": status.get("embedding_model"),
+        "built_at": status.get("built_at")
+    }
+    recorded_mtimes = status.get("dir_mtimes", {})
+    if not recorded_mtimes:
+        result.update(stale=os.path.isdir(docs_path), reason="مجلد المستندات لم يكن موجوداً عند البناء")
+        return result
+    for rel_dir, mtime in recorded_mtimes.items():
+        try:
+            current = os.stat(os.path.join(docs_path, rel_dir)).st_mtime_ns
+        except OSError:
+            result.update(stale=True, reason=f"المجلد {rel_dir} لم يعد موجوداً")
+            return result
+        if current != mtime:
+            result.update(stale=True, reason=f"تغيرت محتويات المجلد {rel_dir}")
+            return result
+    # ملفات حالة أقدم بدون file_stats: فحص المجلدات فقط
+    for rel_path, (size, mtime) in status.get("file_stats", {}).items():
+        try:
+            file_stat = os.stat(os.path.join(docs_path, rel_path))
+        except OSError:
+            result.update(stale=True, reason=f"الملف {rel_path} لم يعد موجوداً")
+            return result
+        if file_stat.st_size != size or file_stat.st_mtime_ns != mtime:
+            result.update(stale=True, reason=f"تغير الملف {rel_path}")
+            return result
+    return result
@@ -1,10 +1,38 @@
 # tutor_ai/knowledge_base_manager.py
+from __future__ import annotations
+
+import importlib.util
+import json
 import os
 import shutil
+import threading
+import time
 import traceback
-from typing import List, Optional, Dict, Any
+from typing import TYPE_CHECKING, List, Optional, Dict, Any, Tuple
 from dotenv import load_dotenv
 
+from .kb_manifest import BuildManifest, manifest_path_for, hash_file, hash_text
+from .embedding_pipeline import EmbeddingPipeline, DEFAULT_BATCH_SIZE, DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_MINUTE
+from .embedding_cache import CachedEmbeddings
+from .embedding_provider import EMBEDDING_MODELS, get_embedding_provider
+from .query_cache import normalize_query, query_embedding_cache, search_results_cache
+from .single_flight import get_single_flight
+from .document_loading import DEFAULT_LOADER_WORKERS, iter_loaded_files, scan_document_files
+from .arabic_normalizer import normalize_arabic
+from .curriculum_chunker import CurriculumChunker
+from .curriculum_index import get_curriculum_index
+from .lesson_index import DEFAULT_LESSON_CONTEXT_CHARS, LessonIndex, lesson_index_path_for
+from .lexical_index import LexicalIndex, lexical_index_path_for, open_lexical_index, reciprocal_rank_fusion
+from .chunk_dedup import DEFAULT_DEDUP_THRESHOLD, ChunkDeduplicator, SignatureStore, minhash_signature, signatures_path_for
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+    from langchain_core.documents import Document
+    from langchain_google_vertexai import VertexAIEmbeddings
+
+from .chroma_store import (DEFAULT_STORE_LAYOUT, SHARED_LAYOUT, close_chroma_client, delete_stored_collection,
+                           get_chroma_client, release_chroma_client, vector_store_path_for)
+from .kb_status import collection_name_for, read_status, status_path_for, write_status
+
 
 # تحميل متغيرات البيئة
 load_dotenv()
@@ -13,47 +41,45 @@ load_dotenv()
 # إعدادات المسارات
 KNOWLEDGE_BASE_PARENT_DOCS_DIR = "knowledge_base_docs"
 CHROMA_DB_PARENT_DIRECTORY = "chroma_dbs"
+EMBEDDING_CACHE_PATH = os.path.join(CHROMA_DB_PARENT_DIRECTORY, "embedding_cache.sqlite3")
+EMBEDDING_PROVIDER_STATE_PATH = os.path.join(CHROMA_DB_PARENT_DIRECTORY, "embedding_provider.json")
 
+# تقدير ذاكرة HNSW لكل متجه فوق قيمه (روابط الطبقة الأساسية M=16 ثنائية الاتجاه + المعرف)
+HNSW_BYTES_PER_VECTOR_OVERHEAD = 2 * 16 * 4 + 16
+DEFAULT_EMBEDDING_DIMENSION = 768
 
-# محاولة استيراد المكتبات المطلوبة
-try:
-    from langchain_community.document_loaders import (
-        UnstructuredMarkdownLoader,
-        TextLoader,
-        DirectoryLoader,
-        Docx2txtLoader,
-    )
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from langchain_core.documents import Document
-    LANGCHAIN_LOADERS_AVAILABLE = True
-except ImportError as e:
-    print(f"KB_MANAGER WARNING: LangChain document loaders not available: {e}")
-    LANGCHAIN_LOADERS_AVAILABLE = False
+# "hybrid": فهرس نصي BM25 + بحث متجهي مدمجان (مع الاكتفاء بالنص عند الثقة)، "vector": بحث متجهي فقط
+DEFAULT_RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
 
+# دمج عمليات البحث المتطابقة الجارية في الوقت نفسه (مشتركة بين جميع المديرين في العملية)
+retrieval_flights = get_single_flight("retrieval")
+embedding_flights = get_single_flight("embeddings")
 
-try:
-    from langchain_chroma import Chroma
-    LANGCHAIN_CHROMA_AVAILABLE = True
-except ImportError:
+
+# فحص توفر المكتبات المطلوبة بدون استيرادها: LangChain و ChromaDB و Vertex AI تُستورد عند أول استخدام فقط
+# (التطبيق لا يحتاج محمّلات المستندات والمقسّم إطلاقاً، و ChromaDB تُفتح عند أول سؤال)
+def _module_available(module_name: str) -> bool:
+    return importlib.util.find_spec(module_name) is not None
+
+
+LANGCHAIN_LOADERS_AVAILABLE = all(_module_available(name) for name in ("langchain", "langchain_community", "langchain_core"))
+if not LANGCHAIN_LOADERS_AVAILABLE:
+    print("KB_MANAGER WARNING: LangChain document loaders not available. Please install langchain and langchain-community.")
+
+
+LANGCHAIN_CHROMA_AVAILABLE = _module_available("langchain_chroma")
+if not LANGCHAIN_CHROMA_AVAILABLE:
     print("KB_MANAGER WARNING: LangChain Chroma integration not available. Please install langchain-chroma.")
-    LANGCHAIN_CHROMA_AVAILABLE = False
 
 
-try:
-    from langchain_google_vertexai import VertexAIEmbeddings
-    import vertexai
-    VERTEX_AI_AVAILABLE = True
-except ImportError:
+VERTEX_AI_AVAILABLE = _module_available("langchain_google_vertexai") and _module_available("vertexai")
+if not VERTEX_AI_AVAILABLE:
     print("KB_MANAGER WARNING: Vertex AI components not available. Please install google-cloud-aiplatform.")
-    VERTEX_AI_AVAILABLE = False
 
 
-try:
-    import chromadb
-    CHROMADB_AVAILABLE = True
-except ImportError:
+CHROMADB_AVAILABLE = _module_available("chromadb")
+if not CHROMADB_AVAILABLE:
     print("KB_MANAGER WARNING: ChromaDB not available. Please install chromadb.")
-    CHROMADB_AVAILABLE = False
 
 
 # التحقق من توفر جميع المتطلبات لـ RAG
@@ -65,13 +91,6 @@ RAG_REQUIREMENTS_MET = (
 )
 
 
-# النماذج المدعومة فعلاً (مرتبة حسب الأولوية)
-EMBEDDING_MODELS = [
-    "gemini-embedding-001",         # الأحدث والأفضل - 3072 dimensions
-    "text-embedding-005",           # نموذج حديث - 768 dimensions  
-    "text-embedding-004",           # نموذج مستقر - 768 dimensions
-    "textembedding-gecko@latest",   # محاولة أخيرة للنماذج القديمة
-]
 
 
 class KnowledgeBaseManager:
@@ -80,26 +99,56 @@ class KnowledgeBaseManager:
 
     def __init__(self, grade_folder_name: str, subject_folder_name: str,
                  project_id: str, location: str = "us-central1",
-                 force_recreate: bool = False):
+                 force_recreate: bool = False,
+                 embedding_batch_size: int = DEFAULT_BATCH_SIZE,
+                 embedding_concurrency: int = DEFAULT_MAX_WORKERS,
+                 embedding_requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 loader_workers: int = DEFAULT_LOADER_WORKERS,
+                 dedup_threshold: float = DEFAULT_DEDUP_THRESHOLD,
+                 retrieval_mode: str = DEFAULT_RETRIEVAL_MODE,
+                 store_layout: str = DEFAULT_STORE_LAYOUT):
         """
         تهيئة مدير قاعدة المعرفة
+        embedding_batch_size / embedding_concurrency: حجم دفعة التضمين وعدد الطلبات المتوازية أثناء البناء.
+        embedding_requests_per_minute: حد معدل طلبات التضمين أثناء البناء.
+        loader_workers: عدد العمليات لتحليل ملفات المنهج أثناء البناء (1 = تسلسلي).
+        dedup_threshold: حد التشابه لدمج الأجزاء شبه المتطابقة أثناء البناء (0 = تعطيل).
+        retrieval_mode: "hybrid" (نصي + متجهي) أو "vector".
+        store_layout: "per_collection" (مجلد لكل مجموعة) أو "shared" (مخزن واحد لجميع المجموعات).
+        قاعدة البيانات لا تُفتح في الإنشاء بل عند أول استخدام لـ self.db.
         """
         self.grade_folder = grade_folder_name
         self.subject_folder = subject_folder_name
         self.project_id = project_id
         self.location = location
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_concurrency = embedding_concurrency
+        self.embedding_requests_per_minute = embedding_requests_per_minute
+        self.loader_workers = loader_workers
+        self.dedup_threshold = dedup_threshold
+        self.retrieval_mode = retrieval_mode
+        self.retrieval_stats = {"lexical_only": 0, "hybrid": 0, "vector": 0}
+        self.store_layout = store_layout
+        self._db: Optional[Chroma] = None
+        self._db_opened = False
+        self._db_lock = threading.Lock()
 
 
         # إنشاء اسم فريد للـ collection في ChromaDB
-        clean_grade_folder = grade_folder_name.replace(" ", "_").lower()
-        subject_folder_cleaned = subject_folder_name.replace(" ", "_").lower()
-        subject_folder_cleaned = subject_folder_cleaned.replace("الدراسات_الاسلامية", "islamic_studies")
-        subject_folder_cleaned = subject_folder_cleaned.replace("المهارات_الأسرية", "family_skills")
-        self.collection_name = f"{clean_grade_folder}_{subject_folder_cleaned}_coll"
+        self.collection_name = collection_name_for(grade_folder_name, subject_folder_name)
 
 
         self.docs_path = os.path.join(KNOWLEDGE_BASE_PARENT_DOCS_DIR, self.grade_folder, self.subject_folder)
-        self.vector_store_path = os.path.join(CHROMA_DB_PARENT_DIRECTORY, self.collection_name)
+        self.vector_store_path = vector_store_path_for(CHROMA_DB_PARENT_DIRECTORY, self.collection_name, store_layout)
+        self.manifest_path = manifest_path_for(CHROMA_DB_PARENT_DIRECTORY, self.collection_name)
+        self.status_path = status_path_for(CHROMA_DB_PARENT_DIRECTORY, self.collection_name)
+        self.signatures_path = signatures_path_for(CHROMA_DB_PARENT_DIRECTORY, self.collection_name)
+        self.lesson_index_path = lesson_index_path_for(CHROMA_DB_PARENT_DIRECTORY, self.collection_name)
+        self._lesson_index: Optional[LessonIndex] = None
+        self._lesson_index_mtime: Optional[int] = None
+        self.lexical_index_path = lexical_index_path_for(CHROMA_DB_PARENT_DIRECTORY, self.collection_name)
+        self._lexical_index: Optional[LexicalIndex] = None
+        self._lexical_index_opened = False
 
 
         # التحقق من توفر المتطلبات الأساسية
@@ -118,120 +167,105 @@ class KnowledgeBaseManager:
         # تهيئة دالة التضمين
         self.embedding_function: Optional[VertexAIEmbeddings] = None
         self.current_model = None
-        self._init_embeddings()
+        self._init_embeddings(pin_recorded_model=not force_recreate)
 
 
         # حذف قاعدة البيانات القديمة إذا طُلب ذلك
-        if force_recreate and os.path.exists(self.vector_store_path):
+        if force_recreate and self.store_layout == SHARED_LAYOUT:
+            print(f"KB_MANAGER INFO: إجبار إعادة الإنشاء. حذف المجموعة '{self.collection_name}' من المخزن المشترك {self.vector_store_path}")
+            delete_stored_collection(self.vector_store_path, self.collection_name)
+        elif force_recreate and os.path.exists(self.vector_store_path):
+            release_chroma_client(self.vector_store_path)
             print(f"KB_MANAGER INFO: إجبار إعادة الإنشاء. حذف بيانات ChromaDB الموجودة في: {self.vector_store_path}")
             try:
                 shutil.rmtree(self.vector_store_path)
                 print(f"KB_MANAGER INFO: تم حذف المجلد {self.vector_store_path} بنجاح لمجموعة '{self.collection_name}'.")
             except OSError as e_del:
                 print(f"KB_MANAGER WARNING: تعذر حذف المجلد {self.vector_store_path}: {e_del}.")
+        for sidecar_path in (self.manifest_path, self.status_path, self.signatures_path,
+                             self.lesson_index_path, self.lexical_index_path):
+            if force_recreate and os.path.exists(sidecar_path):
+                try:
+                    os.remove(sidecar_path)
+                except OSError as e_del:
+                    print(f"KB_MANAGER WARNING: تعذر حذف سجل البناء {sidecar_path}: {e_del}.")
 
 
-        # تهيئة قاعدة البيانات
-        self.db: Optional[Chroma] = None
-        if self.embedding_function:
-            self._initialize_vector_store()
+        # المقسّم يُنشأ عند أول بناء (self.chunker)
+        self._chunker: Optional[CurriculumChunker] = None
+
 
+    @property
+    def db(self) -> Optional[Chroma]:
+        """مجموعة ChromaDB - تُفتح عند أول طلب فقط"""
+        if not self._db_opened:
+            with self._db_lock:
+                if not self._db_opened:
+                    self._db_opened = True
+                    if self.embedding_function:
+                        self._initialize_vector_store()
+        return self._db
 
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            is_separator_regex=False,
+
+    @db.setter
+    def db(self, value: Optional[Chroma]) -> None:
+        self._db = value
+        self._db_opened = True
+
+
+    @property
+    def is_open(self) -> bool:
+        """هل المجموعة مفتوحة حالياً (بدون فتحها)"""
+        return self._db is not None
+
+
+    @property
+    def chunker(self) -> CurriculumChunker:
+        """مقسّم المنهج (يستورد مقسّم LangChain عند أول استخدام فقط)"""
+        if self._chunker is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+            self.text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1000,
+                chunk_overlap=200,
+                length_function=len,
+                is_separator_regex=False,
+            )
+            self._chunker = CurriculumChunker(self.text_splitter.split_text, chunk_size=1000)
+        return self._chunker
+
+
+    def _init_embeddings(self, pin_recorded_model: bool = True):
+        """الحصول على عميل التضمين المشترك (فحص النماذج وتهيئة Vertex AI يتمان مرة واحدة لكل عملية)
+
+        مجموعة مبنية مسبقاً تستخدم دائماً النموذج المسجل في ملف حالتها أو سجل بنائها، حتى لو اختار
+        الفحص نموذجاً آخر (بأبعاد مختلفة) - النموذج لا يتغير إلا بإعادة البناء الكاملة (force_recreate).
+        """
+        self.embedding_provider = get_embedding_provider(
+            self.project_id, self.location,
+            state_path=EMBEDDING_PROVIDER_STATE_PATH, cache_path=EMBEDDING_CACHE_PATH
         )
+        recorded_model = self._recorded_embedding_model() if pin_recorded_model else None
+        if recorded_model:
+            self.embedding_function = self.embedding_provider.get_client_for_model(recorded_model)
+            self.current_model = recorded_model if self.embedding_function else None
+        else:
+            self.embedding_function = self.embedding_provider.get_client()
+            self.current_model = self.embedding_provider.model_name if self.embedding_function else None
+        if self.embedding_function:
+            print(f"KB_MANAGER INFO: {self.collection_name} يستخدم نموذج التضمين المشترك '{self.current_model}'")
+        else:
+            print(f"KB_MANAGER ERROR: لا يتوفر نموذج تضمين لـ {self.collection_name}.")
 
 
-    def _init_embeddings(self):
-        """تهيئة دوال التضمين من Vertex AI مع النماذج المدعومة الجديدة"""
-        try:
-            # البحث عن بيانات الاعتماد
-            cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-            
-            # إذا لم تجد في متغير البيئة، تحقق من Streamlit Secrets
-            if not cred_path or not os.path.exists(cred_path):
-                try:
-                    import streamlit as st
-                    if hasattr(st, 'secrets'):
-                        import tempfile
-                        import json
-                        
-                        credentials_json = st.secrets.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
-                        if credentials_json:
-                            if isinstance(credentials_json, str):
-                                credentials_dict = json.loads(credentials_json)
-                            else:
-                                credentials_dict = credentials_json
-                            
-                            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-                                json.dump(credentials_dict, f)
-                                cred_path = f.name
-                                os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = cred_path
-                                print(f"KB_MANAGER INFO: تم إنشاء ملف مؤقت للاعتماد: {cred_path}")
-                except:
-                    pass
-
-
-            if not cred_path or not os.path.exists(cred_path):
-                print(f"KB_MANAGER ERROR: GOOGLE_APPLICATION_CREDENTIALS غير مضبوط بشكل صحيح.")
-                self.embedding_function = None
-                return
-
-
-            # تهيئة Vertex AI
-            vertexai.init(project=self.project_id, location=self.location)
-            print(f"KB_MANAGER INFO: تم تهيئة Vertex AI للمشروع '{self.project_id}' في المنطقة '{self.location}'")
-            
-            # محاولة النماذج المدعومة بالترتيب
-            for model_name in EMBEDDING_MODELS:
-                try:
-                    print(f"KB_MANAGER INFO: محاولة نموذج التضمين '{model_name}'...")
-                    
-                    # إنشاء نموذج التضمين
-                    self.embedding_function = VertexAIEmbeddings(
-                        model_name=model_name,
-                        project=self.project_id,
-                        location=self.location
-                    )
-                    
-                    # اختبار النموذج بنص بسيط
-                    try:
-                        test_embedding = self.embedding_function.embed_query("اختبار النموذج")
-                        if test_embedding and len(test_embedding) > 0:
-                            self.current_model = model_name
-                            embedding_dim = len(test_embedding)
-                            print(f"KB_MANAGER SUCCESS: ✅ تم تهيئة VertexAIEmbeddings بنجاح!")
-                            print(f"  النموذج: {model_name}")
-                            print(f"  أبعاد التضمين: {embedding_dim}")
-                            print(f"  المشروع: {self.project_id}")
-                            print(f"  المنطقة: {self.location}")
-                            return
-                    except Exception as test_error:
-                        print(f"KB_MANAGER WARNING: فشل اختبار النموذج '{model_name}': {test_error}")
-                        continue
-                        
-                except Exception as model_error:
-                    print(f"KB_MANAGER WARNING: فشل تهيئة نموذج '{model_name}': {model_error}")
-                    continue
-            
-            # إذا فشلت جميع النماذج
-            print(f"KB_MANAGER ERROR: فشلت جميع نماذج التضمين المتاحة.")
-            print(f"تأكد من:")
-            print(f"1. تفعيل Vertex AI API في مشروع '{self.project_id}'")
-            print(f"2. أن حساب الخدمة لديه صلاحية 'Vertex AI User'")
-            print(f"3. أن المشروع يدعم نماذج التضمين في المنطقة '{self.location}'")
-            print(f"4. أن المشروع ليس جديداً (النماذج الجديدة تحتاج استخدام سابق)")
-            self.embedding_function = None
-            self.current_model = None
-            
-        except Exception as e:
-            print(f"KB_MANAGER ERROR: فشل عام في تهيئة VertexAIEmbeddings: {e}")
-            traceback.print_exc()
-            self.embedding_function = None
-            self.current_model = None
+    def _recorded_embedding_model(self) -> Optional[str]:
+        """نموذج التضمين الذي بُنيت به المجموعة (ملف الحالة ثم سجل البناء) أو None إذا لم تُبن"""
+        status = read_status(self.status_path) or {}
+        if status.get("embedding_model"):
+            return status["embedding_model"]
+        if os.path.exists(self.manifest_path):
+            return BuildManifest.load(self.manifest_path, self.collection_name).data.get("embedding_model")
+        return None
 
 
     def _initialize_vector_store(self) -> None:
@@ -250,7 +284,9 @@ class KnowledgeBaseManager:
 
 
         try:
-            client = chromadb.PersistentClient(path=self.vector_store_path)
+            from langchain_chroma import Chroma
+
+            client = get_chroma_client(self.vector_store_path)
 
 
             self.db = Chroma(
@@ -274,8 +310,13 @@ class KnowledgeBaseManager:
             self.db = None
 
 
-    def _load_documents(self) -> List[Document]:
-        """تحميل المستندات من المجلد المحدد"""
+    def _scan_document_files(self) -> List[str]:
+        """مسح مجلد المستندات مرة واحدة وإرجاع الملفات المدعومة بترتيب ثابت"""
+        return scan_document_files(self.docs_path)
+
+
+    def _load_documents(self, file_paths: Optional[List[str]] = None) -> List[Document]:
+        """تحميل المستندات من المجلد المحدد (أو من قائمة ملفات محددة فقط)"""
         if not LANGCHAIN_LOADERS_AVAILABLE:
             print(f"KB_MANAGER ERROR: LangChain document loaders غير متوفرة لـ {self.collection_name}")
             return []
@@ -285,46 +326,26 @@ class KnowledgeBaseManager:
             print(f"KB_MANAGER WARNING: مسار المستندات {self.docs_path} غير موجود لـ {self.collection_name}.")
             return []
        
-        if not os.listdir(self.docs_path):
+        if file_paths is None:
+            file_paths = self._scan_document_files()
+
+        if not file_paths:
             print(f"KB_MANAGER WARNING: مسار المستندات {self.docs_path} فارغ لـ {self.collection_name}.")
             return []
 
 
-        print(f"KB_MANAGER INFO: تحميل المستندات لـ {self.collection_name} من: {self.docs_path}")
+        print(f"KB_MANAGER INFO: تحميل {len(file_paths)} ملف لـ {self.collection_name} من: {self.docs_path}")
        
+        from langchain_core.documents import Document
+
         all_docs: List[Document] = []
        
-        # معالجات الملفات المختلفة
-        file_handlers: Dict[str, Dict[str, Any]] = {
-            "**/*.md": {"loader_cls": UnstructuredMarkdownLoader, "loader_kwargs": {}},
-            "**/*.txt": {"loader_cls": TextLoader, "loader_kwargs": {'encoding': 'utf-8'}},
-            "**/*.docx": {"loader_cls": Docx2txtLoader, "loader_kwargs": {}},
-        }
-
-
-        for glob_pattern, handler_config in file_handlers.items():
-            loader_cls = handler_config["loader_cls"]
-            loader_kwargs = handler_config["loader_kwargs"]
-           
-            print(f"KB_MANAGER INFO: محاولة تحميل الملفات بنمط '{glob_pattern}' باستخدام {loader_cls.__name__}...")
-           
-            try:
-                current_loader = DirectoryLoader(
-                    self.docs_path,
-                    glob=glob_pattern,
-                    loader_cls=loader_cls,
-                    loader_kwargs=loader_kwargs,
-                    show_progress=True,
-                    silent_errors=True
-                )
-                loaded_docs = current_loader.load()
-                if loaded_docs:
-                    all_docs.extend(loaded_docs)
-                    print(f"KB_MANAGER INFO: تم تحميل {len(loaded_docs)} مستند(ات) بنجاح باستخدام النمط '{glob_pattern}'.")
-                else:
-                    print(f"KB_MANAGER INFO: لم يتم العثور على مستندات أو تحميلها للنمط '{glob_pattern}'.")
-            except Exception as e_load:
-                print(f"KB_MANAGER ERROR: فشل تحميل المستندات بنمط '{glob_pattern}' باستخدام {loader_cls.__name__}: {e_load}")
+        # تحليل الملفات على عدة عمليات؛ كل ملف يصل فور انتهائه مع زمن تحليله
+        # النص يُخزن كما هو (التشكيل وآيات القرآن تُعرض للطالب وتُرسل لـ Gemini دون تغيير)؛
+        # التطبيع العربي يُطبق فقط على المعرفات والتواقيع والتضمين والفهرس النصي
+        for loaded_file in iter_loaded_files(file_paths, max_workers=self.loader_workers, label=self.collection_name):
+            for page_content, metadata in loaded_file.documents:
+                all_docs.append(Document(page_content=page_content, metadata=metadata))
 
 
         print(f"KB_MANAGER INFO: إجمالي المستندات المحملة لـ {self.collection_name}: {len(all_docs)}")
@@ -334,17 +355,141 @@ class KnowledgeBaseManager:
 
 
     def _split_documents(self, documents: List[Document]) -> List[Document]:
-        """تقسيم المستندات إلى قطع أصغر"""
+        """تقسيم المستندات حسب بنية المنهج مع وسم كل جزء بالصف والمادة والوحدة والدرس والملف"""
         if not documents:
             return []
        
-        split_docs = self.text_splitter.split_documents(documents)
+        from langchain_core.documents import Document
+
+        split_docs: List[Document] = []
+        for document in documents:
+            metadata = {
+                **document.metadata,
+                "grade": self.grade_folder,
+                "subject": self.subject_folder,
+                "file": self._relative_source(document.metadata.get("source", ""))
+            }
+            for chunk_text, chunk_metadata in self.chunker.split(document.page_content, metadata):
+                split_docs.append(Document(page_content=chunk_text, metadata=chunk_metadata))
         print(f"KB_MANAGER INFO: تم تقسيم {len(documents)} مستند إلى {len(split_docs)} جزء لـ {self.collection_name}.")
         return split_docs
 
 
+    def _relative_source(self, source_path: str) -> str:
+        """المسار النسبي للملف داخل مجلد المادة (مفتاح السجل)"""
+        return os.path.relpath(source_path, self.docs_path).replace(os.sep, "/")
+
+
+    def _assign_chunk_ids(self, chunks: List[Document]) -> Dict[str, List[Tuple[str, Document]]]:
+        """حساب معرفات ثابتة للأجزاء من بصمة المحتوى وتجميعها حسب الملف
+
+        المعرف مبني على المحتوى المطبّع فقط، فالجزء نفسه في ملفين (مثل النسخة المشكولة وغير المشكولة) يُخزن ويُضمّن مرة واحدة.
+        """
+        chunks_by_file: Dict[str, List[Tuple[str, Document]]] = {}
+        seen_ids: Dict[Tuple[str, str], int] = {}
+        for chunk in chunks:
+            rel_path = self._relative_source(chunk.metadata.get("source", ""))
+            base_id = hash_text(normalize_arabic(chunk.page_content))[:32]
+            # الأجزاء المتطابقة داخل الملف نفسه تحصل على لاحقة ترتيبية
+            occurrence = seen_ids.get((rel_path, base_id), 0)
+            seen_ids[(rel_path, base_id)] = occurrence + 1
+            chunk_id = base_id if occurrence == 0 else f"{base_id}-{occurrence}"
+            chunks_by_file.setdefault(rel_path, []).append((chunk_id, chunk))
+        return chunks_by_file
+
+
+    def _deduplicate_chunks(self, chunks_by_file: Dict[str, List[Tuple[str, Document]]],
+                            retained_ids: set, signature_store: SignatureStore) -> Dict[str, Any]:
+        """استبدال الأجزاء المكررة أو شبه المتطابقة (MinHash/LSH) بمعرف الجزء المحتفظ به
+
+        تُقارن الأجزاء الجديدة بالأجزاء المخزنة التي تبقى مستخدمة من الملفات غير المعدلة ثم ببعضها،
+        بترتيب ثابت للملفات حتى يكون الجزء المحتفظ به هو نفسه في كل بناء.
+        """
+        deduplicator = ChunkDeduplicator(self.dedup_threshold)
+        missing_ids = sorted(chunk_id for chunk_id in retained_ids if chunk_id not in signature_store.signatures)
+        if missing_ids:
+            # مجموعة بُنيت قبل تفعيل إزالة التكرار: حساب تواقيع أجزائها من النصوص المخزنة
+            print(f"KB_MANAGER INFO: حساب تواقيع {len(missing_ids)} جزء مخزن لـ {self.collection_name}...")
+            stored = self.db._collection.get(ids=missing_ids, include=["documents"])
+            for chunk_id, text in zip(stored.get("ids", []), stored.get("documents", [])):
+                signature = minhash_signature(normalize_arabic(text or ""))
+                if signature is not None:
+                    signature_store.signatures[chunk_id] = signature
+        for chunk_id in sorted(retained_ids):
+            deduplicator.add(chunk_id, signature_store.signatures.get(chunk_id))
+
+        for rel_path in sorted(chunks_by_file):
+            chunks_by_file[rel_path] = [
+                (deduplicator.resolve(chunk_id, normalize_arabic(chunk.page_content)), chunk)
+                for chunk_id, chunk in chunks_by_file[rel_path]
+            ]
+        signature_store.signatures.update(deduplicator.signatures)
+
+        report = {**deduplicator.report, "seconds": round(deduplicator.report["seconds"], 3)}
+        print(f"KB_MANAGER INFO: إزالة التكرار لـ {self.collection_name}: فُحص {report['chunks_examined']} جزء، "
+              f"حُذف {report['chunks_removed']} (مطابق {report['exact_duplicates']}، شبه مطابق {report['near_duplicates']})، "
+              f"وُفّر {report['bytes_removed'] / 1024:.1f} KB خلال {report['seconds']} ثانية")
+        return report
+
+
+    @staticmethod
+    def _provenance_metadata(sources: List[str]) -> Dict[str, Any]:
+        """مصادر الجزء المحتفظ به: كل الملفات التي ظهر فيها (هو أو نسخة شبه مطابقة منه)"""
+        return {"sources": " | ".join(sorted(set(sources))), "duplicate_count": len(sources) - 1}
+
+
+    def _update_provenance(self, chunk_ids: List[str], chunk_sources: Dict[str, List[str]]) -> None:
+        """تحديث بيانات المصادر للأجزاء المخزنة التي تغيرت الملفات المشيرة إليها"""
+        stored = self.db._collection.get(ids=chunk_ids, include=["metadatas"])
+        ids = stored.get("ids", [])
+        metadatas = [
+            {**(metadata or {}), **self._provenance_metadata(chunk_sources[chunk_id])}
+            for chunk_id, metadata in zip(ids, stored.get("metadatas", []))
+        ]
+        if ids:
+            self.db._collection.update(ids=ids, metadatas=metadatas)
+
+
+    def _store_chunks(self, chunk_ids: List[str], chunks: List[Document]) -> None:
+        """تضمين الأجزاء عبر خط التضمين المتوازي وكتابتها في ChromaDB دفعة بدفعة"""
+        pipeline = EmbeddingPipeline(
+            self.embedding_function,
+            batch_size=self.embedding_batch_size,
+            max_workers=self.embedding_concurrency,
+            requests_per_minute=self.embedding_requests_per_minute,
+            label=self.collection_name
+        )
+        texts = [chunk.page_content for chunk in chunks]
+        # التضمين للنص المطبّع (كالاستعلامات في embed_query)، والمخزن هو النص الأصلي
+        for start, embeddings in pipeline.embed_batches([normalize_arabic(text) for text in texts]):
+            end = start + len(embeddings)
+            # upsert يجعل إعادة تشغيل بناء متقطع آمنة
+            self.db._collection.upsert(
+                ids=chunk_ids[start:end],
+                embeddings=embeddings,
+                documents=texts[start:end],
+                metadatas=[chunk.metadata for chunk in chunks[start:end]]
+            )
+        print(f"KB_MANAGER INFO: إحصائيات التضمين لـ {self.collection_name}: {pipeline.stats}")
+        if isinstance(self.embedding_function, CachedEmbeddings):
+            print(f"KB_MANAGER INFO: إحصائيات ذاكرة التضمين: {self.embedding_function.cache.get_stats()}")
+
+
+    def _reset_collection(self) -> bool:
+        """حذف محتوى المجموعة بالكامل (عند تغير النموذج أو غياب سجل البناء)"""
+        try:
+            self.db.delete_collection()
+        except Exception as e_reset:
+            print(f"KB_MANAGER WARNING: تعذر حذف المجموعة '{self.collection_name}': {e_reset}")
+        lexical_index = self._get_lexical_index()
+        if lexical_index is not None:
+            lexical_index.reset()
+        self._initialize_vector_store()
+        return self.db is not None
+
+
     def build_knowledge_base(self) -> bool:
-        """بناء قاعدة المعرفة"""
+        """بناء قاعدة المعرفة بشكل تزايدي: تضمين الأجزاء الجديدة أو المعدلة فقط وحذف القديمة"""
         if not RAG_REQUIREMENTS_MET:
             print(f"KB_MANAGER ERROR: متطلبات RAG غير متوفرة لـ {self.collection_name}")
             return False
@@ -362,28 +507,112 @@ class KnowledgeBaseManager:
                 return False
            
         print(f"KB_MANAGER INFO: بدء بناء قاعدة المعرفة لـ {self.collection_name} باستخدام نموذج '{self.current_model}'...")
-        documents = self._load_documents()
-       
-        if not documents:
-            print(f"KB_MANAGER WARNING: لم يتم العثور على مستندات لبناء قاعدة المعرفة لـ {self.collection_name}.")
-            return True
 
+        manifest = BuildManifest.load(self.manifest_path, self.collection_name)
+        signature_store = SignatureStore.load(self.signatures_path)
+        if not manifest.is_compatible(self.current_model):
+            # لا يمكن الوثوق بالأجزاء الموجودة: بُنيت بنموذج آخر أو بدون معرفات ثابتة
+            if self.db._collection.count() > 0:
+                print(f"KB_MANAGER INFO: سجل البناء غير متوافق لـ {self.collection_name}. إعادة بناء كاملة.")
+                if not self._reset_collection():
+                    print(f"KB_MANAGER ERROR: فشل إعادة تهيئة ChromaDB لـ {self.collection_name}.")
+                    return False
+            manifest.reset(self.current_model)
+            signature_store.signatures.clear()
 
-        split_docs = self._split_documents(documents)
-        if not split_docs:
-            print(f"KB_MANAGER WARNING: لا يوجد محتوى بعد تقسيم المستندات لـ {self.collection_name}.")
+        if not os.path.exists(self.docs_path):
+            print(f"KB_MANAGER WARNING: مسار المستندات {self.docs_path} غير موجود لـ {self.collection_name}.")
             return True
 
+        # تحديد الملفات الجديدة أو المعدلة أو المحذوفة بمقارنة البصمات
+        current_files = {self._relative_source(path): path for path in self._scan_document_files()}
+        changed_files: Dict[str, str] = {}
+        for rel_path, file_path in current_files.items():
+            file_hash = hash_file(file_path)
+            entry = manifest.file_entry(rel_path)
+            if not entry or entry.get("hash") != file_hash:
+                changed_files[rel_path] = file_hash
+        removed_files = [rel_path for rel_path in manifest.files if rel_path not in current_files]
+
+        if not changed_files and not removed_files:
+            print(f"KB_MANAGER INFO: قاعدة المعرفة {self.collection_name} محدثة. لا يوجد ما يحتاج إعادة تضمين.")
+            if not manifest.exists:
+                manifest.save()
+            if not os.path.exists(self.lesson_index_path):
+                self._update_lesson_index(manifest)
+            self._sync_lexical_index(manifest.all_chunk_ids())
+            self._write_status(manifest)
+            return True
+
+        print(f"KB_MANAGER INFO: ملفات جديدة/معدلة: {len(changed_files)}، ملفات محذوفة: {len(removed_files)} لـ {self.collection_name}.")
+
+        previous_ids = manifest.all_chunk_ids()
+        previous_sources = manifest.chunk_sources()
+        chunks_by_file: Dict[str, List[Tuple[str, Document]]] = {}
+        if changed_files:
+            documents = self._load_documents([current_files[rel_path] for rel_path in changed_files])
+            chunks_by_file = self._assign_chunk_ids(self._split_documents(documents))
+
+        dedup_report = None
+        if chunks_by_file and self.dedup_threshold > 0:
+            # الأجزاء التي تبقى مخزنة لأن ملفات غير معدلة تشير إليها
+            retained_ids = set()
+            for rel_path, entry in manifest.files.items():
+                if rel_path not in chunks_by_file and rel_path not in removed_files:
+                    retained_ids.update(entry.get("chunk_ids", []))
+            dedup_report = self._deduplicate_chunks(chunks_by_file, retained_ids, signature_store)
+
+        for rel_path in removed_files:
+            manifest.remove_file(rel_path)
+        for rel_path, file_hash in changed_files.items():
+            # الملفات التي فشل تحميلها تحتفظ بأجزائها السابقة وتُعاد محاولتها في البناء القادم
+            if rel_path not in chunks_by_file:
+                continue
+            manifest.set_file(
+                rel_path, file_hash, os.path.getsize(current_files[rel_path]),
+                [chunk_id for chunk_id, _ in chunks_by_file[rel_path]]
+            )
+
+        desired_ids = manifest.all_chunk_ids()
+        chunk_sources = manifest.chunk_sources()
+        new_chunks: Dict[str, Document] = {}
+        for rel_path in sorted(chunks_by_file):
+            for chunk_id, chunk in chunks_by_file[rel_path]:
+                # أول ظهور للجزء هو المحتفظ به؛ النسخ المكررة تُسجل كمصادر إضافية فقط
+                if chunk_id not in previous_ids and chunk_id not in new_chunks:
+                    new_chunks[chunk_id] = chunk
+        for chunk_id, chunk in new_chunks.items():
+            chunk.metadata.update(self._provenance_metadata(chunk_sources[chunk_id]))
+        provenance_changed = sorted(
+            chunk_id for chunk_id in desired_ids & previous_ids
+            if sorted(previous_sources.get(chunk_id, [])) != chunk_sources[chunk_id]
+        )
+        stale_ids = sorted(previous_ids - desired_ids)
+        if dedup_report is not None:
+            manifest.data["dedup_report"] = dedup_report
 
         try:
-            print(f"KB_MANAGER INFO: ملء مجموعة ChromaDB '{self.collection_name}' بـ {len(split_docs)} جزء...")
-            
-            self.db.add_documents(split_docs)
+            if stale_ids:
+                print(f"KB_MANAGER INFO: حذف {len(stale_ids)} جزء قديم من '{self.collection_name}'...")
+                self.db.delete(ids=stale_ids)
 
+            if new_chunks:
+                print(f"KB_MANAGER INFO: تضمين {len(new_chunks)} جزء جديد/معدل في '{self.collection_name}'...")
+                self._store_chunks(list(new_chunks.keys()), list(new_chunks.values()))
+
+            if provenance_changed:
+                self._update_provenance(provenance_changed, chunk_sources)
+
+            manifest.save()
+            signature_store.save(desired_ids)
+            self._update_lesson_index(manifest)
+            self._sync_lexical_index(desired_ids)
+            self._write_status(manifest)
 
             count_after_build = self.db._collection.count()
             print(f"KB_MANAGER SUCCESS: ✅ تم بناء قاعدة المعرفة لـ {self.collection_name} بنجاح!")
             print(f"  عدد الأجزاء: {count_after_build}")
+            print(f"  أجزاء مضافة: {len(new_chunks)}، أجزاء محذوفة: {len(stale_ids)}")
             print(f"  النموذج المستخدم: {self.current_model}")
             return True
         except Exception as e_build:
@@ -393,6 +622,122 @@ class KnowledgeBaseManager:
             return False
 
 
+    def _write_status(self, manifest: BuildManifest) -> None:
+        """ملف الحالة المختصر الذي يقرؤه فحص التطبيق بدلاً من مسح المجلدات"""
+        try:
+            write_status(
+                self.status_path, self.collection_name, self.docs_path,
+                {rel_path: entry.get("hash", "") for rel_path, entry in manifest.files.items()},
+                len(manifest.all_chunk_ids()), self.current_model
+            )
+        except OSError as e_status:
+            print(f"KB_MANAGER WARNING: تعذر كتابة ملف الحالة {self.status_path}: {e_status}")
+
+
+    def _update_lesson_index(self, manifest: BuildManifest) -> None:
+        """إعادة بناء فهرس الدروس من وسوم الوحدة/الدرس المخزنة وترتيب الأجزاء في سجل البناء"""
+        try:
+            stored = self.db._collection.get(include=["metadatas"])
+            chunk_sections = {
+                chunk_id: (str(metadata.get("unit", "")), str(metadata.get("lesson", "")))
+                for chunk_id, metadata in zip(stored.get("ids", []), stored.get("metadatas", []))
+                if metadata
+            }
+            curriculum_subject = get_curriculum_index().curriculum_data.get(self.grade_folder, {}).get(self.subject_folder)
+            lesson_index = LessonIndex.build(
+                self.lesson_index_path, self.collection_name,
+                ((rel_path, manifest.files[rel_path].get("chunk_ids", [])) for rel_path in sorted(manifest.files)),
+                chunk_sections, curriculum_subject
+            )
+            lesson_index.save()
+            print(f"KB_MANAGER INFO: فهرس الدروس لـ {self.collection_name}: {lesson_index.get_stats()}")
+        except Exception as e_index:
+            print(f"KB_MANAGER WARNING: تعذر بناء فهرس الدروس لـ {self.collection_name}: {e_index}")
+
+
+    def _get_lexical_index(self) -> Optional[LexicalIndex]:
+        """الفهرس النصي للمجموعة (يُفتح مرة واحدة؛ None إذا كانت SQLite بدون FTS5)"""
+        if not self._lexical_index_opened:
+            self._lexical_index = open_lexical_index(self.lexical_index_path)
+            self._lexical_index_opened = True
+        return self._lexical_index
+
+
+    def _sync_lexical_index(self, desired_ids: set) -> None:
+        """مطابقة الفهرس النصي مع أجزاء المجموعة: حذف الأجزاء القديمة وفهرسة الناقصة من نصوص ChromaDB"""
+        lexical_index = self._get_lexical_index()
+        if lexical_index is None:
+            return
+        try:
+            indexed_ids = lexical_index.ids()
+            stale_ids = indexed_ids - desired_ids
+            missing_ids = sorted(desired_ids - indexed_ids)
+            if stale_ids:
+                lexical_index.delete(stale_ids)
+            for offset in range(0, len(missing_ids), 500):
+                stored = self.db._collection.get(ids=missing_ids[offset:offset + 500], include=["documents"])
+                lexical_index.upsert(stored.get("ids", []), [text or "" for text in stored.get("documents", [])])
+            if stale_ids or missing_ids:
+                print(f"KB_MANAGER INFO: الفهرس النصي لـ {self.collection_name}: +{len(missing_ids)} / -{len(stale_ids)} جزء "
+                      f"(الإجمالي {lexical_index.count()})")
+        except Exception as e_lexical:
+            print(f"KB_MANAGER WARNING: تعذر تحديث الفهرس النصي لـ {self.collection_name}: {e_lexical}")
+
+
+    def _documents_by_ids(self, chunk_ids: List[str]) -> List[Document]:
+        """قراءة أجزاء محددة من ChromaDB بالترتيب المطلوب (بدون تضمين)"""
+        if not chunk_ids:
+            return []
+        from langchain_core.documents import Document
+
+        stored = self.db._collection.get(ids=chunk_ids, include=["documents", "metadatas"])
+        by_id = {
+            chunk_id: Document(page_content=text or "", metadata=metadata or {})
+            for chunk_id, text, metadata in zip(stored.get("ids", []), stored.get("documents", []), stored.get("metadatas", []))
+        }
+        return [by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id]
+
+
+    def _load_lesson_index(self) -> Optional[LessonIndex]:
+        """فهرس الدروس من القرص (يُعاد تحميله فقط إذا تغير وقت تعديل الملف)"""
+        try:
+            mtime = os.stat(self.lesson_index_path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime != self._lesson_index_mtime:
+            self._lesson_index = LessonIndex.load(self.lesson_index_path)
+            self._lesson_index_mtime = mtime
+        return self._lesson_index
+
+
+    def get_lesson_documents(self, unit_key: str, lesson_key: str,
+                             max_chars: int = DEFAULT_LESSON_CONTEXT_CHARS) -> List[Document]:
+        """أجزاء درس محدد بترتيب الكتاب عبر فهرس الدروس - قراءة مباشرة بالمعرفات بدون تضمين أو بحث متجهي
+
+        تُعاد قائمة فارغة إذا لم يوجد الفهرس أو لم يُعثر على الدرس (ليعود المستدعي إلى البحث العادي).
+        """
+        if not self.db:
+            return []
+        lesson_index = self._load_lesson_index()
+        chunk_ids = lesson_index.chunk_ids(unit_key, lesson_key) if lesson_index else []
+        if not chunk_ids:
+            return []
+
+        try:
+            documents: List[Document] = []
+            total_chars = 0
+            for document in self._documents_by_ids(chunk_ids):
+                if documents and total_chars + len(document.page_content) > max_chars:
+                    break
+                documents.append(document)
+                total_chars += len(document.page_content)
+            print(f"KB_MANAGER INFO: {len(documents)}/{len(chunk_ids)} جزء من فهرس الدروس ({unit_key} / {lesson_key}) في '{self.collection_name}'")
+            return documents
+        except Exception as e:
+            print(f"KB_MANAGER ERROR: فشل جلب أجزاء الدرس من '{self.collection_name}': {e}")
+            return []
+
+
     def get_retriever(self, search_type: str = "similarity", k_results: int = 3) -> Optional[Any]:
         """الحصول على أداة استرجاع الوثائق"""
         if not self.db:
@@ -410,22 +755,165 @@ class KnowledgeBaseManager:
             return None
 
 
-    def search_documents(self, query: str, k_results: int = 3) -> List[Document]:
-        """البحث المباشر في الوثائق"""
+    def _manifest_signature(self) -> Optional[int]:
+        """بصمة سريعة لسجل البناء (وقت التعديل) - تتغير مع كل بناء ناجح"""
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return None
+
+
+    def _invalidate_stale_results(self, signature: Optional[int]) -> None:
+        """إبطال نتائج البحث المخزنة لهذه المجموعة إذا تغير سجل البناء"""
+        if getattr(self, "_last_manifest_signature", signature) != signature:
+            removed = search_results_cache.invalidate(lambda key: key[0] == self.collection_name)
+            print(f"KB_MANAGER INFO: تغير سجل البناء لـ '{self.collection_name}'. تم إبطال {removed} نتيجة مخزنة.")
+        self._last_manifest_signature = signature
+
+
+    def embed_query(self, query: str) -> List[float]:
+        """تضمين الاستعلام مع ذاكرة مؤقتة (TTL + LRU) تتجاوز استدعاء الـ API للأسئلة المتكررة"""
+        key = (self.current_model, normalize_query(query))
+        embedding = query_embedding_cache.get(key)
+        if embedding is None:
+            # ذاكرة الإجابات والبحث قد يضمّنان السؤال نفسه في الوقت نفسه: استدعاء API واحد لهما
+            embedding, _ = embedding_flights.do(key, lambda: self._embed_and_cache(key))
+        return embedding
+
+
+    def _embed_and_cache(self, key: Tuple[str, str]) -> List[float]:
+        try:
+            embedding = self.embedding_function.embed_query(key[1])
+        except Exception as e_embed:
+            # النموذج المحفوظ قد لا يعمل بعد الآن: المدير التالي سيعيد فحص النماذج
+            self.embedding_provider.report_failure(e_embed, self.current_model)
+            raise
+        query_embedding_cache.set(key, embedding)
+        return embedding
+
+
+    def search_documents(self, query: str, k_results: int = 3, where: Optional[Dict[str, Any]] = None) -> List[Document]:
+        """البحث المباشر في الوثائق (مع تخزين مؤقت للتضمين والنتائج)
+
+        where: فلتر ChromaDB على البيانات الوصفية (مثل unit / lesson) يحصر البحث في جزء من المنهج.
+        """
         if not self.db:
             print(f"KB_MANAGER ERROR: ChromaDB غير مهيأة لـ '{self.collection_name}'.")
             return []
        
         try:
-            results = self.db.similarity_search(query, k=k_results)
-            print(f"KB_MANAGER INFO: تم العثور على {len(results)} نتيجة للاستعلام: '{query}' باستخدام نموذج '{self.current_model}'")
-            return results
+            signature = self._manifest_signature()
+            self._invalidate_stale_results(signature)
+            where_key = json.dumps(where, sort_keys=True, ensure_ascii=False) if where else None
+            results_key = (self.collection_name, signature, normalize_query(query), k_results, where_key)
+            cached_results = search_results_cache.get(results_key)
+            if cached_results is not None:
+                print(f"KB_MANAGER INFO: نتيجة مخزنة مؤقتاً للاستعلام: '{query}' في '{self.collection_name}'")
+                return list(cached_results)
+
+            # بحثان متطابقان في الوقت نفسه (قبل تخزين النتيجة) يشتركان في تضمين وبحث واحد
+            results, shared = retrieval_flights.do(results_key, lambda: self._retrieve_and_cache(results_key, query, k_results, where))
+            if shared:
+                print(f"KB_MANAGER INFO: نتيجة مشتركة مع بحث جارٍ للاستعلام: '{query}' في '{self.collection_name}'")
+            else:
+                print(f"KB_MANAGER INFO: تم العثور على {len(results)} نتيجة للاستعلام: '{query}' باستخدام نموذج '{self.current_model}'")
+            return list(results)
         except Exception as e:
             print(f"KB_MANAGER ERROR: فشل البحث لـ '{self.collection_name}': {e}")
             traceback.print_exc()
             return []
 
 
+    def _retrieve_and_cache(self, results_key: Tuple, query: str, k_results: int,
+                            where: Optional[Dict[str, Any]]) -> List[Document]:
+        results = self._retrieve(query, k_results, where)
+        search_results_cache.set(results_key, list(results))
+        return results
+
+
+    def _retrieve(self, query: str, k_results: int, where: Optional[Dict[str, Any]]) -> List[Document]:
+        """البحث الفعلي: نصي فقط عند الثقة، وإلا دمج النصي والمتجهي بالترتيب التبادلي (RRF)
+
+        البحث المقيد بفلتر (where) أو في وضع "vector" يبقى بحثاً متجهياً فقط.
+        """
+        lexical_index = self._get_lexical_index() if self.retrieval_mode == "hybrid" and not where else None
+        if lexical_index is None:
+            self.retrieval_stats["vector"] += 1
+            return self.db.similarity_search_by_vector(self.embed_query(query), k=k_results, filter=where)
+
+        fetch_k = max(k_results * 3, 10)
+        lexical_hits, confident = lexical_index.search(query, fetch_k)
+        lexical_ids = [chunk_id for chunk_id, _ in lexical_hits]
+        if confident:
+            # كل كلمات السؤال في أفضل نتيجة نصية: لا حاجة لاستدعاء التضمين
+            self.retrieval_stats["lexical_only"] += 1
+            print(f"KB_MANAGER INFO: إجابة من الفهرس النصي بدون تضمين للاستعلام: '{query}'")
+            return self._documents_by_ids(lexical_ids[:k_results])
+
+        self.retrieval_stats["hybrid"] += 1
+        vector_results = self.db._collection.query(
+            query_embeddings=[self.embed_query(query)], n_results=fetch_k, include=["distances"]
+        )
+        vector_ids = vector_results.get("ids", [[]])[0]
+        fused_ids = [chunk_id for chunk_id, _ in reciprocal_rank_fusion([vector_ids, lexical_ids])[:k_results]]
+        return self._documents_by_ids(fused_ids)
+
+
+    def warm_up(self) -> Dict[str, Any]:
+        """فتح المجموعة وتحميل فهارسها (HNSW والنصي والدروس) في الذاكرة قبل أول سؤال"""
+        started_at = time.perf_counter()
+        result = {"collection": self.collection_name, "ready": False, "vector_count": 0}
+        if not self.db:
+            return result
+        result["vector_count"] = self.db._collection.count()
+        if result["vector_count"] and self.embedding_function:
+            # ChromaDB يحمّل فهرس HNSW من القرص عند أول استعلام
+            self.db._collection.query(query_embeddings=[self.embedding_function.embed_query("تهيئة")], n_results=1)
+        self._get_lexical_index()
+        self._load_lesson_index()
+        result["ready"] = True
+        result["seconds"] = round(time.perf_counter() - started_at, 3)
+        return result
+
+
+    def close(self) -> None:
+        """تحرير المجموعة والفهارس المفتوحة؛ الاستخدام التالي يعيد فتحها تلقائياً"""
+        with self._db_lock:
+            was_open = self._db is not None
+            self._db = None
+            self._db_opened = False
+            if was_open and self.store_layout != SHARED_LAYOUT:
+                # المخزن المشترك تستخدمه مجموعات أخرى فيبقى مفتوحاً
+                close_chroma_client(self.vector_store_path)
+            if self._lexical_index is not None:
+                self._lexical_index.close()
+            self._lexical_index = None
+            self._lexical_index_opened = False
+            self._lesson_index = None
+            self._lesson_index_mtime = None
+        if was_open:
+            print(f"KB_MANAGER INFO: تم إغلاق مجموعة '{self.collection_name}' وتحرير مواردها.")
+
+
+    def get_memory_estimate(self) -> Dict[str, Any]:
+        """تقدير الذاكرة المقيمة للمجموعة المفتوحة (متجهات HNSW + الفهرس النصي) بدون فتح ما هو مغلق"""
+        estimate = {"open": self.is_open, "vector_count": 0, "dimension": None, "estimated_bytes": 0}
+        if self._db is None:
+            return estimate
+        try:
+            estimate["vector_count"] = self._db._collection.count()
+        except Exception:
+            return estimate
+        provider = getattr(self, "embedding_provider", None)
+        dimension = (provider.dimension if provider else None) or DEFAULT_EMBEDDING_DIMENSION
+        estimate["dimension"] = dimension
+        estimated_bytes = estimate["vector_count"] * (dimension * 4 + HNSW_BYTES_PER_VECTOR_OVERHEAD)
+        if self._lexical_index is not None and os.path.exists(self.lexical_index_path):
+            estimated_bytes += os.path.getsize(self.lexical_index_path)
+        estimate["estimated_bytes"] = estimated_bytes
+        return estimate
+
+
     def get_database_info(self) -> Dict:
         """الحصول على معلومات قاعدة البيانات"""
         info = {
@@ -434,11 +922,20 @@ class KnowledgeBaseManager:
             "collection_name": self.collection_name,
             "docs_path": self.docs_path,
             "vector_store_path": self.vector_store_path,
+            "store_layout": self.store_layout,
             "rag_requirements_met": RAG_REQUIREMENTS_MET,
             "embedding_ready": self.embedding_function is not None,
             "db_ready": self.db is not None,
             "current_model": self.current_model,
-            "document_count": 0
+            "document_count": 0,
+            "query_embedding_cache": query_embedding_cache.get_stats(),
+            "search_results_cache": search_results_cache.get_stats(),
+            "dedup_report": BuildManifest.load(self.manifest_path, self.collection_name).data.get("dedup_report"),
+            "lesson_index": self._lesson_index.get_stats() if self._load_lesson_index() else None,
+            "retrieval_mode": self.retrieval_mode,
+            "retrieval_stats": dict(self.retrieval_stats),
+            "embedding_provider": self.embedding_provider.get_info() if getattr(self, "embedding_provider", None) else None,
+            "memory_estimate": self.get_memory_estimate()
         }
        
         if self.db and hasattr(self.db, '_collection'):
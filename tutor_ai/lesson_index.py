@@ -0,0 +1,121 @@
+# tutor_ai/lesson_index.py
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .curriculum_chunker import section_number
+
+
+LESSON_INDEX_VERSION = 1
+LESSON_INDEX_SUFFIX = ".lessons.json"
+
+# أقصى طول لسياق الدرس المُرسل للنموذج (الأجزاء تؤخذ بترتيبها في الكتاب حتى هذا الحد)
+DEFAULT_LESSON_CONTEXT_CHARS = int(os.getenv("LESSON_CONTEXT_MAX_CHARS", "8000"))
+
+
+def lesson_index_path_for(chroma_parent_dir: str, collection_name: str) -> str:
+    """مسار فهرس الدروس المجاور لسجل البناء"""
+    return os.path.join(chroma_parent_dir, f"{collection_name}{LESSON_INDEX_SUFFIX}")
+
+
+def lesson_entry_key(unit: str, lesson: str) -> str:
+    return f"{unit}/{lesson}"
+
+
+class LessonIndex:
+    """فهرس (الوحدة، الدرس) -> معرفات الأجزاء بترتيب الكتاب لمجموعة واحدة - يُبنى مع قاعدة المعرفة"""
+
+    def __init__(self, path: str, data: Optional[Dict] = None):
+        self.path = path
+        self.data = data if data is not None else {"version": LESSON_INDEX_VERSION, "lessons": {}}
+
+    @classmethod
+    def load(cls, path: str) -> Optional["LessonIndex"]:
+        """تحميل الفهرس من القرص (None إذا لم يوجد أو كان غير صالح)"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != LESSON_INDEX_VERSION or not isinstance(data.get("lessons"), dict):
+                return None
+            return cls(path, data)
+        except Exception as e:
+            print(f"LESSON_INDEX WARNING: تعذر قراءة فهرس الدروس {path}: {e}")
+            return None
+
+    @classmethod
+    def build(cls, path: str, collection_name: str,
+              file_chunk_ids: Iterable[Tuple[str, List[str]]],
+              chunk_sections: Dict[str, Tuple[str, str]],
+              curriculum_subject: Optional[Dict] = None) -> "LessonIndex":
+        """بناء الفهرس من ترتيب الأجزاء في كل ملف ومن وسوم الوحدة/الدرس المخزنة مع كل جزء
+
+        curriculum_subject: بيانات المادة من curriculum_index.json لإضافة أسماء الوحدات والدروس
+        (الدروس الموجودة في الفهرس بلا أجزاء تبقى بقائمة فارغة لتظهر في التقرير).
+        """
+        lessons: Dict[str, Dict] = {}
+
+        for unit_key, unit_data in (curriculum_subject or {}).get("units", {}).items():
+            for lesson_key, lesson_data in unit_data.get("lessons", {}).items():
+                unit, lesson = section_number(unit_key), section_number(lesson_key)
+                if lesson:
+                    lessons.setdefault(lesson_entry_key(unit, lesson), {
+                        "unit": unit, "lesson": lesson,
+                        "unit_name": unit_data.get("name", unit_key),
+                        "lesson_name": lesson_data.get("name", lesson_key),
+                        "chunk_ids": []
+                    })
+
+        seen = set()
+        for _, chunk_ids in file_chunk_ids:
+            for chunk_id in chunk_ids:
+                unit, lesson = chunk_sections.get(chunk_id, ("", ""))
+                if not lesson or chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                entry = lessons.setdefault(lesson_entry_key(unit, lesson), {
+                    "unit": unit, "lesson": lesson, "unit_name": "", "lesson_name": "", "chunk_ids": []
+                })
+                entry["chunk_ids"].append(chunk_id)
+
+        return cls(path, {
+            "version": LESSON_INDEX_VERSION,
+            "collection": collection_name,
+            "updated_at": time.time(),
+            "lessons": lessons
+        })
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def lessons(self) -> Dict[str, Dict]:
+        return self.data["lessons"]
+
+    def chunk_ids(self, unit_key: str, lesson_key: str) -> List[str]:
+        """معرفات أجزاء الدرس بترتيب الكتاب ("الوحدة 1" / "الدرس 3" أو أرقام مباشرة)
+
+        إذا لم توجد الوحدة في الكتاب (كتب بلا عناوين وحدات) يُقبل الدرس برقمه إن كان رقمه فريداً.
+        """
+        unit = section_number(unit_key) or unit_key
+        lesson = section_number(lesson_key) or lesson_key
+        entry = self.lessons.get(lesson_entry_key(unit, lesson))
+        if entry and entry["chunk_ids"]:
+            return list(entry["chunk_ids"])
+        candidates = [item for item in self.lessons.values() if item["lesson"] == lesson and item["chunk_ids"]]
+        return list(candidates[0]["chunk_ids"]) if len(candidates) == 1 else []
+
+    def get_stats(self) -> Dict[str, int]:
+        with_content = sum(1 for entry in self.lessons.values() if entry["chunk_ids"])
+        return {
+            "lessons": len(self.lessons),
+            "lessons_with_chunks": with_content,
+            "lessons_without_chunks": len(self.lessons) - with_content,
+            "chunks": sum(len(entry["chunk_ids"]) for entry in self.lessons.values())
+        }
@@ -0,0 +1,156 @@
+# tutor_ai/lexical_index.py
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .arabic_normalizer import normalize_arabic
+
+
+LEXICAL_INDEX_SUFFIX = ".lexical.sqlite3"
+
+# ثابت دمج الترتيب التبادلي (Reciprocal Rank Fusion)
+RRF_K = 60
+
+# شروط الاكتفاء بالنتائج النصية (بدون تضمين): كل كلمات السؤال في أفضل جزء، وعدد كلمات ودرجة BM25 كافيان
+LEXICAL_MIN_QUERY_TERMS = int(os.getenv("LEXICAL_MIN_QUERY_TERMS", "2"))
+LEXICAL_CONFIDENT_SCORE = float(os.getenv("LEXICAL_CONFIDENT_SCORE", "3.0"))
+
+_TOKEN_RE = re.compile(r"\w+")
+# أدوات التعريف والعطف الملتصقة ("الباء" و "بالباء" -> "باء")
+_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+# كلمات السؤال الشائعة (بالصيغة المطبّعة) لا تفيد في المطابقة النصية
+STOP_WORDS = {
+    "في", "من", "الي", "علي", "عن", "مع", "ما", "ماذا", "هو", "هي", "هذا", "هذه", "ذلك", "تلك", "ان", "او",
+    "ثم", "كيف", "لماذا", "متي", "اين", "هل", "كم", "اشرح", "علمني", "اريد", "لي", "عرف", "وضح", "يا",
+    "the", "a", "an", "is", "are", "what", "how", "of", "to", "in", "me", "explain", "teach",
+}
+
+
+def lexical_index_path_for(chroma_parent_dir: str, collection_name: str) -> str:
+    """مسار الفهرس النصي المجاور لمجلد المجموعة"""
+    return os.path.join(chroma_parent_dir, f"{collection_name}{LEXICAL_INDEX_SUFFIX}")
+
+
+def _strip_prefix(token: str) -> str:
+    for prefix in _PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            return token[len(prefix):]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """كلمات النص بعد التطبيع العربي وحذف أدوات التعريف - نفس الدالة للفهرسة وللاستعلام"""
+    return [_strip_prefix(token) for token in _TOKEN_RE.findall(normalize_arabic(text).lower())]
+
+
+def query_terms(query: str) -> List[str]:
+    """كلمات الاستعلام المميزة (بدون الكلمات الشائعة وبدون تكرار)"""
+    terms = [term for term in tokenize(query) if term not in STOP_WORDS]
+    return list(dict.fromkeys(terms))
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """دمج عدة قوائم مرتبة: الدرجة = مجموع 1 / (k + الترتيب)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+class LexicalIndex:
+    """فهرس BM25 محلي لأجزاء مجموعة واحدة (SQLite FTS5 على كلمات مطبّعة)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # يرفع sqlite3.OperationalError إذا كانت مكتبة SQLite بدون FTS5
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(chunk_id UNINDEXED, tokens, tokenize='unicode61')"
+        )
+        self._conn.commit()
+
+    def ids(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT chunk_id FROM chunks")}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def upsert(self, chunk_ids: Sequence[str], texts: Sequence[str]) -> None:
+        rows = [(chunk_id, " ".join(tokenize(text))) for chunk_id, text in zip(chunk_ids, texts)]
+        with self._lock:
+            self._delete_locked(chunk_ids)
+            self._conn.executemany("INSERT INTO chunks (chunk_id, tokens) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def delete(self, chunk_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._delete_locked(list(chunk_ids))
+            self._conn.commit()
+
+    def _delete_locked(self, chunk_ids: Sequence[str]) -> None:
+        for offset in range(0, len(chunk_ids), 500):
+            batch = list(chunk_ids[offset:offset + 500])
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", batch)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+
+    def search(self, query: str, k: int = 10) -> Tuple[List[Tuple[str, float]], bool]:
+        """أفضل k جزء حسب BM25 (المعرف، الدرجة الموجبة) وهل النتيجة موثوقة بما يكفي للاكتفاء بها"""
+        terms = query_terms(query)
+        if not terms:
+            return [], False
+        match_expression = " OR ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, -bm25(chunks), tokens FROM chunks WHERE chunks MATCH ? ORDER BY bm25(chunks) LIMIT ?",
+                (match_expression, k)
+            ).fetchall()
+        hits = [(chunk_id, score) for chunk_id, score, _ in rows]
+        confident = False
+        if rows and len(terms) >= LEXICAL_MIN_QUERY_TERMS and rows[0][1] >= LEXICAL_CONFIDENT_SCORE:
+            top_tokens = set(rows[0][2].split())
+            confident = all(term in top_tokens for term in terms)
+        return hits, confident
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_lexical_index(path: str) -> Optional[LexicalIndex]:
+    """فتح الفهرس النصي أو None إذا لم تدعم SQLite المثبتة FTS5"""
+    try:
+        return LexicalIndex(path)
+    except sqlite3.OperationalError as e:
+        print(f"LEXICAL_INDEX WARNING: الفهرس النصي غير متاح ({e}). سيُستخدم البحث المتجهي فقط.")
+        return None
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = LexicalIndex(os.path.join(tmp_dir, "demo.lexical.sqlite3"))
+        documents = {
+            "c1": "حَرْفُ البَاءِ: نكتب حرف الباء في أول الكلمة هكذا بـ",
+            "c2": "سورة الفاتحة سبع آيات، وهي أم الكتاب",
+            "c3": "الجمع: 3 + 4 = 7 وهو ضم الأعداد",
+            "c4": "النباتات تحتاج إلى الماء والشمس",
+        }
+        index.upsert(list(documents), list(documents.values()))
+        for question in ["ما هو حرف الباء؟", "اشرح سورة الفاتحة", "كيف تنمو الأشجار"]:
+            print(question, index.search(question, k=3))
+        print(reciprocal_rank_fusion([["c1", "c2", "c3"], ["c3", "c1"]]))
+        index.close()
@@ -0,0 +1,106 @@
+# tutor_ai/manager_pool.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .knowledge_base_manager import KnowledgeBaseManager
+
+
+# أقصى عدد من المجموعات المفتوحة في الذاكرة في الوقت نفسه (الباقي يُغلق ويُعاد فتحه عند الطلب)
+DEFAULT_MAX_OPEN_MANAGERS = int(os.getenv("KB_POOL_MAX_OPEN", "6"))
+# لا تُغلق مجموعة استُخدمت قبل أقل من هذه المدة (ثوانٍ) حتى لا تُغلق أثناء إجابة جارية
+DEFAULT_MIN_IDLE_SECONDS = float(os.getenv("KB_POOL_MIN_IDLE_SECONDS", "60"))
+
+PoolKey = Tuple[str, str, str, str]
+
+
+def process_rss_bytes() -> Optional[int]:
+    """الذاكرة المقيمة الحالية للعملية (Linux) أو None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class KnowledgeBaseManagerPool:
+    """مديرو قواعد المعرفة لكل (مشروع، منطقة، صف، مادة) مع حد LRU للمجموعات المفتوحة
+
+    كائن المدير يبقى (خفيف: إعدادات ومسارات)، أما المجموعة المفتوحة وفهارسها فتُغلق عند تجاوز الحد
+    وتُفتح من جديد تلقائياً عند أول استخدام لاحق (KnowledgeBaseManager.db كسول).
+    """
+
+    def __init__(self, max_open: int = DEFAULT_MAX_OPEN_MANAGERS,
+                 min_idle_seconds: float = DEFAULT_MIN_IDLE_SECONDS,
+                 factory: Optional[Callable[..., KnowledgeBaseManager]] = None):
+        self.max_open = max(1, max_open)
+        self.min_idle_seconds = min_idle_seconds
+        self.factory = factory or KnowledgeBaseManager
+        self._managers: "OrderedDict[PoolKey, KnowledgeBaseManager]" = OrderedDict()
+        self._last_used: Dict[PoolKey, float] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "deferred_evictions": 0}
+
+    def get(self, project_id: str, location: str, grade_folder: str, subject_folder: str) -> KnowledgeBaseManager:
+        """المدير المطلوب (يُنشأ عند أول طلب) مع إغلاق أقدم المجموعات غير المستخدمة إذا تجاوز العدد الحد"""
+        key = (project_id, location, grade_folder, subject_folder)
+        with self._lock:
+            manager = self._managers.get(key)
+            if manager is not None:
+                self.stats["hits"] += 1
+                self._managers.move_to_end(key)
+            else:
+                self.stats["misses"] += 1
+                manager = self.factory(
+                    grade_folder_name=grade_folder,
+                    subject_folder_name=subject_folder,
+                    project_id=project_id,
+                    location=location
+                )
+                self._managers[key] = manager
+            self._last_used[key] = time.monotonic()
+            self._evict_locked(keep=key)
+        return manager
+
+    def _evict_locked(self, keep: PoolKey) -> None:
+        # المجموعة المطلوبة الآن تُحسب مفتوحة لأنها ستُفتح عند أول استخدام
+        open_keys = [key for key, manager in self._managers.items() if manager.is_open and key != keep]
+        excess = len(open_keys) + 1 - self.max_open
+        now = time.monotonic()
+        for key in open_keys:
+            if excess <= 0:
+                break
+            if now - self._last_used.get(key, 0.0) < self.min_idle_seconds:
+                self.stats["deferred_evictions"] += 1
+                continue
+            self._managers[key].close()
+            self.stats["evictions"] += 1
+            excess -= 1
+
+    def close_all(self) -> None:
+        with self._lock:
+            for manager in self._managers.values():
+                manager.close()
+
+    def get_memory_report(self) -> Dict[str, Any]:
+        """تقدير الذاكرة لكل مدير، المجموع، والذاكرة المقيمة الفعلية للعملية"""
+        now = time.monotonic()
+        with self._lock:
+            managers = []
+            for key, manager in reversed(self._managers.items()):
+                estimate = manager.get_memory_estimate()
+                managers.append({
+                    "collection": manager.collection_name,
+                    "idle_seconds": round(now - self._last_used.get(key, now), 1),
+                    **estimate
+                })
+        return {
+            "max_open": self.max_open,
+            "managers": managers,
+            "open_managers": sum(1 for item in managers if item["open"]),
+            "estimated_total_bytes": sum(item["estimated_bytes"] for item in managers),
+            "process_rss_bytes": process_rss_bytes(),
+            **self.stats
+        }
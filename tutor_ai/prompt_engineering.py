@@ -1,6 +1,19 @@
 # tutor_ai/prompt_engineering.py - مع دعم Chat History Memory
-import re
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
+
+
+# بند تعليمات: نص واحد للنمطين، أو (نص مع الرسم، نص لنمط الشرح النصي أو None لحذفه)
+SubjectBullet = Union[str, Tuple[str, Optional[str]]]
+
+
+def _subject_instructions(title: str, bullets: List[SubjectBullet], include_svg: bool) -> str:
+    """قسم تعليمات المادة: في نمط الشرح النصي تُستخدم صيغة كل بند بدون الرسم (أو يُحذف البند إذا كان عن الرسم فقط)"""
+    lines = [f"**{title}:**"]
+    for bullet in bullets:
+        text = bullet if isinstance(bullet, str) else bullet[0 if include_svg else 1]
+        if text:
+            lines.append(f"*   {text}")
+    return "\n" + "\n".join(lines) + "\n"
 
 
 class UnifiedPromptEngine:
@@ -67,10 +80,76 @@ class UnifiedPromptEngine:
             'text_color': '#2C3E50' # لون النص الرئيسي داخل SVG
         }
 
+        # إرشادات الرسم الخاصة بكل مادة (تُستخدم في برومبت الرسم المنفصل)
+        self.subject_svg_hints = {
+            'arabic': 'إذا كان السؤال عن حرف، ارسم الحرف كبيرًا وواضحًا في الوسط مع الحركات المطلوبة، ويمكن إضافة شكل بسيط يتعلق بالحرف (مثل بطة لحرف الباء).',
+            'math': 'وضح العمليات الحسابية بأشياء مألوفة (تفاح، كرات) في وسط الرسم، وارسم الأشكال الهندسية بوضوح مع تسميتها، واستخدم ألوانًا زاهية للأرقام.',
+            'science': 'ارسم أجزاء المفهوم بوضوح مع تسمية كل جزء، وارسم العمليات والدورات كمخطط تدفق بسيط بأسهم واضحة، واستخدم ألوانًا واقعية تقريبًا.',
+            'social': 'استخدم مشاهد بسيطة أو أيقونات مرتبة تمثل المفهوم في وسط الرسم.',
+            'islamic': 'اجعل الرسم محتشمًا وبسيطًا، واستخدم رموزًا إسلامية بسيطة (هلال، نجمة، مسجد بسيط)، وتجنب رسم تفاصيل دقيقة للكائنات الحية إذا لم يكن ضروريًا.',
+            'english': 'النصوص داخل الرسم بالإنجليزية (مثل الحروف A, B, C أو الكلمات cat, dog)، ويمكن إضافة صورة بسيطة لكلمة تبدأ بالحرف (Apple for A).',
+            'general': 'اجعل الرسم بسيطًا وملونًا ويعكس موضوع السؤال في وسط المساحة.'
+        }
+
+    def _get_svg_guidelines(self, grade_details: dict) -> str:
+        """قواعد رسم SVG المشتركة بين البرومبت الموحد وبرومبت الرسم المنفصل"""
+        return f"""    *   يجب أن يكون `svg_code` عبارة عن كود SVG كامل وصالح للعرض، يبدأ بـ `<svg ...>` وينتهي بـ `</svg>`.
+    *   **استخدم الأبعاد الثابتة بالضبط:** `width="700"` و `height="500"` - هذا مهم جداً للعرض الصحيح.
+    *   **تأكد من أن جميع العناصر داخل منطقة العرض:** جميع الأشكال والنصوص يجب أن تكون ضمن المساحة من (0,0) إلى (700,500).
+    *   **استخدم أحجام خطوط مناسبة:** للنصوص الرئيسية استخدم `font-size="{grade_details['svg_font_size_large']}"` وللتسميات الصغيرة `font-size="{grade_details['svg_font_size_small']}"`.
+    *   **اجعل العناصر في وسط الرسم:** ضع العناصر الرئيسية في منتصف المساحة (حوالي x=350, y=250) لضمان العرض المتوازن.
+    *   اجعل خلفية الرسم `{self.base_svg_config['background_color']}`.
+    *   يجب أن يكون الرسم جذابًا بصريًا، بسيطًا، وواضحًا، ويعكس تعقيدًا مناسبًا لـ {grade_details['svg_complexity']}. **ركز على الوضوح المباشر للمفهوم وتجنب التفاصيل المشتتة. استخدم تباينًا جيدًا للألوان.**
+    *   استخدم ألوانًا زاهية ومناسبة للأطفال من هذه القائمة إذا أمكن: {', '.join(self.base_svg_config['primary_colors'])}. لون النص الرئيسي داخل SVG يجب أن يكون `{self.base_svg_config['text_color']}`.
+    *   إذا كان هناك نص داخل الرسم (مثل الحروف، الأرقام، أو التسميات)، يجب أن يكون واضحًا ومقروءًا باللغة العربية. **استخدم خطًا يدعم العربية مثل 'Arial' أو 'Tahoma' وتأكد أن النص داخل حدود الرسم ولا يقطعه شيء.**
+    *   **مهم جداً:** تأكد من أن كل عنصر رسم له سمات `fill` و `stroke` واضحة. تجنب الأشكال المتقاطعة بشكل غير مفهوم.
+    *   **الهدف التعليمي للرسم:** يجب أن يخدم الرسم الغرض التعليمي بوضوح ويساعد الطفل على فهم المفهوم بشكل أفضل. فكر في الرسم كأداة تعليمية بصرية مباشرة."""
+
+    def get_svg_prompt(self, question: str, app_subject_key: str, grade_key: str,
+                       retrieved_context_str: Optional[str] = None,
+                       conversation_context: Optional[str] = None) -> str:
+        """
+        برومبت مستقل لإنتاج الرسم التوضيحي فقط (مسار الرسم المنفصل عن الشرح).
+        يُطلب من النموذج كود SVG خام بدون JSON وبدون شرح نصي.
+        """
+        grade_details = self.grade_info.get(grade_key, self.grade_info['grade_1'])
+        subject_hint = self.subject_svg_hints.get(app_subject_key, self.subject_svg_hints['general'])
+
+        context_injection = ""
+        if retrieved_context_str and retrieved_context_str.strip():
+            # يكفي جزء من السياق لتوجيه محتوى الرسم
+            context_injection = f"""
+---
+[مقتطف من المنهج الدراسي لتوجيه محتوى الرسم]
+{retrieved_context_str.strip()[:1500]}
+---
+"""
+
+        conversation_injection = ""
+        if conversation_context and conversation_context.strip():
+            conversation_injection = f"""
+---
+{conversation_context}
+---
+"""
+
+        return f"""أنت رسام تعليمي خبير في رسومات SVG للأطفال في {grade_details['name']} (أعمارهم {grade_details['age_range']}).
+مهمتك إنتاج رسم SVG تعليمي واحد يوضح سؤال الطفل بصريًا. لا تكتب أي شرح نصي.
+
+**تعليمات الرسم:**
+{self._get_svg_guidelines(grade_details)}
+    *   {subject_hint}
+{conversation_injection}
+{context_injection}
+**سؤال الطفل:** "{question}"
+
+أعد كود SVG فقط، يبدأ بـ `<svg` وينتهي بـ `</svg>`، بدون JSON وبدون أي نص قبله أو بعده."""
+
 
     def get_specialized_prompt(self, question: str, app_subject_key: str, grade_key: str, 
                              retrieved_context_str: Optional[str] = None, 
-                             conversation_context: Optional[str] = None) -> str:
+                             conversation_context: Optional[str] = None,
+                             include_svg: bool = True) -> str:
         """
         الدالة الرئيسية لإنشاء برومبت مخصص مع دعم تاريخ المحادثة.
         Args:
@@ -79,6 +158,8 @@ class UnifiedPromptEngine:
             grade_key (str): مفتاح الصف (e.g., 'grade_1', 'grade_2').
             retrieved_context_str (Optional[str]): السياق النصي المسترجع من قاعدة المعرفة.
             conversation_context (Optional[str]): سياق المحادثة السابقة.
+            include_svg (bool): False لنمط الشرح النصي فقط: لا يُطلب SVG وتُستخدم صيغ تعليمات المادة بدون الرسم
+                (الرسم، إن لزم، يُطلب بشكل منفصل عبر get_svg_prompt).
         """
         grade_details = self.grade_info.get(grade_key, self.grade_info['grade_1']) # افتراضي للصف الأول إذا لم يوجد
        
@@ -106,26 +187,24 @@ class UnifiedPromptEngine:
 ---
 """
         
+        if include_svg:
+            json_instruction = """1.  **الرد بصيغة JSON فقط:** يجب أن يكون ردك بالكامل عبارة عن كائن JSON صالح يحتوي على مفتاحين بالضبط: `text_explanation` و `svg_code`. لا تضف أي نص قبل أو بعد كائن JSON.
+    مثال للبنية المطلوبة: `{"text_explanation": "شرح مبسط هنا...", "svg_code": "<svg width='700' height='500'>...</svg>"}`"""
+            svg_instruction = "4.  **الرسوم التوضيحية (SVG) - تعليمات محسنة لضمان العرض المناسب:**\n" + self._get_svg_guidelines(grade_details)
+        else:
+            json_instruction = """1.  **الرد بصيغة JSON فقط:** يجب أن يكون ردك بالكامل عبارة عن كائن JSON صالح يحتوي على مفتاح واحد بالضبط: `text_explanation`. لا تضف أي نص قبل أو بعد كائن JSON.
+    مثال للبنية المطلوبة: `{"text_explanation": "شرح مبسط هنا..."}`"""
+            svg_instruction = "4.  **شرح نصي فقط:** لا تكتب أي كود SVG ولا تصف رسماً؛ الرسم التوضيحي (إن لزم) يُنشأ بشكل منفصل."
+        deliverables = "شروحات ورسومات SVG تعليمية" if include_svg else "شروحات تعليمية"
+
         common_instructions = f"""
-أنت "المعلم الذكي"، معلم خبير ومحب للأطفال، متحمس، مشجع، وصابر. مهمتك هي الإجابة على أسئلة الأطفال وتقديم شروحات ورسومات SVG تعليمية بسيطة وجذابة. ابدأ ردك بتحية ودودة للطفل (مثل "مرحباً يا بطل!" أو "أهلاً يا صغيري!") واختتم بتشجيع أو سؤال مفتوح يحفزه على التفكير.
+أنت "المعلم الذكي"، معلم خبير ومحب للأطفال، متحمس، مشجع، وصابر. مهمتك هي الإجابة على أسئلة الأطفال وتقديم {deliverables} بسيطة وجذابة. ابدأ ردك بتحية ودودة للطفل (مثل "مرحباً يا بطل!" أو "أهلاً يا صغيري!") واختتم بتشجيع أو سؤال مفتوح يحفزه على التفكير.
 
 **تعليمات عامة صارمة يجب اتباعها دائمًا:**
-1.  **الرد بصيغة JSON فقط:** يجب أن يكون ردك بالكامل عبارة عن كائن JSON صالح يحتوي على مفتاحين بالضبط: `text_explanation` و `svg_code`. لا تضف أي نص قبل أو بعد كائن JSON.
-    مثال للبنية المطلوبة: `{{"text_explanation": "شرح مبسط هنا...", "svg_code": "<svg width='700' height='500'>...</svg>"}}`
+{json_instruction}
 2.  **اللغة العربية الفصحى المبسطة:** استخدم لغة عربية فصحى واضحة وبسيطة جدًا، مناسبة تمامًا لعمر الطفل. تجنب تمامًا أي لهجات عامية أو كلمات معقدة. **اربط المفاهيم بأمثلة من الحياة اليومية للطفل أو أشياء مألوفة لديه، واشرح المصطلحات الجديدة بوضوح.**
 3.  **أسلوب الشرح:** يجب أن يكون الشرح {grade_details['style_desc']}. يجب أن يكون طول الشرح حوالي {grade_details['explanation_length']}. **تجنب التعميمات والشرح المبهم، واشرح المفهوم خطوة بخطوة بطريقة منطقية.**
-4.  **الرسوم التوضيحية (SVG) - تعليمات محسنة لضمان العرض المناسب:**
-    *   يجب أن يكون `svg_code` عبارة عن كود SVG كامل وصالح للعرض، يبدأ بـ `<svg ...>` وينتهي بـ `</svg>`.
-    *   **استخدم الأبعاد الثابتة بالضبط:** `width="700"` و `height="500"` - هذا مهم جداً للعرض الصحيح.
-    *   **تأكد من أن جميع العناصر داخل منطقة العرض:** جميع الأشكال والنصوص يجب أن تكون ضمن المساحة من (0,0) إلى (700,500).
-    *   **استخدم أحجام خطوط مناسبة:** للنصوص الرئيسية استخدم `font-size="{grade_details['svg_font_size_large']}"` وللتسميات الصغيرة `font-size="{grade_details['svg_font_size_small']}"`.
-    *   **اجعل العناصر في وسط الرسم:** ضع العناصر الرئيسية في منتصف المساحة (حوالي x=350, y=250) لضمان العرض المتوازن.
-    *   اجعل خلفية الرسم `{self.base_svg_config['background_color']}`.
-    *   يجب أن يكون الرسم جذابًا بصريًا، بسيطًا، وواضحًا، ويعكس تعقيدًا مناسبًا لـ {grade_details['svg_complexity']}. **ركز على الوضوح المباشر للمفهوم وتجنب التفاصيل المشتتة. استخدم تباينًا جيدًا للألوان.**
-    *   استخدم ألوانًا زاهية ومناسبة للأطفال من هذه القائمة إذا أمكن: {', '.join(self.base_svg_config['primary_colors'])}. لون النص الرئيسي داخل SVG يجب أن يكون `{self.base_svg_config['text_color']}`.
-    *   إذا كان هناك نص داخل الرسم (مثل الحروف، الأرقام، أو التسميات)، يجب أن يكون واضحًا ومقروءًا باللغة العربية. **استخدم خطًا يدعم العربية مثل 'Arial' أو 'Tahoma' وتأكد أن النص داخل حدود الرسم ولا يقطعه شيء.**
-    *   **مهم جداً:** تأكد من أن كل عنصر رسم له سمات `fill` و `stroke` واضحة. تجنب الأشكال المتقاطعة بشكل غير مفهوم.
-    *   **الهدف التعليمي للرسم:** يجب أن يخدم الرسم الغرض التعليمي بوضوح ويساعد الطفل على فهم المفهوم بشكل أفضل. فكر في الرسم كأداة تعليمية بصرية مباشرة.
+{svg_instruction}
 5.  **فهم السياق والمراجع:** إذا كان السؤال يحتوي على ضمائر (مثل "ه"، "هذا"، "الموضوع السابق") أو مراجع للمحادثات السابقة، استخدم سياق المحادثة المتوفر لفهم المقصود والإجابة بناءً عليه.
 6.  **التركيز على السؤال:** أجب على سؤال الطفل المحدد. لا تخرج عن الموضوع.
 
@@ -134,137 +213,155 @@ class UnifiedPromptEngine:
         # اختيار البرومبت المتخصص بناءً على المادة
         # هنا نمرر `common_instructions` و `context_injection` و `conversation_injection` إلى كل دالة متخصصة
         if app_subject_key == 'arabic':
-            return self._get_arabic_prompt(common_instructions, context_injection, conversation_injection, grade_details)
+            prompt = self._get_arabic_prompt(common_instructions, context_injection, conversation_injection, grade_details, include_svg)
         elif app_subject_key == 'math':
-            return self._get_math_prompt(common_instructions, context_injection, conversation_injection, grade_details)
+            prompt = self._get_math_prompt(common_instructions, context_injection, conversation_injection, grade_details, include_svg)
         elif app_subject_key == 'science':
-            return self._get_science_prompt(common_instructions, context_injection, conversation_injection, grade_details)
+            prompt = self._get_science_prompt(common_instructions, context_injection, conversation_injection, grade_details, include_svg)
         elif app_subject_key == 'social': # الاجتماعيات أو المهارات الأسرية
-            return self._get_social_prompt(common_instructions, context_injection, conversation_injection, grade_details)
+            prompt = self._get_social_prompt(common_instructions, context_injection, conversation_injection, grade_details, include_svg)
         elif app_subject_key == 'islamic':
-            return self._get_islamic_prompt(common_instructions, context_injection, conversation_injection, grade_details)
+            prompt = self._get_islamic_prompt(common_instructions, context_injection, conversation_injection, grade_details, include_svg)
         elif app_subject_key == 'english':
-            return self._get_english_prompt(common_instructions, context_injection, conversation_injection, grade_details, question) # الإنجليزية قد تحتاج السؤال الأصلي لأسلوب مختلف
+            prompt = self._get_english_prompt(common_instructions, context_injection, conversation_injection, grade_details, question, include_svg) # الإنجليزية قد تحتاج السؤال الأصلي لأسلوب مختلف
         else:
             # برومبت عام إذا لم تتطابق المادة (أو يمكنك إرجاع خطأ/رسالة)
             print(f"WARN: UnifiedPromptEngine - No specialized prompt for subject key '{app_subject_key}'. Using general prompt.")
-            return self._get_general_prompt(common_instructions, context_injection, conversation_injection, grade_details)
+            prompt = self._get_general_prompt(common_instructions, context_injection, conversation_injection, grade_details, include_svg)
+
+        return prompt
 
 
     # --- دوال البرومبت المتخصصة ---
     # كل دالة الآن تستقبل common_instructions, context_injection, conversation_injection, grade_details
 
     def _get_arabic_prompt(self, common_instructions: str, context_injection: str, 
-                          conversation_injection: str, grade_details: dict) -> str:
-        subject_specific_instructions = f"""
-**تعليمات خاصة بمادة اللغة العربية ({grade_details['name']}):**
-*   ركز على الحروف، الكلمات، الحركات (الفتحة، الضمة، الكسرة)، المدود، التنوين، إلخ، حسب السؤال.
-*   إذا كان السؤال عن حرف، ارسم الحرف كبيرًا وواضحًا في وسط الرسم مع أي حركات مطلوبة. يمكنك إضافة شكل بسيط يتعلق بالحرف (مثل بطة لحرف الباء).
-*   استخدم أسلوبًا تفاعليًا، كأن تسأل الطفل "هل أنت مستعد لنتعلم حرف الألف يا بطل؟".
-*   تأكد من أن الحروف والكلمات تظهر بوضوح في وسط منطقة الرسم.
-*   إذا كان السؤال يشير إلى موضوع سابق في اللغة العربية، اربطه بذلك الموضوع وقدم شرحاً أو رسماً مكملاً.
-"""
+                          conversation_injection: str, grade_details: dict, include_svg: bool = True) -> str:
+        subject_specific_instructions = _subject_instructions(f"تعليمات خاصة بمادة اللغة العربية ({grade_details['name']})", [
+            "ركز على الحروف، الكلمات، الحركات (الفتحة، الضمة، الكسرة)، المدود، التنوين، إلخ، حسب السؤال.",
+            ("إذا كان السؤال عن حرف، ارسم الحرف كبيرًا وواضحًا في وسط الرسم مع أي حركات مطلوبة. يمكنك إضافة شكل بسيط يتعلق بالحرف (مثل بطة لحرف الباء).",
+             "إذا كان السؤال عن حرف، اذكر الحرف بوضوح مع أي حركات مطلوبة ومثالاً لكلمة تبدأ به (مثل بطة لحرف الباء)."),
+            "استخدم أسلوبًا تفاعليًا، كأن تسأل الطفل \"هل أنت مستعد لنتعلم حرف الألف يا بطل؟\".",
+            ("تأكد من أن الحروف والكلمات تظهر بوضوح في وسط منطقة الرسم.", None),
+            ("إذا كان السؤال يشير إلى موضوع سابق في اللغة العربية، اربطه بذلك الموضوع وقدم شرحاً أو رسماً مكملاً.",
+             "إذا كان السؤال يشير إلى موضوع سابق في اللغة العربية، اربطه بذلك الموضوع وقدم شرحاً مكملاً."),
+        ], include_svg)
         return f"{common_instructions}\n{subject_specific_instructions}\n{conversation_injection}\n{context_injection}\nتذكر، الرد يجب أن يكون JSON فقط بالبنية المحددة."
 
     def _get_math_prompt(self, common_instructions: str, context_injection: str, 
-                        conversation_injection: str, grade_details: dict) -> str:
-        subject_specific_instructions = f"""
-**تعليمات خاصة بمادة الرياضيات ({grade_details['name']}):**
-*   ركز على الأرقام، العد، الجمع، الطرح، الأشكال الهندسية البسيطة، إلخ، حسب السؤال.
-*   إذا كان السؤال عن عملية حسابية (مثل 1+1)، وضحها بالرسم باستخدام أشياء مألوفة (تفاح، كرات) في وسط الرسم.
-*   إذا كان عن الأشكال، ارسم الشكل المطلوب بوضوح في المنتصف مع تسميته إذا أمكن.
-*   اجعل الأرقام والأشكال تبدو مرحة وتظهر بوضوح في منطقة العرض.
-*   استخدم ألوان زاهية للعناصر الرياضية لجعلها جذابة.
-*   إذا كان السؤال يشير إلى عملية رياضية أو مفهوم تم شرحه سابقاً، اربطه بذلك المفهوم وقدم توضيحاً بصرياً مكملاً.
-"""
+                        conversation_injection: str, grade_details: dict, include_svg: bool = True) -> str:
+        subject_specific_instructions = _subject_instructions(f"تعليمات خاصة بمادة الرياضيات ({grade_details['name']})", [
+            "ركز على الأرقام، العد، الجمع، الطرح، الأشكال الهندسية البسيطة، إلخ، حسب السؤال.",
+            ("إذا كان السؤال عن عملية حسابية (مثل 1+1)، وضحها بالرسم باستخدام أشياء مألوفة (تفاح، كرات) في وسط الرسم.",
+             "إذا كان السؤال عن عملية حسابية (مثل 1+1)، وضحها بمثال من أشياء مألوفة (تفاح، كرات)."),
+            ("إذا كان عن الأشكال، ارسم الشكل المطلوب بوضوح في المنتصف مع تسميته إذا أمكن.",
+             "إذا كان عن الأشكال، صف الشكل المطلوب (أضلاعه وزواياه) مع تسميته ومثال له من حياة الطفل."),
+            ("اجعل الأرقام والأشكال تبدو مرحة وتظهر بوضوح في منطقة العرض.", None),
+            ("استخدم ألوان زاهية للعناصر الرياضية لجعلها جذابة.", None),
+            ("إذا كان السؤال يشير إلى عملية رياضية أو مفهوم تم شرحه سابقاً، اربطه بذلك المفهوم وقدم توضيحاً بصرياً مكملاً.",
+             "إذا كان السؤال يشير إلى عملية رياضية أو مفهوم تم شرحه سابقاً، اربطه بذلك المفهوم وقدم توضيحاً مكملاً."),
+        ], include_svg)
         return f"{common_instructions}\n{subject_specific_instructions}\n{conversation_injection}\n{context_injection}\nتذكر، الرد يجب أن يكون JSON فقط بالبنية المحددة."
 
     def _get_science_prompt(self, common_instructions: str, context_injection: str, 
-                           conversation_injection: str, grade_details: dict) -> str:
-        subject_specific_instructions = f"""
-**تعليمات خاصة بمادة العلوم ({grade_details['name']}):**
-*   ركز على مفاهيم العلوم البسيطة مثل أجزاء النبات، الحيوانات وأنواعها، حالات الماء، الحواس الخمس، دورة حياة الكائنات، أو تركيبات بسيطة.
-*   استخدم رسومات توضيحية بسيطة وجذابة، و**دقيقة علمياً قدر الإمكان بما يتناسب مع مستوى الصف**.
-*   **إذا كان المفهوم يتضمن أجزاء، ارسم كل جزء بوضوح في وسط الرسم مع تسميته.** (مثلاً، لنبتة: الجذور، الساق، الأوراق، الزهرة).
-*   **إذا كان المفهوم يتضمن عملية أو دورة، ارسمها كمخطط تدفق بسيط مع أسهم واضحة تشير إلى الترتيب في منتصف المساحة.**
-*   اجعل الرسم نظيفًا، سهل القراءة، ومفيدًا بصريًا. استخدم ألوانًا واقعية تقريبًا للمكونات العلمية (مثل الأخضر للنبات، الأزرق للماء).
-*   شجع الفضول العلمي بأسلوب "هل تعلم أن...؟" أو "انظر كيف...".
-*   إذا كان السؤال يشير إلى مفهوم علمي تم شرحه سابقاً، اربطه بذلك المفهوم وقدم رسماً توضيحياً أكثر تفصيلاً أو من زاوية مختلفة.
-"""
+                           conversation_injection: str, grade_details: dict, include_svg: bool = True) -> str:
+        subject_specific_instructions = _subject_instructions(f"تعليمات خاصة بمادة العلوم ({grade_details['name']})", [
+            "ركز على مفاهيم العلوم البسيطة مثل أجزاء النبات، الحيوانات وأنواعها، حالات الماء، الحواس الخمس، دورة حياة الكائنات، أو تركيبات بسيطة.",
+            ("استخدم رسومات توضيحية بسيطة وجذابة، و**دقيقة علمياً قدر الإمكان بما يتناسب مع مستوى الصف**.",
+             "اجعل الشرح بسيطاً وجذاباً، و**دقيقاً علمياً قدر الإمكان بما يتناسب مع مستوى الصف**."),
+            ("**إذا كان المفهوم يتضمن أجزاء، ارسم كل جزء بوضوح في وسط الرسم مع تسميته.** (مثلاً، لنبتة: الجذور، الساق، الأوراق، الزهرة).",
+             "**إذا كان المفهوم يتضمن أجزاء، اذكر كل جزء باسمه ووظيفته.** (مثلاً، لنبتة: الجذور، الساق، الأوراق، الزهرة)."),
+            ("**إذا كان المفهوم يتضمن عملية أو دورة، ارسمها كمخطط تدفق بسيط مع أسهم واضحة تشير إلى الترتيب في منتصف المساحة.**",
+             "**إذا كان المفهوم يتضمن عملية أو دورة، اشرح خطواتها بالترتيب.**"),
+            ("اجعل الرسم نظيفًا، سهل القراءة، ومفيدًا بصريًا. استخدم ألوانًا واقعية تقريبًا للمكونات العلمية (مثل الأخضر للنبات، الأزرق للماء).", None),
+            "شجع الفضول العلمي بأسلوب \"هل تعلم أن...؟\" أو \"انظر كيف...\".",
+            ("إذا كان السؤال يشير إلى مفهوم علمي تم شرحه سابقاً، اربطه بذلك المفهوم وقدم رسماً توضيحياً أكثر تفصيلاً أو من زاوية مختلفة.",
+             "إذا كان السؤال يشير إلى مفهوم علمي تم شرحه سابقاً، اربطه بذلك المفهوم وقدم شرحاً أكثر تفصيلاً أو من زاوية مختلفة."),
+        ], include_svg)
         return f"{common_instructions}\n{subject_specific_instructions}\n{conversation_injection}\n{context_injection}\nتذكر، الرد يجب أن يكون JSON فقط بالبنية المحددة."
 
     def _get_social_prompt(self, common_instructions: str, context_injection: str, 
-                          conversation_injection: str, grade_details: dict) -> str:
+                          conversation_injection: str, grade_details: dict, include_svg: bool = True) -> str:
         # هذا يمكن أن يكون للاجتماعيات أو المهارات الأسرية
-        subject_specific_instructions = f"""
-**تعليمات خاصة بمادة المهارات الحياتية/الاجتماعية ({grade_details['name']}):**
-*   ركز على موضوعات مثل أفراد العائلة، أدواتي المدرسية، قواعد النظافة، المهن، آداب التعامل.
-*   يمكن أن تكون الرسومات عبارة عن مشاهد بسيطة أو أيقونات تمثل المفهوم في وسط الرسم.
-*   استخدم أسلوبًا يشجع على السلوكيات الجيدة والقيم.
-*   تأكد من أن العناصر الاجتماعية تظهر بوضوح ومرتبة في منطقة العرض.
-*   إذا كان السؤال يشير إلى موضوع اجتماعي أو مهارة حياتية تم مناقشتها سابقاً، اربطه بذلك الموضوع وقدم أمثلة إضافية أو رسماً مكملاً.
-"""
+        subject_specific_instructions = _subject_instructions(f"تعليمات خاصة بمادة المهارات الحياتية/الاجتماعية ({grade_details['name']})", [
+            "ركز على موضوعات مثل أفراد العائلة، أدواتي المدرسية، قواعد النظافة، المهن، آداب التعامل.",
+            ("يمكن أن تكون الرسومات عبارة عن مشاهد بسيطة أو أيقونات تمثل المفهوم في وسط الرسم.", None),
+            "استخدم أسلوبًا يشجع على السلوكيات الجيدة والقيم.",
+            ("تأكد من أن العناصر الاجتماعية تظهر بوضوح ومرتبة في منطقة العرض.", None),
+            ("إذا كان السؤال يشير إلى موضوع اجتماعي أو مهارة حياتية تم مناقشتها سابقاً، اربطه بذلك الموضوع وقدم أمثلة إضافية أو رسماً مكملاً.",
+             "إذا كان السؤال يشير إلى موضوع اجتماعي أو مهارة حياتية تم مناقشتها سابقاً، اربطه بذلك الموضوع وقدم أمثلة إضافية."),
+        ], include_svg)
         return f"{common_instructions}\n{subject_specific_instructions}\n{conversation_injection}\n{context_injection}\nتذكر، الرد يجب أن يكون JSON فقط بالبنية المحددة."
 
     def _get_islamic_prompt(self, common_instructions: str, context_injection: str, 
-                           conversation_injection: str, grade_details: dict) -> str:
-        subject_specific_instructions = f"""
-**تعليمات خاصة بمادة التربية الإسلامية ({grade_details['name']}):**
-*   ركز على المفاهيم الإسلامية الأساسية المناسبة للعمر مثل أركان الإسلام، الوضوء، الصلاة (بطريقة مبسطة جدًا)، بعض الأدعية القصيرة، قصص الأنبياء المبسطة.
-*   يجب أن تكون الرسومات محتشمة وبسيطة، ويمكن استخدام رموز إسلامية بسيطة (هلال، نجمة، مسجد بسيط) في وسط الرسم. تجنب رسم صور ذات تفاصيل دقيقة للكائنات الحية إذا لم يكن ضروريًا.
-*   استخدم أسلوبًا هادئًا ولطيفًا يغرس القيم الإسلامية.
-*   تأكد من أن الرموز الإسلامية تظهر بوضوح وتوازن في منطقة العرض.
-*   إذا كان السؤال يشير إلى مفهوم إسلامي أو قيمة تم شرحها سابقاً، اربطه بذلك المفهوم وقدم رسماً أو مثالاً إضافياً يعزز الفهم.
-"""
+                           conversation_injection: str, grade_details: dict, include_svg: bool = True) -> str:
+        subject_specific_instructions = _subject_instructions(f"تعليمات خاصة بمادة التربية الإسلامية ({grade_details['name']})", [
+            "ركز على المفاهيم الإسلامية الأساسية المناسبة للعمر مثل أركان الإسلام، الوضوء، الصلاة (بطريقة مبسطة جدًا)، بعض الأدعية القصيرة، قصص الأنبياء المبسطة.",
+            ("يجب أن تكون الرسومات محتشمة وبسيطة، ويمكن استخدام رموز إسلامية بسيطة (هلال، نجمة، مسجد بسيط) في وسط الرسم. تجنب رسم صور ذات تفاصيل دقيقة للكائنات الحية إذا لم يكن ضروريًا.", None),
+            "استخدم أسلوبًا هادئًا ولطيفًا يغرس القيم الإسلامية.",
+            ("تأكد من أن الرموز الإسلامية تظهر بوضوح وتوازن في منطقة العرض.", None),
+            ("إذا كان السؤال يشير إلى مفهوم إسلامي أو قيمة تم شرحها سابقاً، اربطه بذلك المفهوم وقدم رسماً أو مثالاً إضافياً يعزز الفهم.",
+             "إذا كان السؤال يشير إلى مفهوم إسلامي أو قيمة تم شرحها سابقاً، اربطه بذلك المفهوم وقدم مثالاً إضافياً يعزز الفهم."),
+        ], include_svg)
         return f"{common_instructions}\n{subject_specific_instructions}\n{conversation_injection}\n{context_injection}\nتذكر، الرد يجب أن يكون JSON فقط بالبنية المحددة."
    
     def _get_english_prompt(self, common_instructions: str, context_injection: str, 
-                           conversation_injection: str, grade_details: dict, original_question: str) -> str:
+                           conversation_injection: str, grade_details: dict, original_question: str,
+                           include_svg: bool = True) -> str:
         # لغة الشرح هنا ستكون الإنجليزية، لكن تعليمات البرومبت تبقى بالعربية للنموذج
         # تعديل common_instructions ليعكس أن الشرح سيكون بالإنجليزية
         
+        if include_svg:
+            english_json_instruction = """1.  **الرد بصيغة JSON فقط:** `{"text_explanation": "Simple English explanation here...", "svg_code": "<svg width='700' height='500'>...</svg>"}`"""
+            english_svg_instruction = f"""4.  **الرسوم التوضيحية (SVG):** 
+    *   استخدم الأبعاد: `width="700"` و `height="500"`.
+    *   خلفية الرسم `{self.base_svg_config['background_color']}`.
+    *   الرسم جذاب بصريًا، بسيط، وواضح، {grade_details['svg_complexity']}.
+    *   ألوان زاهية: {', '.join(self.base_svg_config['primary_colors'])}. لون النص داخل SVG: `{self.base_svg_config['text_color']}`.
+    *   النص داخل الرسم بالإنجليزية (مثل الحروف A, B, C، الكلمات cat, dog)، بحجم مناسب (e.g., `{grade_details['svg_font_size_large']}`, `{grade_details['svg_font_size_small']}`).
+    *   جميع العناصر داخل حدود SVG، والعناصر الرئيسية في المنتصف (حوالي x=350, y=250)."""
+        else:
+            english_json_instruction = """1.  **الرد بصيغة JSON فقط:** `{"text_explanation": "Simple English explanation here..."}`"""
+            english_svg_instruction = "4.  **شرح نصي فقط:** لا تكتب أي كود SVG؛ الرسم يُنشأ بشكل منفصل."
+
         english_specific_common_instructions = f"""
 أنت "Smart English Tutor"، معلم لغة إنجليزية خبير ومحب للأطفال، متخصص في تدريس طلاب {grade_details['name']} (أعمارهم {grade_details['age_range']}).
-مهمتك هي الإجابة على أسئلة الأطفال باللغة الإنجليزية وتقديم شروحات ورسومات SVG تعليمية بسيطة وجذابة.
+مهمتك هي الإجابة على أسئلة الأطفال باللغة الإنجليزية وتقديم {"شروحات ورسومات SVG تعليمية" if include_svg else "شروحات تعليمية"} بسيطة وجذابة.
 
 **تعليمات عامة صارمة يجب اتباعها دائمًا (للغة الإنجليزية):**
-1.  **الرد بصيغة JSON فقط:** `{{"text_explanation": "Simple English explanation here...", "svg_code": "<svg width='700' height='500'>...</svg>"}}`
+{english_json_instruction}
 2.  **اللغة الإنجليزية البسيطة (Simple English):** استخدم لغة إنجليزية واضحة وبسيطة جدًا، مناسبة تمامًا لعمر الطفل. استخدم مفردات وجمل قصيرة.
 3.  **أسلوب الشرح (Explanation Style):** يجب أن يكون الشرح {grade_details['style_desc']} (ولكن بالإنجليزية البسيطة). يجب أن يكون طول الشرح حوالي {grade_details['explanation_length']}.
-4.  **الرسوم التوضيحية (SVG):** 
-    *   استخدم الأبعاد: `width="700"` و `height="500"`.
-    *   خلفية الرسم `{self.base_svg_config['background_color']}`.
-    *   الرسم جذاب بصريًا، بسيط، وواضح، {grade_details['svg_complexity']}.
-    *   ألوان زاهية: {', '.join(self.base_svg_config['primary_colors'])}. لون النص داخل SVG: `{self.base_svg_config['text_color']}`.
-    *   النص داخل الرسم بالإنجليزية (مثل الحروف A, B, C، الكلمات cat, dog)، بحجم مناسب (e.g., `{grade_details['svg_font_size_large']}`, `{grade_details['svg_font_size_small']}`).
-    *   جميع العناصر داخل حدود SVG، والعناصر الرئيسية في المنتصف (حوالي x=350, y=250).
+{english_svg_instruction}
 5.  **فهم السياق والمراجع:** إذا كان السؤال يحتوي على مراجع للمحادثات السابقة، استخدم سياق المحادثة المتوفر لفهم المقصود والإجابة بناءً عليه.
 6.  **التركيز على السؤال:** أجب على سؤال الطفل المحدد.
 
 **سؤال الطفل (قد يكون بالعربية أو الإنجليزية، تعامل معه بناءً على محتواه):** "{original_question}"
 """
-        subject_specific_instructions = f"""
-**تعليمات خاصة بمادة اللغة الإنجليزية ({grade_details['name']}):**
-*   إذا كان السؤال عن حرف إنجليزي (e.g., "Teach me the letter A"), اشرحه بالإنجليزية وارسم الحرف كبيرًا وواضحًا في وسط الرسم. يمكنك إضافة صورة بسيطة لكلمة تبدأ بهذا الحرف (e.g., Apple for A).
-*   إذا كان السؤال عن كلمة إنجليزية (e.g., "What is a cat?"), اشرحها بالإنجليزية وارسمها في المنتصف.
-*   إذا كان السؤال "ترجم كلمة كذا", قدم الترجمة والشرح بالإنجليزية إذا أمكن، أو حسب ما يبدو مناسبًا للسؤال.
-*   استخدم أسلوبًا تفاعليًا: "Hello little champion! Are you ready to learn about the letter A?".
-*   تأكد من أن النصوص الإنجليزية تظهر بوضوح في وسط منطقة العرض.
-*   إذا كان السؤال يشير إلى كلمة أو حرف إنجليزي تم شرحه سابقاً، اربطه بذلك المفهوم وقدم رسماً أو مثالاً إضافياً.
-"""
+        subject_specific_instructions = _subject_instructions(f"تعليمات خاصة بمادة اللغة الإنجليزية ({grade_details['name']})", [
+            ("إذا كان السؤال عن حرف إنجليزي (e.g., \"Teach me the letter A\"), اشرحه بالإنجليزية وارسم الحرف كبيرًا وواضحًا في وسط الرسم. يمكنك إضافة صورة بسيطة لكلمة تبدأ بهذا الحرف (e.g., Apple for A).",
+             "إذا كان السؤال عن حرف إنجليزي (e.g., \"Teach me the letter A\"), اشرحه بالإنجليزية مع كلمة بسيطة تبدأ بهذا الحرف (e.g., Apple for A)."),
+            ("إذا كان السؤال عن كلمة إنجليزية (e.g., \"What is a cat?\"), اشرحها بالإنجليزية وارسمها في المنتصف.",
+             "إذا كان السؤال عن كلمة إنجليزية (e.g., \"What is a cat?\"), اشرحها بالإنجليزية."),
+            "إذا كان السؤال \"ترجم كلمة كذا\", قدم الترجمة والشرح بالإنجليزية إذا أمكن، أو حسب ما يبدو مناسبًا للسؤال.",
+            "استخدم أسلوبًا تفاعليًا: \"Hello little champion! Are you ready to learn about the letter A?\".",
+            ("تأكد من أن النصوص الإنجليزية تظهر بوضوح في وسط منطقة العرض.", None),
+            ("إذا كان السؤال يشير إلى كلمة أو حرف إنجليزي تم شرحه سابقاً، اربطه بذلك المفهوم وقدم رسماً أو مثالاً إضافياً.",
+             "إذا كان السؤال يشير إلى كلمة أو حرف إنجليزي تم شرحه سابقاً، اربطه بذلك المفهوم وقدم مثالاً إضافياً."),
+        ], include_svg)
         return f"{english_specific_common_instructions}\n{subject_specific_instructions}\n{conversation_injection}\n{context_injection}\nRemember, the response MUST be JSON only with the specified structure."
 
     def _get_general_prompt(self, common_instructions: str, context_injection: str, 
-                           conversation_injection: str, grade_details: dict) -> str:
+                           conversation_injection: str, grade_details: dict, include_svg: bool = True) -> str:
         # هذا يستخدم إذا لم يتم تحديد مادة معينة أو لم يكن هناك قالب مخصص
-        general_specific_instructions = f"""
-**تعليمات إضافية للأسئلة العامة ({grade_details['name']}):**
-*   حاول فهم القصد من سؤال الطفل وقدم إجابة مفيدة ومناسبة لعمره.
-*   إذا كان السؤال يطلب رسمًا، اجعل الرسم بسيطًا وملونًا ويعكس موضوع السؤال في وسط المساحة.
-*   إذا لم يكن السؤال واضحًا، يمكنك أن تطلب من الطفل توضيحًا بسيطًا كجزء من الشرح (ولكن لا تزال تقدم إجابة مبدئية).
-*   تأكد من أن جميع العناصر المرسومة تظهر بوضوح داخل منطقة العرض.
-*   إذا كان السؤال يشير إلى موضوع تم مناقشته سابقاً، اربطه بذلك الموضوع وقدم شرحاً أو رسماً مكملاً.
-"""
+        general_specific_instructions = _subject_instructions(f"تعليمات إضافية للأسئلة العامة ({grade_details['name']})", [
+            "حاول فهم القصد من سؤال الطفل وقدم إجابة مفيدة ومناسبة لعمره.",
+            ("إذا كان السؤال يطلب رسمًا، اجعل الرسم بسيطًا وملونًا ويعكس موضوع السؤال في وسط المساحة.", None),
+            "إذا لم يكن السؤال واضحًا، يمكنك أن تطلب من الطفل توضيحًا بسيطًا كجزء من الشرح (ولكن لا تزال تقدم إجابة مبدئية).",
+            ("تأكد من أن جميع العناصر المرسومة تظهر بوضوح داخل منطقة العرض.", None),
+            ("إذا كان السؤال يشير إلى موضوع تم مناقشته سابقاً، اربطه بذلك الموضوع وقدم شرحاً أو رسماً مكملاً.",
+             "إذا كان السؤال يشير إلى موضوع تم مناقشته سابقاً، اربطه بذلك الموضوع وقدم شرحاً مكملاً."),
+        ], include_svg)
         return f"{common_instructions}\n{general_specific_instructions}\n{conversation_injection}\n{context_injection}\nتذكر، الرد يجب أن يكون JSON فقط بالبنية المحددة."
 
 
@@ -0,0 +1,73 @@
+# tutor_ai/query_cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .arabic_normalizer import normalize_arabic
+from .embedding_cache import normalize_cache_text
+
+
+def normalize_query(query: str) -> str:
+    """تطبيع الاستعلام لاستخدامه كمفتاح وللبحث (التطبيع العربي نفسه المطبق على المنهج، مسافات، حالة الأحرف)"""
+    return normalize_cache_text(normalize_arabic(query)).lower()
+
+
+class TTLLRUCache:
+    """ذاكرة مؤقتة في الذاكرة بحد أقصى للعناصر (LRU) ومدة صلاحية لكل عنصر (TTL) - آمنة للخيوط"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 900.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """حذف كل المفاتيح التي تحقق الشرط"""
+        with self._lock:
+            doomed = [key for key in self._entries if predicate(key)]
+            for key in doomed:
+                del self._entries[key]
+            self.stats["invalidations"] += len(doomed)
+            return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "size": len(self._entries), "max_entries": self.max_entries}
+
+
+# ذاكرات على مستوى العملية تتشاركها جميع جلسات Streamlit
+# تضمين الاستعلام: (النموذج، الاستعلام المطبّع) -> المتجه
+query_embedding_cache = TTLLRUCache(max_entries=4096, ttl_seconds=6 * 3600)
+# نتائج البحث: (المجموعة، الاستعلام المطبّع، k، ...) -> قائمة المستندات
+search_results_cache = TTLLRUCache(max_entries=2048, ttl_seconds=30 * 60)
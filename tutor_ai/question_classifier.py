@@ -0,0 +1,205 @@
+# tutor_ai/question_classifier.py
+import re
+from typing import Dict, List
+
+
+# --- أنماط التصنيف (تُدمج جميعها في نمط واحد مُجمّع مسبقاً) ---
+
+# الضمائر والمراجع العربية
+REFERENCE_PATTERNS = [
+    r'\bه\b', r'\bها\b', r'\bهذا\b', r'\bهذه\b', r'\bذلك\b', r'\bتلك\b',
+    r'\bالموضوع\b', r'\bالدرس\b', r'\bالشرح\b', r'\bالمثال\b',
+    r'\bنفس الشيء\b', r'\bنفس الموضوع\b', r'\bما قلته\b', r'\bما شرحته\b',
+    r'\bالسؤال السابق\b', r'\bما سألت عنه\b', r'\bاللي قلته\b'
+]
+
+# كلمات طلب التوضيح أو التفصيل
+CLARIFICATION_PATTERNS = [
+    r'اشرح.*بالرسم', r'ارسم.*لي', r'وضح.*بالرسم', r'بالصور', r'بالرسم',
+    r'مع رسم', r'رسم توضيحي', r'صورة', r'مثال بالرسم',
+    r'وضح أكثر', r'فصل أكثر', r'بالتفصيل', r'أريد تفاصيل',
+    r'explain.*with.*drawing', r'draw.*for.*me', r'show.*picture'
+]
+
+# كلمات الرفض أو التصحيح
+CORRECTION_PATTERNS = [
+    r'\bلا\b', r'\bليس\b', r'\bغير صحيح\b', r'\bخطأ\b',
+    r'لا أريد', r'لا أفهم', r'غير واضح', r'صعب',
+    r'\bno\b', r'\bnot\b', r'\bwrong\b'
+]
+
+# أنماط التحيات والأسئلة الاجتماعية
+GREETING_PATTERNS = [
+    r'السلام عليكم', r'السلام عليك', r'مرحبا', r'مرحباً', r'أهلا', r'أهلاً',
+    r'صباح الخير', r'مساء الخير', r'كيف حالك', r'كيف الحال',
+    r'hello', r'hi', r'good morning', r'good evening', r'how are you'
+]
+
+# أنماط الأسئلة التي تحتاج بحث في المنهج
+CURRICULUM_PATTERNS = [
+    r'علمني', r'اشرح.*لي', r'ما هو', r'ما هي', r'كيف.*أ(جمع|طرح|ضرب|قسم)',
+    r'ما.*معنى', r'أريد.*أتعلم', r'حرف.*ال[أ-ي]', r'رقم.*\d+', r'عملية.*',
+    r'درس.*', r'وحدة.*', r'teach me', r'explain.*', r'what is', r'how to', r'show me'
+]
+
+# أنماط الأسئلة التي تحتاج رسم بشكل صريح
+EXPLICIT_DRAWING_PATTERNS = [
+    r'ارسم.*لي', r'رسم.*', r'أريد.*رسم', r'وضح.*بالرسم', r'بالرسم',
+    r'اشرح.*بالصور', r'مع.*رسم', r'draw.*', r'show.*drawing', r'with.*picture'
+]
+
+# أنماط الأسئلة الرياضية
+MATH_PATTERNS = [
+    r'\d+\s*[+\-×÷]\s*\d+', r'جمع.*\d+', r'طرح.*\d+', r'ضرب.*\d+',
+    r'قسمة.*\d+', r'معادلة', r'حساب', r'عملية.*حسابية'
+]
+
+# مواضيع تحتاج رسم بشكل طبيعي (قرار ذكي محسن)
+HIGH_PRIORITY_VISUAL_PATTERNS = [
+    # رياضيات - أولوية عالية
+    r'جمع', r'طرح', r'ضرب', r'قسمة', r'عملية.*حسابية',
+    r'مربع', r'مثلث', r'دائرة', r'مستطيل', r'شكل', r'أشكال', r'هندسة',
+    r'كسر', r'كسور', r'نصف', r'ربع', r'ثلث',
+    r'أرقام', r'أعداد', r'عد', r'ترقيم',
+    # علوم - أولوية عالية
+    r'نبات', r'نباتات', r'شجرة', r'زهرة', r'ورقة', r'جذر', r'ساق',
+    r'حيوان', r'حيوانات', r'قطة', r'كلب', r'فيل', r'أسد', r'طائر', r'سمك',
+    r'جسم.*الإنسان', r'عين', r'أذن', r'يد', r'قدم', r'رأس',
+    r'دورة.*حياة', r'نمو', r'تكاثر',
+    # لغة عربية - حروف فقط
+    r'حرف', r'حروف', r'أبجدية',
+    r'خط', r'كتابة.*حرف'
+]
+
+MEDIUM_PRIORITY_VISUAL_PATTERNS = [
+    # علوم أخرى
+    r'طقس', r'مطر', r'شمس', r'سحاب', r'ثلج', r'رياح',
+    r'مجموعة.*شمسية', r'كواكب', r'قمر', r'نجوم',
+    r'ماء', r'هواء', r'تربة',
+    # ألوان وأشياء بصرية
+    r'لون', r'ألوان', r'أحمر', r'أزرق', r'أخضر', r'أصفر', r'أسود', r'أبيض',
+    r'كبير', r'صغير', r'طويل', r'قصير', r'سميك', r'رفيع'
+]
+
+# مواضيع لا تحتاج رسم عادة (نصوص، قواعد، تعريفات مجردة)
+TEXT_ONLY_PATTERNS = [
+    r'قاعدة', r'قانون', r'تعريف', r'معنى', r'مفهوم',
+    r'تاريخ', r'قصة', r'حكاية', r'سيرة',
+    r'دعاء', r'آية', r'حديث', r'ذكر',
+    r'إملاء', r'نحو', r'صرف', r'بلاغة',
+    r'كلمة', r'كلمات', r'جملة', r'جمل'  # إلا إذا كان حروف
+]
+
+# كلمات الأسئلة التفسيرية (مطابقة نصية حرفية)
+EXPLANATORY_WORDS = ['كيف', 'أين', 'متى', 'لماذا', 'how', 'where', 'when', 'why']
+
+QUESTION_CATEGORY_PATTERNS: Dict[str, List[str]] = {
+    'is_greeting': GREETING_PATTERNS,
+    'needs_curriculum_search': CURRICULUM_PATTERNS,
+    'explicit_drawing_requested': EXPLICIT_DRAWING_PATTERNS,
+    'is_math_question': MATH_PATTERNS,
+    'is_high_priority_visual': HIGH_PRIORITY_VISUAL_PATTERNS,
+    'is_medium_priority_visual': MEDIUM_PRIORITY_VISUAL_PATTERNS,
+    'is_text_only_topic': TEXT_ONLY_PATTERNS,
+    'has_explanatory_word': [re.escape(word) for word in EXPLANATORY_WORDS],
+    'has_references': REFERENCE_PATTERNS,
+    'is_clarification': CLARIFICATION_PATTERNS,
+    'is_correction': CORRECTION_PATTERNS,
+}
+
+_TRAILING_WILDCARD = '.*'
+
+
+def _simplify_pattern(pattern: str) -> str:
+    """"رسم.*" يطابق في re.search نفس ما يطابقه "رسم" - نحذف اللاحقة لتقليل التراجع"""
+    while pattern.endswith(_TRAILING_WILDCARD) and not pattern.endswith('\\' + _TRAILING_WILDCARD):
+        pattern = pattern[:-len(_TRAILING_WILDCARD)]
+    return pattern
+
+
+class QuestionPatternClassifier:
+    """مصنف أسئلة مُجمّع مسبقاً: جميع الفئات في نمط واحد يُجمّع مرة واحدة عند تحميل الوحدة ويمر على النص مرة واحدة
+
+    في كل موضع: نظرة أمامية تتحقق أن فئة ما تبدأ هنا، ثم نظرة أمامية اختيارية بمجموعة مسماة لكل فئة تسجل
+    كل الفئات المطابقة من هذا الموضع (حتى لو تداخلت مطابقاتها). النتيجة مطابقة لـ
+    any(re.search(p, text) for p in patterns) لكل فئة.
+    """
+
+    def __init__(self, category_patterns: Dict[str, List[str]]):
+        self.category_regexes = {
+            category: re.compile("|".join(f"(?:{_simplify_pattern(pattern)})" for pattern in patterns))
+            for category, patterns in category_patterns.items()
+        }
+        any_category = "|".join(f"(?:{regex.pattern})" for regex in self.category_regexes.values())
+        per_category = "".join(f"(?=(?P<{category}>{regex.pattern})|)"
+                               for category, regex in self.category_regexes.items())
+        self.combined_regex = re.compile(f"(?=(?:{any_category})){per_category}")
+        self._groups = [(category, self.combined_regex.groupindex[category]) for category in self.category_regexes]
+
+    def classify(self, text: str) -> Dict[str, bool]:
+        """جميع أعلام الفئات للنص في مسح واحد (يجب تمرير النص بعد lower/strip)"""
+        flags = dict.fromkeys(self.category_regexes, False)
+        remaining = len(flags)
+        for match in self.combined_regex.finditer(text):
+            for category, group in self._groups:
+                if not flags[category] and match.start(group) != -1:
+                    flags[category] = True
+                    remaining -= 1
+            if not remaining:
+                break
+        return flags
+
+    def matches(self, category: str, text: str) -> bool:
+        """فحص فئة واحدة فقط"""
+        return self.category_regexes[category].search(text) is not None
+
+
+question_classifier = QuestionPatternClassifier(QUESTION_CATEGORY_PATTERNS)
+
+
+def classify_question_patterns(question: str) -> Dict[str, bool]:
+    """أعلام جميع الفئات للسؤال (تطبيع النص مرة واحدة ثم مسح واحد له)"""
+    return question_classifier.classify(question.lower().strip())
+
+
+def matches_category(question: str, category: str) -> bool:
+    return question_classifier.matches(category, question.lower().strip())
+
+
+if __name__ == "__main__":
+    # قياس مصغّر: الطريقة القديمة (any(re.search) لكل نمط) مقابل المصنف المُجمّع
+    import timeit
+
+    def legacy_classify(question: str) -> Dict[str, bool]:
+        question_lower = question.lower().strip()
+        return {
+            category: any(re.search(pattern, question_lower) for pattern in patterns)
+            for category, patterns in QUESTION_CATEGORY_PATTERNS.items()
+        }
+
+    sample_questions = [
+        "السلام عليكم",
+        "ما هو الجمع؟",
+        "اشرح لي الدرس الثاني",
+        "ارسم لي مثلث ومربع",
+        "كم يساوي 5 + 3",
+        "علمني دعاء الاستيقاظ من النوم",
+        "لا أفهم، وضح أكثر بالرسم",
+        "What is a cat?",
+        "كيف تنمو النباتات من البذرة حتى تصبح شجرة كبيرة تعطي ثماراً؟",
+        "أريد أن أتعلم قاعدة كتابة الهمزة المتوسطة في الكلمات مع أمثلة كثيرة من القرآن والحديث",
+    ]
+
+    for question in sample_questions:
+        expected = legacy_classify(question)
+        actual = classify_question_patterns(question)
+        assert expected == actual, (question, expected, actual)
+    print(f"النتائج متطابقة لجميع الأسئلة ({len(sample_questions)})")
+
+    rounds = 2000
+    legacy_seconds = timeit.timeit(lambda: [legacy_classify(q) for q in sample_questions], number=rounds)
+    new_seconds = timeit.timeit(lambda: [classify_question_patterns(q) for q in sample_questions], number=rounds)
+    calls = rounds * len(sample_questions)
+    print(f"الطريقة القديمة: {legacy_seconds / calls * 1e6:.1f} ميكروثانية/سؤال")
+    print(f"المصنف المُجمّع: {new_seconds / calls * 1e6:.1f} ميكروثانية/سؤال")
+    print(f"التسريع: {legacy_seconds / new_seconds:.1f}x")
@@ -0,0 +1,234 @@
+# tutor_ai/response_cache.py
+import copy
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from .arabic_normalizer import normalize_arabic
+from .query_cache import normalize_query
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+DEFAULT_SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+DEFAULT_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_HOURS", "24")) * 3600
+
+_PUNCTUATION_RE = re.compile(r"[؟?!.,،؛;:\"'«»()\[\]{}ـ-]+")
+_DIGITS_RE = re.compile(r"[0-9]+")
+
+
+def normalize_question(question: str) -> str:
+    """تطبيع السؤال للمطابقة التامة (بدون علامات الترقيم والمسافات الزائدة)"""
+    return " ".join(_PUNCTUATION_RE.sub(" ", normalize_query(question)).split())
+
+
+def question_numbers(question: str) -> Tuple[str, ...]:
+    """الأرقام الواردة في السؤال - سؤالان متشابهان بأرقام مختلفة (2+3 و 2+4) ليسا نفس السؤال"""
+    return tuple(_DIGITS_RE.findall(normalize_arabic(question)))
+
+
+def _unit_vector(vector: Sequence[float]) -> Optional[List[float]]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    if norm == 0:
+        return None
+    return [value / norm for value in vector]
+
+
+class _Entry:
+    __slots__ = ("bucket", "question", "numbers", "vector", "response", "expires_at")
+
+    def __init__(self, bucket: Hashable, question: str, numbers: Tuple[str, ...],
+                 vector: Optional[List[float]], response: Dict, expires_at: float):
+        self.bucket = bucket
+        self.question = question
+        self.numbers = numbers
+        self.vector = vector
+        self.response = response
+        self.expires_at = expires_at
+
+
+class SemanticResponseCache:
+    """ذاكرة مؤقتة لإجابات المعلم الكاملة: مطابقة تامة للسؤال المطبّع ثم مطابقة دلالية بتضمين السؤال
+
+    المفاتيح مقسمة إلى حاويات (الصف، المادة، نمط الرسم، ...) ولا تتم المقارنة إلا داخل الحاوية نفسها.
+    """
+
+    def __init__(self, similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._exact: Dict[Tuple[Hashable, str], int] = {}
+        self._buckets: Dict[Hashable, set] = {}
+        # مصفوفة متجهات لكل حاوية (numpy فقط) - تُبنى عند الحاجة وتُلغى عند أي تعديل
+        self._matrices: Dict[Hashable, Tuple[List[int], Any]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "bypassed": 0,
+                      "writes": 0, "evictions": 0, "expirations": 0}
+
+    @staticmethod
+    def make_bucket(grade_key: str, subject_key: str, needs_drawing: bool, lesson_key: Optional[str] = None) -> Tuple:
+        """مفتاح الحاوية: الصف، المادة، نمط الرسم، والدرس المحدد إن وجد"""
+        return (grade_key, subject_key, "drawing" if needs_drawing else "text_only", lesson_key or "")
+
+    def _remove_locked(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        if self._exact.get((entry.bucket, entry.question)) == entry_id:
+            del self._exact[(entry.bucket, entry.question)]
+        bucket_ids = self._buckets.get(entry.bucket)
+        if bucket_ids is not None:
+            bucket_ids.discard(entry_id)
+            if not bucket_ids:
+                del self._buckets[entry.bucket]
+        self._matrices.pop(entry.bucket, None)
+
+    def _best_semantic_match_locked(self, bucket: Hashable, vector: List[float],
+                                    numbers: Tuple[str, ...]) -> Tuple[Optional[int], float]:
+        candidate_ids = [entry_id for entry_id in self._buckets.get(bucket, ())
+                         if self._entries[entry_id].vector is not None and self._entries[entry_id].numbers == numbers]
+        if not candidate_ids:
+            return None, 0.0
+
+        if NUMPY_AVAILABLE:
+            cached = self._matrices.get(bucket)
+            if cached is None:
+                all_ids = [entry_id for entry_id in self._buckets[bucket] if self._entries[entry_id].vector is not None]
+                cached = (all_ids, np.asarray([self._entries[entry_id].vector for entry_id in all_ids], dtype=np.float32))
+                self._matrices[bucket] = cached
+            all_ids, matrix = cached
+            scores = matrix @ np.asarray(vector, dtype=np.float32)
+            allowed = set(candidate_ids)
+            best_id, best_score = None, 0.0
+            for index in np.argsort(-scores):
+                if all_ids[index] in allowed:
+                    best_id, best_score = all_ids[index], float(scores[index])
+                    break
+            return best_id, best_score
+
+        best_id, best_score = None, 0.0
+        for entry_id in candidate_ids:
+            score = sum(a * b for a, b in zip(vector, self._entries[entry_id].vector))
+            if score > best_score:
+                best_id, best_score = entry_id, score
+        return best_id, best_score
+
+    def get(self, bucket: Hashable, question: str,
+            embedding: Optional[Sequence[float]] = None) -> Optional[Dict]:
+        """البحث عن إجابة مخزنة (نسخة مستقلة) أو None"""
+        normalized = normalize_question(question)
+        numbers = question_numbers(question)
+        vector = _unit_vector(embedding) if embedding else None
+        now = time.monotonic()
+        with self._lock:
+            entry_id = self._exact.get((bucket, normalized))
+            similarity = 1.0
+            if entry_id is None and vector is not None:
+                entry_id, similarity = self._best_semantic_match_locked(bucket, vector, numbers)
+                if similarity < self.similarity_threshold:
+                    entry_id = None
+
+            if entry_id is None:
+                self.stats["misses"] += 1
+                return None
+            entry = self._entries[entry_id]
+            if entry.expires_at < now:
+                self._remove_locked(entry_id)
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(entry_id)
+            self.stats["exact_hits" if entry.question == normalized else "semantic_hits"] += 1
+            response = copy.deepcopy(entry.response)
+        print(f"RESPONSE_CACHE INFO: إجابة من الذاكرة المؤقتة (التشابه {similarity:.3f}) للسؤال: {question[:50]}")
+        return response
+
+    def needs_embedding(self, bucket: Hashable, question: str) -> bool:
+        """هل ستُجري get مطابقة دلالية لهذا السؤال؟
+
+        False إذا وُجدت مطابقة تامة أو لم يكن في الحاوية سؤال مخزن بتضمين وبالأرقام نفسها،
+        وعندها لا داعي لحساب تضمين السؤال قبل get.
+        """
+        normalized = normalize_question(question)
+        numbers = question_numbers(question)
+        with self._lock:
+            if (bucket, normalized) in self._exact:
+                return False
+            return any(self._entries[candidate_id].vector is not None and self._entries[candidate_id].numbers == numbers
+                       for candidate_id in self._buckets.get(bucket, ()))
+
+    def set(self, bucket: Hashable, question: str, response: Dict,
+            embedding: Optional[Sequence[float]] = None, ttl_seconds: Optional[float] = None) -> None:
+        """تخزين إجابة كاملة (الشرح + الرسم + درجات الجودة)"""
+        normalized = normalize_question(question)
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        entry = _Entry(bucket, normalized, question_numbers(question),
+                       _unit_vector(embedding) if embedding else None,
+                       copy.deepcopy(response), time.monotonic() + ttl)
+        with self._lock:
+            previous_id = self._exact.get((bucket, normalized))
+            if previous_id is not None:
+                self._remove_locked(previous_id)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._exact[(bucket, normalized)] = entry_id
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+            self._matrices.pop(bucket, None)
+            self.stats["writes"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove_locked(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._exact.clear()
+            self._buckets.clear()
+            self._matrices.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "size": len(self._entries),
+                "buckets": len(self._buckets),
+                "max_entries": self.max_entries,
+                "similarity_threshold": self.similarity_threshold
+            }
+
+
+if __name__ == "__main__":
+    cache = SemanticResponseCache(similarity_threshold=0.9, max_entries=3)
+    bucket = SemanticResponseCache.make_bucket("grade_1", "math", needs_drawing=False)
+    answer = {"text_explanation": "الجمع هو ضم الأشياء معاً", "svg_code": None,
+              "quality_scores": {"explanation": 90}, "quality_issues": []}
+    cache.set(bucket, "ما هو الجمع؟", answer, embedding=[1.0, 0.0, 0.1])
+    assert cache.get(bucket, "ما هو الجمع") is not None
+    assert not cache.needs_embedding(bucket, "ما هو الجمع") and cache.needs_embedding(bucket, "عرف الجمع")
+    assert cache.get(bucket, "ما  هو الجمع ؟!") is not None
+    assert cache.get(bucket, "عرف الجمع", embedding=[0.98, 0.01, 0.12]) is not None
+    assert cache.get(bucket, "ما هو الطرح", embedding=[0.0, 1.0, 0.0]) is None
+    assert cache.get(SemanticResponseCache.make_bucket("grade_2", "math", False), "ما هو الجمع") is None
+    cache.set(bucket, "كم يساوي 2+3", answer, embedding=[0.0, 0.0, 1.0])
+    assert cache.get(bucket, "كم يساوي 2+4", embedding=[0.0, 0.0, 1.0]) is None
+    print(cache.get_stats())
@@ -0,0 +1,158 @@
+# tutor_ai/single_flight.py
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class Flight:
+    """طلب جارٍ واحد لمفتاح: القائد ينفذ العمل ويعلن النتيجة، والتابعون ينتظرونها"""
+
+    def __init__(self, group: "SingleFlight", key: Hashable, future: "Future[Any]", is_leader: bool):
+        self.group = group
+        self.key = key
+        self.future = future
+        self.is_leader = is_leader
+
+    def resolve(self, result: Any) -> None:
+        self.group._finish(self, result=result)
+
+    def fail(self, error: BaseException) -> None:
+        if not isinstance(error, Exception):
+            # إلغاء القائد (CancelledError) أو إيقاف سكربته لا يجب أن يظهر للتابعين كإلغاء لهم
+            error = RuntimeError(f"توقف الطلب القائد: {type(error).__name__}")
+        self.group._finish(self, error=error)
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """نتيجة القائد (يرفع استثناء القائد، أو TimeoutError بعد timeout ثانية)"""
+        return self.future.result(timeout)
+
+    async def wait_async(self) -> Any:
+        # shield: إلغاء أحد التابعين لا يلغي النتيجة المشتركة على الآخرين
+        return await asyncio.shield(asyncio.wrap_future(self.future))
+
+
+class SingleFlight:
+    """دمج الطلبات المتطابقة الجارية في الوقت نفسه: طلب واحد فعلي لكل مفتاح، والنتيجة للجميع
+
+    خلافاً للذاكرة المؤقتة لا يُحتفظ بالنتيجة بعد انتهاء الطلب: يغطي الفترة بين وصول الطلب الأول
+    وتخزين نتيجته (مثل فصل كامل يرسل السؤال نفسه خلال ثوانٍ).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "leaders": 0, "collapsed": 0, "failures": 0, "max_waiters": 0}
+        self._waiters: Dict[Hashable, int] = {}
+
+    def acquire(self, key: Hashable) -> Flight:
+        """الانضمام لطلب جارٍ بالمفتاح نفسه، أو بدء طلب جديد (is_leader=True) يجب إنهاؤه بـ resolve/fail"""
+        with self._lock:
+            self.stats["calls"] += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.stats["collapsed"] += 1
+                self._waiters[key] += 1
+                self.stats["max_waiters"] = max(self.stats["max_waiters"], self._waiters[key])
+                return Flight(self, key, flight.future, is_leader=False)
+            flight = Flight(self, key, Future(), is_leader=True)
+            self._flights[key] = flight
+            self._waiters[key] = 0
+            self.stats["leaders"] += 1
+            return flight
+
+    def _finish(self, flight: Flight, result: Any = None, error: Optional[BaseException] = None) -> None:
+        if not flight.is_leader:
+            return
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+                waiters = self._waiters.pop(flight.key, 0)
+            else:
+                waiters = 0
+            if error is not None:
+                self.stats["failures"] += 1
+        if waiters:
+            print(f"SINGLE_FLIGHT INFO: '{self.name}': نتيجة واحدة لـ {waiters + 1} طلبات متطابقة")
+        if flight.future.done():
+            return
+        if error is not None:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """تنفيذ fn مرة واحدة لكل مفتاح جارٍ وإرجاع (النتيجة، هل كانت مشتركة مع طلب آخر)"""
+        flight = self.acquire(key)
+        if not flight.is_leader:
+            return flight.wait(timeout), True
+        try:
+            result = fn()
+        except BaseException as e:
+            flight.fail(e)
+            raise
+        flight.resolve(result)
+        return result, False
+
+    async def do_async(self, key: Hashable, coro_factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """نسخة غير متزامنة من do (التابعون لا يحجبون حلقة الأحداث)"""
+        flight = self.acquire(key)
+        if not flight.is_leader:
+            return await flight.wait_async(), True
+        try:
+            result = await coro_factory()
+        except BaseException as e:
+            flight.fail(e)
+            raise
+        flight.resolve(result)
+        return result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._flights)
+        stats["collapse_ratio"] = round(stats["collapsed"] / stats["calls"], 3) if stats["calls"] else 0.0
+        return stats
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """مجموعة دمج مشتركة في العملية حسب الاسم (مثل "answers" أو "retrieval")"""
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = SingleFlight(name)
+        return group
+
+
+def get_single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    """مقاييس جميع مجموعات الدمج: عدد الطلبات المدمجة في طلب قائم (collapsed) لكل مجموعة"""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.get_stats() for group in groups}
+
+
+if __name__ == "__main__":
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    group = SingleFlight("demo")
+    calls = []
+
+    def slow_answer():
+        calls.append(1)
+        time.sleep(0.5)
+        return "اشرح الدرس الأول"
+
+    with ThreadPoolExecutor(max_workers=30) as executor:
+        results = list(executor.map(lambda _: group.do(("اشرح الدرس الاول", "grade_1", "math", True), slow_answer), range(30)))
+    print(f"30 طلباً متطابقاً -> {len(calls)} استدعاء فعلي؛ مشتركة: {sum(shared for _, shared in results)}")
+    print(group.get_stats())
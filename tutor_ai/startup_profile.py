@@ -0,0 +1,122 @@
+# tutor_ai/startup_profile.py
+"""
+قياس زمن الاستيراد عند البدء البارد (كل وحدة في عملية Python جديدة مع -X importtime):
+
+    python -m tutor_ai.startup_profile [--modules tutor_ai.manager_pool ...] [--top 15] [--budget 2.0] [--json]
+
+مع --budget يصبح الأمر اختبار ميزانية: رمز الخروج 1 إذا تجاوز استيراد أي وحدة الميزانية (ثوانٍ)
+أو إذا حمّلت وحدة مكتبة ثقيلة يُفترض أن تُستورد عند أول استخدام فقط، أو إذا فشل استيراد وحدة
+(مكتبة ناقصة مثلاً). يعمل في CI عند كل push (.github/workflows/startup-budget.yml).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+DEFAULT_TARGETS = (
+    "tutor_ai",
+    "tutor_ai.manager_pool",
+    "tutor_ai.knowledge_base_manager",
+    "tutor_ai.prompt_engineering",
+    "tutor_ai.gemini_client",
+)
+
+DEFAULT_BUDGET_SECONDS = float(os.getenv("STARTUP_IMPORT_BUDGET_SECONDS", "2.0"))
+
+# المكتبات الثقيلة التي تُستورد عند أول استخدام فقط: وجودها بعد استيراد الوحدة يعني تراجعاً
+_RAG_LIBRARIES = ("langchain", "langchain_community", "langchain_chroma", "langchain_google_vertexai", "chromadb", "vertexai")
+LAZY_REQUIREMENTS = {
+    "tutor_ai": _RAG_LIBRARIES + ("streamlit",),
+    "tutor_ai.manager_pool": _RAG_LIBRARIES,
+    "tutor_ai.knowledge_base_manager": _RAG_LIBRARIES,
+}
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """سطور -X importtime إلى (الوحدة، المستوى، الزمن الذاتي، الزمن التراكمي بالثواني)"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name_field = parts[2].rstrip()
+        depth = (len(name_field) - len(name_field.lstrip()) - 1) // 2
+        entries.append({
+            "module": name_field.strip(),
+            "depth": depth,
+            "self_seconds": int(parts[0]) / 1e6,
+            "cumulative_seconds": int(parts[1]) / 1e6
+        })
+    return entries
+
+
+def profile_import(module: str, top: int = 15) -> Dict[str, Any]:
+    """استيراد وحدة في عملية جديدة وإرجاع الزمن الإجمالي وأثقل الوحدات والمكتبات الكسولة التي حُمّلت"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=_REPO_ROOT, capture_output=True, text=True
+    )
+    entries = parse_importtime(completed.stderr)
+    imported = {entry["module"] for entry in entries}
+    forbidden = [name for name in LAZY_REQUIREMENTS.get(module, ()) if name in imported]
+    heaviest = sorted(entries, key=lambda entry: entry["cumulative_seconds"], reverse=True)[:top]
+    result = {
+        "module": module,
+        "total_seconds": round(sum(entry["cumulative_seconds"] for entry in entries if entry["depth"] == 0), 4),
+        "modules_imported": len(entries),
+        "heaviest": [(entry["module"], round(entry["cumulative_seconds"], 4)) for entry in heaviest],
+        "eager_heavy_imports": forbidden
+    }
+    if completed.returncode != 0:
+        result["error"] = (completed.stderr.strip().splitlines() or ["فشل الاستيراد"])[-1]
+    return result
+
+
+def check_budget(results: List[Dict[str, Any]], budget_seconds: float) -> List[str]:
+    """مخالفات الميزانية (قائمة فارغة = نجاح)"""
+    failures = []
+    for result in results:
+        if "error" in result:
+            failures.append(f"{result['module']}: فشل الاستيراد ({result['error']})")
+        elif result["total_seconds"] > budget_seconds:
+            failures.append(f"{result['module']}: {result['total_seconds']:.3f} ث > الميزانية {budget_seconds:.3f} ث")
+        if result["eager_heavy_imports"]:
+            failures.append(f"{result['module']}: استيراد مبكر لـ {', '.join(result['eager_heavy_imports'])}")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m tutor_ai.startup_profile", description="قياس زمن الاستيراد عند البدء البارد")
+    parser.add_argument("--modules", nargs="*", default=list(DEFAULT_TARGETS), help="الوحدات المطلوب قياسها")
+    parser.add_argument("--top", type=int, default=15, help="عدد أثقل الوحدات المعروضة لكل هدف")
+    parser.add_argument("--budget", type=float, nargs="?", const=DEFAULT_BUDGET_SECONDS,
+                        help="فشل إذا تجاوز استيراد أي وحدة هذه المدة (ثوانٍ، الافتراضي STARTUP_IMPORT_BUDGET_SECONDS)")
+    parser.add_argument("--json", action="store_true", help="طباعة النتائج بصيغة JSON")
+    args = parser.parse_args(argv)
+
+    results = [profile_import(module, args.top) for module in args.modules]
+    failures = check_budget(results, args.budget) if args.budget is not None else []
+
+    if args.json:
+        print(json.dumps({"results": results, "budget_seconds": args.budget, "failures": failures}, ensure_ascii=False, indent=1))
+    else:
+        for result in results:
+            status = f"خطأ: {result['error']}" if "error" in result else f"{result['total_seconds']:.3f} ث"
+            print(f"{result['module']}: {status} ({result['modules_imported']} وحدة)")
+            for name, seconds in result["heaviest"]:
+                print(f"    {seconds * 1000:9.1f} ms  {name}")
+            if result["eager_heavy_imports"]:
+                print(f"    ⚠️ استيراد مبكر: {', '.join(result['eager_heavy_imports'])}")
+        for failure in failures:
+            print(f"BUDGET FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# tutor_ai/warmup.py
+import copy
+import json
+import os
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .embedding_provider import get_embedding_provider
+from .knowledge_base_manager import CHROMA_DB_PARENT_DIRECTORY, EMBEDDING_CACHE_PATH, EMBEDDING_PROVIDER_STATE_PATH
+
+
+TRAFFIC_STATS_PATH = os.path.join(CHROMA_DB_PARENT_DIRECTORY, "traffic_stats.json")
+# عدد المجموعات الأكثر استخداماً التي تُفتح عند بدء العملية
+WARMUP_COLLECTIONS = int(os.getenv("WARMUP_COLLECTIONS", "3"))
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") != "0"
+# كتابة إحصاءات الاستخدام على القرص مرة كل هذه المدة على الأكثر (ثوانٍ)
+TRAFFIC_FLUSH_SECONDS = float(os.getenv("TRAFFIC_FLUSH_SECONDS", "30"))
+
+_WARMUP_TEXT = "تهيئة"
+
+
+class TrafficStats:
+    """عدد الأسئلة لكل (صف، مجلد مادة) - مشترك بين العمليات عبر ملف JSON يُدمج عند الكتابة"""
+
+    def __init__(self, path: str = TRAFFIC_STATS_PATH, flush_seconds: float = TRAFFIC_FLUSH_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._pending: Dict[str, int] = {}
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(grade_folder: str, subject_folder: str) -> str:
+        return f"{grade_folder}|{subject_folder}"
+
+    def _read(self) -> Dict[str, int]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                counts = json.load(f).get("counts", {})
+            return counts if isinstance(counts, dict) else {}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def record(self, grade_folder: str, subject_folder: str) -> None:
+        with self._lock:
+            key = self._key(grade_folder, subject_folder)
+            self._pending[key] = self._pending.get(key, 0) + 1
+            if time.monotonic() - self._flushed_at >= self.flush_seconds:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        self._flushed_at = time.monotonic()
+        if not self._pending:
+            return
+        counts = self._read()
+        for key, value in self._pending.items():
+            counts[key] = counts.get(key, 0) + value
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"counts": counts, "updated_at": time.time()}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+            self._pending.clear()
+        except OSError as e:
+            print(f"WARMUP WARNING: تعذر حفظ إحصاءات الاستخدام {self.path}: {e}")
+
+    def top(self, limit: int) -> List[Tuple[str, str]]:
+        """أكثر (صف، مجلد مادة) استخداماً، من الملف ومن العدادات غير المحفوظة"""
+        with self._lock:
+            counts = self._read()
+            for key, value in self._pending.items():
+                counts[key] = counts.get(key, 0) + value
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [tuple(key.split("|", 1)) for key, _ in ranked if "|" in key]
+
+
+class BackgroundWarmup:
+    """تسخين في خيط خلفي عند بدء العملية: عميل Gemini بالتوازي مع عميل التضمين ثم المجموعات الأكثر استخداماً
+
+    الحالة (get_status) تُنشر للواجهة: pending -> running -> ready (أو degraded إذا فشلت خطوة).
+    """
+
+    def __init__(self, project_id: str, location: str, pool: Any = None,
+                 gemini_factory: Optional[Callable[[], Any]] = None,
+                 traffic: Optional[TrafficStats] = None,
+                 collections: int = WARMUP_COLLECTIONS):
+        self.project_id = project_id
+        self.location = location
+        self.pool = pool
+        self.gemini_factory = gemini_factory
+        self.traffic = traffic
+        self.collections = collections
+        self.gemini_client: Optional[Any] = None
+        self._gemini_ready = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.status: Dict[str, Any] = {"state": "pending", "steps": {}, "started_at": None, "finished_at": None}
+
+    def start(self) -> "BackgroundWarmup":
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tutor_warmup", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        self._set(state="running", started_at=time.time())
+        # Gemini (أبطأ خطوة وأول ما يحتاجه السؤال) في خيط مستقل بالتوازي مع التضمين والمجموعات
+        gemini_thread = threading.Thread(target=self._run_step, args=("gemini", self._warm_gemini),
+                                         name="tutor_warmup_gemini", daemon=True)
+        gemini_thread.start()
+        for step_name, step in (("embeddings", self._warm_embeddings), ("collections", self._warm_collections)):
+            self._run_step(step_name, step)
+        gemini_thread.join()
+        self._gemini_ready.set()
+        all_ok = all(step["ok"] for step in self.status["steps"].values())
+        self._set(state="ready" if all_ok else "degraded", finished_at=time.time())
+        self._done.set()
+        print(f"WARMUP INFO: انتهى التسخين ({self.status['state']}): {self.status['steps']}")
+
+    def _run_step(self, step_name: str, step: Callable[[], Optional[Dict[str, Any]]]) -> None:
+        started_at = time.perf_counter()
+        try:
+            details = step()
+            self._set_step(step_name, {"ok": True, "seconds": round(time.perf_counter() - started_at, 3), **(details or {})})
+        except Exception as e:
+            print(f"WARMUP WARNING: فشلت خطوة التسخين '{step_name}': {e}")
+            traceback.print_exc()
+            self._set_step(step_name, {"ok": False, "seconds": round(time.perf_counter() - started_at, 3), "error": str(e)})
+
+    def _warm_embeddings(self) -> Dict[str, Any]:
+        provider = get_embedding_provider(self.project_id, self.location,
+                                          state_path=EMBEDDING_PROVIDER_STATE_PATH, cache_path=EMBEDDING_CACHE_PATH)
+        client = provider.get_client()
+        if client is None:
+            raise RuntimeError("لا يتوفر نموذج تضمين")
+        # استدعاء حقيقي (بدون ذاكرة التضمين) لتهيئة الاتصال والمصادقة قبل أول سؤال
+        getattr(client, "embeddings", client).embed_query(_WARMUP_TEXT)
+        return {"model": provider.model_name}
+
+    def _warm_gemini(self) -> Dict[str, Any]:
+        try:
+            if self.gemini_factory is None:
+                return {"skipped": True}
+            client = self.gemini_factory()
+            if client is None or not getattr(client, "model", None):
+                raise RuntimeError("تعذر تهيئة عميل Gemini")
+            self.gemini_client = client
+            return {"generation_ok": client.warm_up()}
+        finally:
+            self._gemini_ready.set()
+
+    def _warm_collections(self) -> Dict[str, Any]:
+        if self.pool is None or self.traffic is None:
+            return {"collections": []}
+        warmed = []
+        for grade_folder, subject_folder in self.traffic.top(self.collections):
+            manager = self.pool.get(self.project_id, self.location, grade_folder, subject_folder)
+            warmed.append(manager.warm_up())
+        return {"collections": warmed}
+
+    def _set(self, **values: Any) -> None:
+        with self._lock:
+            self.status.update(values)
+
+    def _set_step(self, step_name: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self.status["steps"][step_name] = result
+
+    def gemini_step_done(self) -> bool:
+        return self._gemini_ready.is_set()
+
+    def get_gemini_client(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """عميل Gemini المهيأ في الخلفية (ينتظر خطوة Gemini حتى timeout ثانية)"""
+        self._gemini_ready.wait(timeout)
+        return self.gemini_client
+
+    def is_ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return copy.deepcopy(self.status)
+
+
+_warmup: Optional[BackgroundWarmup] = None
+_traffic: Optional[TrafficStats] = None
+_singletons_lock = threading.Lock()
+
+
+def get_traffic_stats() -> TrafficStats:
+    """إحصاءات الاستخدام المشتركة في العملية"""
+    global _traffic
+    with _singletons_lock:
+        if _traffic is None:
+            _traffic = TrafficStats()
+        return _traffic
+
+
+def start_warmup(project_id: str, location: str, pool: Any = None,
+                 gemini_factory: Optional[Callable[[], Any]] = None) -> Optional[BackgroundWarmup]:
+    """بدء التسخين مرة واحدة لكل عملية (الاستدعاءات اللاحقة تعيد الكائن نفسه)"""
+    global _warmup
+    if not WARMUP_ENABLED:
+        return None
+    traffic = get_traffic_stats()
+    with _singletons_lock:
+        if _warmup is None:
+            _warmup = BackgroundWarmup(project_id, location, pool, gemini_factory, traffic)
+    return _warmup.start()